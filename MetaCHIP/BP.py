@@ -36,7 +36,7 @@ from Bio.Seq import Seq
 # from Bio.Alphabet import IUPAC
 from Bio.SeqRecord import SeqRecord
 from Bio.Graphics import GenomeDiagram
-from Bio.SeqFeature import FeatureLocation
+from Bio.SeqFeature import SeqFeature, FeatureLocation
 from Bio.Graphics.GenomeDiagram import CrossLink
 from reportlab.lib import colors
 from reportlab.lib.units import cm
@@ -45,6 +45,19 @@ from string import ascii_uppercase
 from scipy.stats import gaussian_kde
 from distutils.spawn import find_executable
 from MetaCHIP.MetaCHIP_config import config_dict
+from MetaCHIP.homology_search import homology_search_backend_list, get_homology_search_program_list, get_pairwise_search_cmd
+from MetaCHIP.blastn_filter import filter_blastn_hits, read_blastn_hit_num
+from MetaCHIP.batch_blastn import get_batch_seq_id, get_batch_blastn_cmds, run_batch_blastn_cmds, read_batch_blastn_pair_hits, remove_batch_blastn_files
+from MetaCHIP.gene_table import get_genome_name, get_gene_name, read_gene_table
+from MetaCHIP.gene_index import read_gene_index, index_gbk_file, get_flanking_genes
+from MetaCHIP.contig_store import read_contig_store_index, fetch_contig_region
+from MetaCHIP.hit_store import write_genome_table, build_hit_store_worker, load_hit_partition, get_identity, iter_hit_rows
+from MetaCHIP.external_sort import iter_line_groups, new_line_sorter, add_sorted_line, iter_line_sorter, remove_spill_files
+from MetaCHIP.best_match import get_candidates, remove_bidirection
+from MetaCHIP.identity_sketch import build_identity_sketch, merge_identity_sketches, get_sketch_percentile_dict
+from MetaCHIP.checkpoint import get_fingerprint, read_manifest, is_task_done, checkpoint_worker
+from MetaCHIP.run_report import new_run_report, start_stage, write_run_report
+from MetaCHIP.taxonomy_index import read_grouping_file, get_genome_to_group_dict
 
 
 def report_and_log(message_for_report, log_file, keep_quiet):
@@ -91,67 +104,90 @@ def filter_blast_results_worker(argument_list):
     cover_cutoff = argument_list[2]
     pwd_qualified_iden_file = argument_list[3]
 
-    pwd_qualified_iden_file_handle = open(pwd_qualified_iden_file, 'w')
-    for match in open(pwd_blast_results):
-        match_split = match.strip().split('\t')
-        query = match_split[0]
-        subject = match_split[1]
-        align_len = int(match_split[3])
-        query_len = int(match_split[12])
-        subject_len = int(match_split[13])
-        query_bin_name = '_'.join(query.split('_')[:-1])
-        subject_bin_name = '_'.join(subject.split('_')[:-1])
-        coverage_q = float(align_len) * 100 / float(query_len)
-        coverage_s = float(align_len) * 100 / float(subject_len)
-
-        if (align_len >= int(align_len_cutoff)) and (query_bin_name != subject_bin_name) and (coverage_q >= cover_cutoff) and (coverage_s >= cover_cutoff):
-            pwd_qualified_iden_file_handle.write(match)
-
-    pwd_qualified_iden_file_handle.close()
-
-    # remove if empty
-    if os.stat(pwd_qualified_iden_file).st_size == 0:
-        os.system('rm %s' % pwd_qualified_iden_file)
+    with open(pwd_blast_results) as blast_results_handle:
+        filter_blastn_hits(blast_results_handle, pwd_qualified_iden_file, align_len_cutoff, cover_cutoff)
 
 
 def get_number_of_group(grouping_file):
 
-    group_list = []
-    for each_genome in open(grouping_file):
-        each_genome_split = each_genome.strip().split(',')
-        group_id = each_genome_split[0]
-        if group_id not in group_list:
-            group_list.append(group_id)
-
-    return len(group_list)
+    return len(read_grouping_file(grouping_file))
 
 
 def get_g2g_identities_worker(argument_list):
-    pwd_qualified_iden_file     = argument_list[0]
-    qualified_genome_list            = argument_list[1]
-    name_to_group_number_dict   = argument_list[2]
-    pwd_qualified_iden_file_g2g = argument_list[3]
-
-    qualified_identities_g_g = open(pwd_qualified_iden_file_g2g, 'w')
-    for each_identity in open(pwd_qualified_iden_file):
-        each_identity_split = each_identity.strip().split('\t')
-        query = each_identity_split[0]
-        subject = each_identity_split[1]
-        identity = float(each_identity_split[2])
-        query_genome_name = '_'.join(query.split('_')[:-1])
-        subject_genome_name = '_'.join(subject.split('_')[:-1])
-
-        if (query_genome_name in qualified_genome_list) and (subject_genome_name in qualified_genome_list):
-            query_group = name_to_group_number_dict[query_genome_name].split('_')[0]
-            subject_group = name_to_group_number_dict[subject_genome_name].split('_')[0]
-            paired_group_list = [query_group, subject_group]
-
-            # query and subjects name sorted by alphabet order here
-            paired_group_list_sorted = sorted(paired_group_list)
-            g_g = '%s_%s' % (paired_group_list_sorted[0], paired_group_list_sorted[1])
-            qualified_identities_g_g.write('%s\t%s\n' % (g_g, identity))
-
-    qualified_identities_g_g.close()
+    pwd_hit_partition                   = argument_list[0]
+    query_genome_index                  = argument_list[1]
+    rank_genome_to_group_index_list     = argument_list[2]
+    rank_group_num_list                 = argument_list[3]
+    rank_qualified_iden_file_g2g_list   = argument_list[4]
+    identity_sketch_resolution          = argument_list[5]
+
+    # hits of the query genome are read once for all ranks, the g2g file is None for ranks the query genome is not
+    # grouped at
+    hit_partition = load_hit_partition(pwd_hit_partition, ['subject_genome', 'identity'])
+    subject_genome_array = np.asarray(hit_partition['subject_genome'])
+    identity_array = np.asarray(hit_partition['identity'])
+
+    for rank_index in range(len(rank_qualified_iden_file_g2g_list)):
+        pwd_qualified_iden_file_g2g = rank_qualified_iden_file_g2g_list[rank_index]
+        if pwd_qualified_iden_file_g2g is not None:
+            genome_to_group_index_array = rank_genome_to_group_index_list[rank_index]
+            group_num = rank_group_num_list[rank_index]
+            query_group_index = genome_to_group_index_array[query_genome_index]
+
+            # group index of subject genomes, -1 for genomes not in the grouping file
+            subject_group_index = genome_to_group_index_array[subject_genome_array]
+            qualified_hit = subject_group_index >= 0
+            subject_group_index = subject_group_index[qualified_hit]
+
+            # group pairs are unordered, encoded as smaller index * group_num + larger index
+            group_pair = np.minimum(subject_group_index, query_group_index).astype(np.int64) * group_num + np.maximum(subject_group_index, query_group_index)
+
+            # keep all identities (exact mode) or a sketch of their distribution in each group pair
+            if identity_sketch_resolution is None:
+                np.save('%s_pair.npy' % pwd_qualified_iden_file_g2g, group_pair)
+                np.save('%s_iden.npy' % pwd_qualified_iden_file_g2g, identity_array[qualified_hit])
+            else:
+                sketch_code, sketch_count = build_identity_sketch(group_pair, get_identity(identity_array[qualified_hit]), identity_sketch_resolution)
+                np.save('%s_sketch_code.npy' % pwd_qualified_iden_file_g2g, sketch_code)
+                np.save('%s_sketch_count.npy' % pwd_qualified_iden_file_g2g, sketch_count)
+
+
+def get_g2g_identity_cutoff(pwd_qualified_iden_file_g2g_list, group_id_list, identity_percentile, identity_sketch_resolution):
+
+    # merge sketches of all genomes
+    if identity_sketch_resolution is not None:
+        identity_sketch = merge_identity_sketches([[np.load('%s_sketch_code.npy' % i), np.load('%s_sketch_count.npy' % i)] for i in pwd_qualified_iden_file_g2g_list])
+        group_pair_percentile_dict = get_sketch_percentile_dict(identity_sketch, identity_sketch_resolution, identity_percentile)
+        group_pair_iden_cutoff_dict = {}
+        for group_pair_code in group_pair_percentile_dict:
+            group_1 = group_id_list[group_pair_code // len(group_id_list)]
+            group_2 = group_id_list[group_pair_code % len(group_id_list)]
+            current_group_pair_identity_cut_off = float("{0:.2f}".format(group_pair_percentile_dict[group_pair_code]))
+            group_pair_iden_cutoff_dict['%s_%s' % (group_1, group_2)] = current_group_pair_identity_cut_off
+            group_pair_iden_cutoff_dict['%s_%s' % (group_2, group_1)] = current_group_pair_identity_cut_off
+        return group_pair_iden_cutoff_dict
+
+    # exact mode, combine group pairs and identities of all genomes, sort by group pair
+    group_pair_array = np.concatenate([np.load('%s_pair.npy' % i) for i in pwd_qualified_iden_file_g2g_list] + [np.zeros(0, dtype=np.int64)])
+    group_pair_identity_array = np.concatenate([np.load('%s_iden.npy' % i) for i in pwd_qualified_iden_file_g2g_list] + [np.zeros(0, dtype=np.float32)])
+    group_pair_order = np.argsort(group_pair_array, kind='stable')
+    group_pair_array = group_pair_array[group_pair_order]
+    group_pair_identity_array = get_identity(group_pair_identity_array[group_pair_order])
+
+    # get identity cut off for defined percentile of each group pair
+    group_pair_start_list = np.flatnonzero(np.concatenate([[True], group_pair_array[1:] != group_pair_array[:-1]])).tolist()
+    group_pair_end_list = group_pair_start_list[1:] + [len(group_pair_array)]
+    group_pair_iden_cutoff_dict = {}
+    for group_pair_start, group_pair_end in zip(group_pair_start_list, group_pair_end_list):
+        group_pair_code = int(group_pair_array[group_pair_start])
+        group_1 = group_id_list[group_pair_code // len(group_id_list)]
+        group_2 = group_id_list[group_pair_code % len(group_id_list)]
+        current_group_pair_identity_cut_off = np.percentile(group_pair_identity_array[group_pair_start:group_pair_end], identity_percentile)
+        current_group_pair_identity_cut_off = float("{0:.2f}".format(current_group_pair_identity_cut_off))
+        group_pair_iden_cutoff_dict['%s_%s' % (group_1, group_2)] = current_group_pair_identity_cut_off
+        group_pair_iden_cutoff_dict['%s_%s' % (group_2, group_1)] = current_group_pair_identity_cut_off
+
+    return group_pair_iden_cutoff_dict
 
 
 def index_grouping_file(input_file, output_file):
@@ -190,261 +226,71 @@ def sep_path_basename_ext(file_in):
 
 
 def get_hits_group(input_file_name, output_file_name):
-    matches_2 = open(input_file_name)
+
+    # input file is sorted by query, put unique subjects of each query in one line
     output_2_file = open(output_file_name, 'w')
-    current_gene = ''
-    group_member = []
-    for match in matches_2:
-        match_split = match.strip().split('\t')
-        query_2 = match_split[0]
-        target_2 = match_split[1]
-        if current_gene == '':
-            current_gene = query_2
-            group_member.append(target_2)
-        else:
-            if query_2 == current_gene:
-                if target_2 not in group_member:
-                    group_member.append(target_2)
-            else:
-                output_2_file.write('%s\t%s' % (current_gene, '\t'.join(group_member)) + '\n')
-                current_gene = query_2
-                group_member = []
+    for current_gene, match_list in iter_line_groups(open(input_file_name), key=lambda x: x.split('\t')[0]):
+        group_member = []
+        group_member_set = set()
+        for match in match_list:
+            target_2 = match.strip().split('\t')[1]
+            if target_2 not in group_member_set:
                 group_member.append(target_2)
-    output_2_file.write('%s\t%s' % (current_gene, '\t'.join(group_member)) + '\n')
+                group_member_set.add(target_2)
+        output_2_file.write('%s\t%s' % (current_gene, '\t'.join(group_member)) + '\n')
     output_2_file.close()
 
 
-def get_candidates(targets_group_file, gene_with_g_file_name, gene_only_name_file_name, group_pair_iden_cutoff_dict):
-
-    output_1 = open(gene_with_g_file_name, 'w')
-    output_2 = open(gene_only_name_file_name, 'w')
-
-    for group in open(targets_group_file):
-        group_split = group.strip().split('\t')
-        query = group_split[0]
-        query_split = query.split('|')
-        query_gene_name = query_split[1]
-        query_sg = query_split[0]
-        query_g = query_sg.split('_')[0]
-        subjects_list = group_split[1:]
-
-        # if only one non-self subject was found, no matter which group it comes from, ignored. proceed if more than 1 non-self subject was found:
-        if len(subjects_list) > 1:
-            # get the number of subjects from self-group and non_self_group
-            self_group_subject_list = []
-            non_self_group_subject_list = []
-            #print(non_self_group_subject_list)
-            for each_subject in subjects_list:
-
-                #print(each_subject)
-                #each_subject_g = each_subject[0]
-                each_subject_g = each_subject.split('|')[0].split('_')[0]
-                if each_subject_g == query_g:
-                    self_group_subject_list.append(each_subject)
-                else:
-                    non_self_group_subject_list.append(each_subject)
-
-            # if only the self-match was found in self-group, all matched from other groups, if any, will be ignored
-            if len(self_group_subject_list) == 0:
-                pass
-
-            # if no non-self-group subjects was found, ignored
-            elif (len(self_group_subject_list) > 0) and (len(non_self_group_subject_list) == 0):
-                pass
-
-            # if both non-self self-group subjects and non-self-group subject exist:
-            elif (len(self_group_subject_list) > 0) and (len(non_self_group_subject_list) > 0):
-                # get the number the groups
-                non_self_group_subject_list_uniq = []
-                for each_g in non_self_group_subject_list:
-                    each_g_group = each_g.split('|')[0].split('_')[0]
-                    if each_g_group not in non_self_group_subject_list_uniq:
-                        non_self_group_subject_list_uniq.append(each_g_group)
-
-                # if all non-self-group subjects come from the same group
-                if len(non_self_group_subject_list_uniq) == 1:
-
-                    # get the maximum and average identity from self-group
-                    sg_maximum = 0
-                    sg_sum = 0
-                    sg_subject_number = 0
-                    for each_sg_subject in self_group_subject_list:
-                        each_sg_subject_iden = float(each_sg_subject.split('|')[2])
-                        if each_sg_subject_iden > sg_maximum:
-                            sg_maximum = each_sg_subject_iden
-                        sg_sum += each_sg_subject_iden
-                        sg_subject_number += 1
-                    sg_average = sg_sum/float(sg_subject_number)
-
-                    # get the maximum and average identity from non-self-group
-                    nsg_maximum = 0
-                    nsg_maximum_gene = ''
-                    nsg_sum = 0
-                    nsg_subject_number = 0
-                    for each_nsg_subject in non_self_group_subject_list:
-                        each_nsg_subject_iden = float(each_nsg_subject.split('|')[2])
-                        if each_nsg_subject_iden > nsg_maximum:
-                            nsg_maximum = each_nsg_subject_iden
-                            nsg_maximum_gene = each_nsg_subject
-                        nsg_sum += each_nsg_subject_iden
-                        nsg_subject_number += 1
-                    nsg_average = nsg_sum/float(nsg_subject_number)
-
-                    # if the average non-self-group identity > average self-group identity,
-                    # Subject with maximum identity from this group will be considered as a HGT donor.
-                    if nsg_average > sg_average:
-                        # filter with obtained identity cut-off:
-                        candidate_g = nsg_maximum_gene.split('|')[0].split('_')[0]
-                        candidate_iden = float(nsg_maximum_gene.split('|')[2])
-                        qg_sg = '%s_%s' % (query_g, candidate_g)
-                        qg_sg_iden_cutoff = group_pair_iden_cutoff_dict[qg_sg]
-                        if candidate_iden >= qg_sg_iden_cutoff:
-                            output_1.write('%s\t%s\n' % (query, nsg_maximum_gene))
-                            output_2.write('%s\t%s\n' % (query_gene_name, nsg_maximum_gene.split('|')[1]))
-
-                # if non-self-group subjects come from different groups
-                elif len(non_self_group_subject_list_uniq) > 1:
-                    # get average/maximum for self-group
-                    sg_maximum = 0
-                    sg_sum = 0
-                    sg_subject_number = 0
-                    for each_sg_subject in self_group_subject_list:
-                        each_sg_subject_iden = float(each_sg_subject.split('|')[2])
-                        if each_sg_subject_iden > sg_maximum:
-                            sg_maximum = each_sg_subject_iden
-                        sg_sum += each_sg_subject_iden
-                        sg_subject_number += 1
-                    sg_average = sg_sum/float(sg_subject_number)
-
-                    # get average/maximum for each non-self-group
-                    nsg_average_dict = {}
-                    nsg_maximum_dict = {}
-                    nsg_maximum_gene_name_dict = {}
-                    for each_nsg in non_self_group_subject_list_uniq:
-                        nsg_maximum = 0
-                        nsg_maximum_gene = ''
-                        nsg_sum = 0
-                        nsg_subject_number = 0
-                        for each_nsg_subject in non_self_group_subject_list:
-                            each_nsg_subject_iden = float(each_nsg_subject.split('|')[2])
-                            each_nsg_subject_group = each_nsg_subject.split('|')[0].split('_')[0]
-                            if each_nsg_subject_group == each_nsg:
-                                if each_nsg_subject_iden > nsg_maximum:
-                                    nsg_maximum = each_nsg_subject_iden
-                                    nsg_maximum_gene = each_nsg_subject
-                                nsg_sum += each_nsg_subject_iden
-                                nsg_subject_number += 1
-                        nsg_average = nsg_sum / float(nsg_subject_number)
-                        nsg_average_dict[each_nsg] = nsg_average
-                        nsg_maximum_dict[each_nsg] = nsg_maximum
-                        nsg_maximum_gene_name_dict[each_nsg] = nsg_maximum_gene
-
-                    # get the group with maximum average group identity
-                    maximum_average = sg_average
-                    maximum_average_g = group[0]
-                    for each_g in nsg_average_dict:
-                        if nsg_average_dict[each_g] > maximum_average:
-                            maximum_average = nsg_average_dict[each_g]
-                            maximum_average_g = each_g
-
-                    # if the maximum average identity group is the self-group, ignored
-                    if maximum_average_g == group[0]:
-                        pass
-
-                    # if self-group average identity is not the maximum,
-                    # Group with maximum average identity will be considered as the candidate donor group,
-                    # Subject with maximum identity from the candidate donor group will be considered as a HGT donor.
-                    elif maximum_average_g != group[0]:
-                        # filter with obtained identity cut-off:
-                        candidate_g = nsg_maximum_gene_name_dict[maximum_average_g].split('|')[0].split('_')[0]
-                        candidate_iden = float(nsg_maximum_gene_name_dict[maximum_average_g].split('|')[2])
-                        qg_sg = '%s_%s' % (query_g, candidate_g)
-                        qg_sg_iden_cutoff = group_pair_iden_cutoff_dict[qg_sg]
-                        if candidate_iden >= qg_sg_iden_cutoff:
-                            output_1.write('%s\t%s\n' % (query, nsg_maximum_gene_name_dict[maximum_average_g]))
-                            output_2.write('%s\t%s\n' % (query_gene_name, nsg_maximum_gene_name_dict[maximum_average_g].split('|')[1]))
-    output_1.close()
-    output_2.close()
-
-
 def get_HGT_worker(argument_list):
-    pwd_qualified_iden_file = argument_list[0]
-    name_to_group_number_dict = argument_list[1]
-    pwd_qual_idens_with_group = argument_list[2]
-    pwd_qual_idens_subjects_in_one_line = argument_list[3]
-    pwd_hgt_candidates_with_group = argument_list[4]
-    pwd_hgt_candidates_only_gene = argument_list[5]
-    group_pair_iden_cutoff_dict = argument_list[6]
-    qualified_genome_list = argument_list[7]
-
-    file_path, file_basename, file_extension = sep_path_basename_ext(pwd_qual_idens_with_group)
-    pwd_qual_idens_with_group_tmp = '%s/%s_tmp.%s' % (file_path, file_basename, file_extension)
-
-    qualified_matches_with_group = open(pwd_qual_idens_with_group_tmp, 'w')
-    for qualified_identity in open(pwd_qualified_iden_file):
-        qualified_identity_split = qualified_identity.strip().split('\t')
-        query = qualified_identity_split[0]
-        query_split = query.split('_')
-        query_bin = '_'.join(query_split[:-1])
-        subject = qualified_identity_split[1]
-        subject_split = subject.split('_')
-        subject_bin = '_'.join(subject_split[:-1])
-        identity = float(qualified_identity_split[2])
-        if (query_bin in qualified_genome_list) and (subject_bin in qualified_genome_list):
-            file_write = '%s|%s\t%s|%s|%s\n' % (name_to_group_number_dict[query_bin], query, name_to_group_number_dict[subject_bin], subject, str(identity))
-            qualified_matches_with_group.write(file_write)
-    qualified_matches_with_group.close()
-
-    # sort
-    os.system('cat %s | sort > %s' % (pwd_qual_idens_with_group_tmp, pwd_qual_idens_with_group))
-    os.system('rm %s' % pwd_qual_idens_with_group_tmp)
-
-    # put subjects in one line
-    get_hits_group(pwd_qual_idens_with_group, pwd_qual_idens_subjects_in_one_line)
-
-    # get HGT candidates
-    get_candidates(pwd_qual_idens_subjects_in_one_line,
-                   pwd_hgt_candidates_with_group,
-                   pwd_hgt_candidates_only_gene,
-                   group_pair_iden_cutoff_dict)
-
-
-def remove_bidirection(input_file, candidate2identity_dict, output_file):
-    input = open(input_file)
-    output = open(output_file, 'w')
-
-    # get overall list
-    overall = []
-    for each in input:
-        overall.append(each.strip())
-
-    # get overlap list
-    tmp_list = []
-    overlap_list = []
-    for each in overall:
-        each_split = each.split('\t')
-        each_reverse = '%s\t%s' % (each_split[1], each_split[0])
-        tmp_list.append(each)
-        if each_reverse in tmp_list:
-            overlap_list.append(each)
-
-    # get non-overlap list
-    non_overlap_list = []
-    for each in overall:
-        each_split = each.split('\t')
-        each_reverse = '%s\t%s' % (each_split[1], each_split[0])
-        if (each not in overlap_list) and (each_reverse not in overlap_list):
-            non_overlap_list.append(each)
-
-    # get output
-    for each in non_overlap_list:
-        each_split = each.split('\t')
-        each_concatenated = '%s___%s' % (each_split[0], each_split[1])
-        output.write('%s\t%s\n' % (each, candidate2identity_dict[each_concatenated]))
-    for each in overlap_list:
-        each_concatenated = '%s___%s' % (each.split('\t')[0], each.split('\t')[1])
-        output.write('%s\t%s\n' % (each, candidate2identity_dict[each_concatenated]))
-    output.close()
+    pwd_hit_partition = argument_list[0]
+    query_genome_index = argument_list[1]
+    hit_store_genome_list = argument_list[2]
+    rank_argument_list = argument_list[3]
+    sort_buffer_size = argument_list[4]
+    sort_spill_dir = argument_list[5]
+
+    # rank_argument_list has one element per rank, None for ranks the query genome is not grouped at, otherwise
+    # [genome_to_group_number_list, with_group file, in_one_line file, candidates with group, candidates only gene,
+    # group_pair_iden_cutoff_dict], group numbers are None for genomes not in the grouping file of a rank
+    hit_partition = load_hit_partition(pwd_hit_partition, ['query_gene', 'subject_genome', 'subject_gene', 'identity'])
+    query_genome = hit_store_genome_list[query_genome_index]
+    rank_index_list = [i for i in range(len(rank_argument_list)) if rank_argument_list[i] is not None]
+    rank_genome_to_group_number_list = [rank_argument_list[i][0] for i in rank_index_list]
+    rank_query_group_number_list = [i[query_genome_index] for i in rank_genome_to_group_number_list]
+
+    # scan hits once, each hit is added to the sorted with_group lines of all ranks its subject genome is grouped at,
+    # ranks share the sort buffer so lines held in memory are bounded by sort_buffer_size for any number of ranks
+    rank_sort_buffer_size = sort_buffer_size / max(1, len(rank_index_list))
+    rank_line_sorter_list = [new_line_sorter(rank_sort_buffer_size, sort_spill_dir) for i in rank_index_list]
+    try:
+        for query_gene, subject_genome, subject_gene, identity in iter_hit_rows(hit_partition, ['query_gene', 'subject_genome', 'subject_gene', 'identity']):
+            query_gene_name = get_gene_name(query_genome, query_gene)
+            subject_gene_name = get_gene_name(hit_store_genome_list[subject_genome], subject_gene)
+            for rank_pos in range(len(rank_index_list)):
+                subject_group_number = rank_genome_to_group_number_list[rank_pos][subject_genome]
+                if subject_group_number is not None:
+                    file_write = '%s|%s\t%s|%s|%s\n' % (rank_query_group_number_list[rank_pos], query_gene_name, subject_group_number, subject_gene_name, str(identity))
+                    add_sorted_line(rank_line_sorter_list[rank_pos], file_write)
+
+        for rank_pos in range(len(rank_index_list)):
+            genome_to_group_number_list, pwd_qual_idens_with_group, pwd_qual_idens_subjects_in_one_line, pwd_hgt_candidates_with_group, pwd_hgt_candidates_only_gene, group_pair_iden_cutoff_dict = rank_argument_list[rank_index_list[rank_pos]]
+
+            # sort
+            with open(pwd_qual_idens_with_group, 'w') as qualified_matches_with_group:
+                qualified_matches_with_group.writelines(iter_line_sorter(rank_line_sorter_list[rank_pos]))
+
+            # put subjects in one line
+            get_hits_group(pwd_qual_idens_with_group, pwd_qual_idens_subjects_in_one_line)
+
+            # get HGT candidates
+            get_candidates(pwd_qual_idens_subjects_in_one_line,
+                           pwd_hgt_candidates_with_group,
+                           pwd_hgt_candidates_only_gene,
+                           group_pair_iden_cutoff_dict)
+
+    finally:
+        for line_sorter in rank_line_sorter_list:
+            remove_spill_files(line_sorter)
 
 
 class BinRecord(object):
@@ -455,120 +301,40 @@ class BinRecord(object):
         self.group_without_underscore = group_without_underscore
 
 
-def get_flanking_region(input_gbk_file, HGT_candidate, flanking_length):
-
-    wd, gbk_file = os.path.split(input_gbk_file)
-    new_gbk_file = '%s/%s_%sbp_temp.gbk' % (wd, HGT_candidate, flanking_length)
-    new_gbk_final_file = '%s/%s_%sbp.gbk' % (wd, HGT_candidate, flanking_length)
-    new_fasta_final_file = '%s/%s_%sbp.fasta' % (wd, HGT_candidate, flanking_length)
-
-    # get flanking range of candidate
-    input_gbk = SeqIO.parse(input_gbk_file, "genbank")
-    new_start = 0
-    new_end = 0
-    contig_length = 0
-    for record in input_gbk:
-        contig_length = len(record.seq)
-        for gene in record.features:
-            # get contig length
-            if gene.type == 'source':
-                pass
-            # get new start and end points
-            elif 'locus_tag' in gene.qualifiers:
-                if gene.qualifiers['locus_tag'][0] == HGT_candidate:
-                    # get new start point
-                    new_start = gene.location.start - flanking_length
-                    if new_start < 0:
-                        new_start = 0
-                    # get new end point
-                    new_end = gene.location.end + flanking_length
-                    if new_end > contig_length:
-                        new_end = contig_length
-
-    # get genes within flanking region
-    keep_gene_list = []
-    input_gbk = SeqIO.parse(input_gbk_file, "genbank")
-    for record in input_gbk:
-        for gene in record.features:
-            if 'locus_tag' in gene.qualifiers:
-                if (gene.location.start < new_start) and (gene.location.end >= new_start):
-                    keep_gene_list.append(gene.qualifiers['locus_tag'][0])
-                    new_start = gene.location.start
-                elif (gene.location.start > new_start) and (gene.location.end < new_end):
-                    keep_gene_list.append(gene.qualifiers['locus_tag'][0])
-                elif (gene.location.start <= new_end) and (gene.location.end > new_end):
-                    keep_gene_list.append(gene.qualifiers['locus_tag'][0])
-                    new_end = gene.location.end
-
-    # remove genes not in flanking region from gbk file
-    input_gbk = SeqIO.parse(input_gbk_file, "genbank")
-    new_gbk = open(new_gbk_file, 'w')
-    for record in input_gbk:
-        new_record_features = []
-        for gene in record.features:
-            if gene.type == 'source':
-                new_record_features.append(gene)
-            elif 'locus_tag' in gene.qualifiers:
-                if gene.qualifiers['locus_tag'][0] in keep_gene_list:
-                    new_record_features.append(gene)
-        record.features = new_record_features
-        SeqIO.write(record, new_gbk, 'genbank')
-    new_gbk.close()
-
-    # remove sequences not in flanking region
-    new_gbk_full_length = SeqIO.parse(new_gbk_file, "genbank")
-    new_gbk_final = open(new_gbk_final_file, 'w')
-    new_fasta_final = open(new_fasta_final_file, 'w')
-    for record in new_gbk_full_length:
-        # get new sequence
-        new_seq = record.seq[new_start:new_end]
-        new_contig_length = len(new_seq)
-        new_record = SeqRecord(new_seq,
-                               id=record.id,
-                               name=record.name,
-                               description=record.description,
-                               annotations=record.annotations)
-
-        # get new location
-        new_record_features_2 = []
-        for gene in record.features:
-            if gene.type == 'source':
-                gene_location_new = ''
-                if gene.location.strand == 1:
-                    gene_location_new = FeatureLocation(0, new_contig_length, strand=+1)
-                if gene.location.strand == -1:
-                    gene_location_new = FeatureLocation(0, new_contig_length, strand=-1)
-                gene.location = gene_location_new
-                new_record_features_2.append(gene)
-            elif 'locus_tag' in gene.qualifiers:
-                gene_location_new = ''
-                if gene.location.strand == 1:
-                    if gene.location.start - new_start < 0:
-                        gene_location_new = FeatureLocation(0,
-                                                            gene.location.end - new_start,
-                                                            strand=+1)
-                    else:
-                        gene_location_new = FeatureLocation(gene.location.start - new_start,
-                                                            gene.location.end - new_start,
-                                                            strand=+1)
-                if gene.location.strand == -1:
-                    if gene.location.start - new_start < 0:
-                        gene_location_new = FeatureLocation(0,
-                                                            gene.location.end - new_start,
-                                                            strand=-1)
-                    else:
-                        gene_location_new = FeatureLocation(gene.location.start - new_start,
-                                                            gene.location.end - new_start,
-                                                            strand=-1)
-                gene.location = gene_location_new
-                new_record_features_2.append(gene)
-        new_record.features = new_record_features_2
-        SeqIO.write(new_record, new_gbk_final, 'genbank')
-        SeqIO.write(new_record, new_fasta_final, 'fasta')
+def get_flanking_region(pwd_gene_index, pwd_contig_store, HGT_candidate, flanking_length, output_folder, write_contig):
+
+    # write the flanking region of a gene (<gene>_<flanking_length>bp.gbk and .fasta) and its contig (<gene>.fasta,
+    # if write_contig is True) with the gene coordinate index and the contig store, return the flanking region and
+    # [gene, start, end, strand, contig length]
+    gene_index_dict = read_gene_index(pwd_gene_index)
 
-    new_gbk_final.close()
-    new_fasta_final.close()
-    os.system('rm %s' % new_gbk_file)
+    # gene index, see gene_table.py
+    gene_index = int(HGT_candidate.rpartition('_')[2]) - 1
+    contig_index = gene_index_dict['gene_contig'][gene_index]
+    contig_name = str(gene_index_dict['contig_name'][contig_index])
+    contig_store_index_entry = read_contig_store_index(pwd_contig_store)[contig_name]
+    gene_location = [HGT_candidate, int(gene_index_dict['gene_start'][gene_index]), int(gene_index_dict['gene_end'][gene_index]), int(gene_index_dict['gene_strand'][gene_index]), int(gene_index_dict['contig_len'][contig_index])]
+    if write_contig is True:
+        contig_seq = fetch_contig_region(pwd_contig_store, contig_store_index_entry, 0, gene_location[4])
+        SeqIO.write(SeqRecord(Seq(contig_seq), id=contig_name, name=contig_name, description=''), '%s/%s.fasta' % (output_folder, HGT_candidate), 'fasta')
+
+    # get flanking range of candidate and genes within it
+    new_start, new_end, keep_gene_list = get_flanking_genes(gene_index_dict, gene_index, flanking_length)
+
+    # get new location of genes
+    new_seq = fetch_contig_region(pwd_contig_store, contig_store_index_entry, new_start, new_end)
+    new_record = SeqRecord(Seq(new_seq), id=contig_name, name=contig_name, description='', annotations={'molecule_type': 'DNA'})
+    genome_name = get_genome_name(HGT_candidate)
+    for each_gene in keep_gene_list:
+        gene_location_new = FeatureLocation(max(int(gene_index_dict['gene_start'][each_gene]) - new_start, 0),
+                                            int(gene_index_dict['gene_end'][each_gene]) - new_start,
+                                            strand=int(gene_index_dict['gene_strand'][each_gene]))
+        new_record.features.append(SeqFeature(gene_location_new, type='CDS', qualifiers={'locus_tag': [get_gene_name(genome_name, each_gene)]}))
+
+    SeqIO.write(new_record, '%s/%s_%sbp.gbk' % (output_folder, HGT_candidate, flanking_length), 'genbank')
+    SeqIO.write(new_record, '%s/%s_%sbp.fasta' % (output_folder, HGT_candidate, flanking_length), 'fasta')
+
+    return new_record, gene_location
 
 
 def check_match_direction(blast_hit_splitted):
@@ -780,76 +546,38 @@ def set_contig_track_features(gene_contig, name_group_dict, candidate_list, HGT_
             feature_set.add_feature(feature, color=color, label=True, sigil='ARROW', arrowshaft_height=0.5, arrowhead_length=0.4, label_color=label_color, label_size=label_size, label_angle=label_angle, label_position="middle")
 
 
-def get_gbk_blast_act2(arguments_list):
+# blastn parameters for flanking regions and for contigs (end match check)
+flanking_blastn_evalue = 1e-5
+flanking_blastn_parameters = '-evalue %s -outfmt 6 -task blastn' % flanking_blastn_evalue
+contig_blastn_parameters = '-evalue %s -outfmt "6 qseqid sseqid pident length mismatch gapopen qstart qend sstart send evalue bitscore qlen slen" -task blastn' % flanking_blastn_evalue
 
-    match = arguments_list[0]
-    pwd_gbk_folder = arguments_list[1]
-    flanking_length = arguments_list[2]
-    aln_len_cutoff = arguments_list[3]
-    name_to_group_number_dict = arguments_list[4]
-    path_to_output_act_folder = arguments_list[5]
-    pwd_normal_plot_folder = arguments_list[6]
-    pwd_at_ends_plot_folder = arguments_list[7]
-    pwd_full_contig_match_plot_folder = arguments_list[8]
-    pwd_blastn_exe = arguments_list[9]
-    keep_temp = arguments_list[10]
-    candidates_2_contig_match_category_dict = arguments_list[11]
-    end_match_iden_cutoff = arguments_list[12]
-    No_Eb_Check = arguments_list[13]
-    flk_plot_fmt = 'SVG'
+
+def extract_candidate_flanking_regions(match, pwd_gbk_folder, flanking_length, path_to_output_act_folder, No_Eb_Check):
 
     genes = match.strip().split('\t')[:-1]
     current_HGT_iden = float("{0:.1f}".format(float(match.strip().split('\t')[-1])))
     folder_name = '___'.join(genes)
     os.mkdir('%s/%s' % (path_to_output_act_folder, folder_name))
 
-    gene_1 = genes[0]
-    gene_2 = genes[1]
-    genome_1 = '_'.join(gene_1.split('_')[:-1])
-    genome_2 = '_'.join(gene_2.split('_')[:-1])
-    pwd_genome_1_gbk = '%s/%s.gbk' % (pwd_gbk_folder, genome_1)
-    pwd_genome_2_gbk = '%s/%s.gbk' % (pwd_gbk_folder, genome_2)
-
+    # extract contigs and flanking regions of both genes
+    matche_pair_list = []
     dict_value_list = []
-    # Extract gbk and fasta files for gene 1
-    for genome_1_record in SeqIO.parse(pwd_genome_1_gbk, 'genbank'):
-        for gene_1_f in genome_1_record.features:
-            if 'locus_tag' in gene_1_f.qualifiers:
-                if gene_1 in gene_1_f.qualifiers["locus_tag"]:
-                    dict_value_list.append([gene_1, int(gene_1_f.location.start), int(gene_1_f.location.end), gene_1_f.location.strand, len(genome_1_record.seq)])
-                    pwd_gene_1_gbk_file = '%s/%s/%s.gbk' % (path_to_output_act_folder, folder_name, gene_1)
-                    pwd_gene_1_fasta_file = '%s/%s/%s.fasta' % (path_to_output_act_folder, folder_name, gene_1)
-                    SeqIO.write(genome_1_record, pwd_gene_1_gbk_file, 'genbank')
-                    SeqIO.write(genome_1_record, pwd_gene_1_fasta_file, 'fasta')
-                    get_flanking_region(pwd_gene_1_gbk_file, gene_1, flanking_length)
-
-    # Extract gbk and fasta files for gene 2
-    for genome_2_record in SeqIO.parse(pwd_genome_2_gbk, 'genbank'):
-        for gene_2_f in genome_2_record.features:
-            if 'locus_tag' in gene_2_f.qualifiers:
-                if gene_2 in gene_2_f.qualifiers["locus_tag"]:
-                    dict_value_list.append([gene_2, int(gene_2_f.location.start), int(gene_2_f.location.end), gene_2_f.location.strand, len(genome_2_record.seq)])
-                    pwd_gene_2_gbk_file = '%s/%s/%s.gbk' % (path_to_output_act_folder, folder_name, gene_2)
-                    pwd_gene_2_fasta_file = '%s/%s/%s.fasta' % (path_to_output_act_folder, folder_name, gene_2)
-                    SeqIO.write(genome_2_record, pwd_gene_2_gbk_file, 'genbank')
-                    SeqIO.write(genome_2_record, pwd_gene_2_fasta_file, 'fasta')
-                    get_flanking_region(pwd_gene_2_gbk_file, gene_2, flanking_length)
+    for each_gene in genes:
+        each_genome = get_genome_name(each_gene)
+        pwd_gene_index = '%s/%s.npz' % (pwd_gbk_folder, each_genome)
+        pwd_contig_store = '%s/%s.fna' % (pwd_gbk_folder, each_genome)
+        gene_contig, gene_location = get_flanking_region(pwd_gene_index, pwd_contig_store, each_gene, flanking_length, '%s/%s' % (path_to_output_act_folder, folder_name), No_Eb_Check is False)
+        matche_pair_list.append(gene_contig)
+        dict_value_list.append(gene_location)
 
-    # Run Blast
-    prefix_c =              '%s/%s'                 % (path_to_output_act_folder, folder_name)
-    query_c =               '%s/%s_%sbp.fasta'      % (prefix_c, gene_1, flanking_length)
-    query_c_full_len =      '%s/%s.fasta'           % (prefix_c, gene_1)
-    subject_c =             '%s/%s_%sbp.fasta'      % (prefix_c, gene_2, flanking_length)
-    subject_c_full_len =    '%s/%s.fasta'           % (prefix_c, gene_2)
-    output_c =              '%s/%s.txt'             % (prefix_c, folder_name)
-    output_c_full_len =     '%s/%s_full_length.txt' % (prefix_c, folder_name)
+    return genes, folder_name, current_HGT_iden, matche_pair_list, dict_value_list
 
-    parameters_c_n =          '-evalue 1e-5 -outfmt 6 -task blastn'
-    parameters_c_n_full_len = '-evalue 1e-5 -outfmt "6 qseqid sseqid pident length mismatch gapopen qstart qend sstart send evalue bitscore qlen slen" -task blastn'
-    command_blast =           '%s -query %s -subject %s -out %s %s' % (pwd_blastn_exe, query_c, subject_c, output_c, parameters_c_n)
-    command_blast_full_len =  '%s -query %s -subject %s -out %s %s' % (pwd_blastn_exe, query_c_full_len, subject_c_full_len, output_c_full_len, parameters_c_n_full_len)
-    os.system(command_blast)
 
+def plot_candidate_flanking_regions(genes, folder_name, current_HGT_iden, matche_pair_list, dict_value_list, name_to_group_number_dict, path_to_output_act_folder, pwd_normal_plot_folder, pwd_at_ends_plot_folder, pwd_full_contig_match_plot_folder, candidates_2_contig_match_category_dict, end_match_iden_cutoff, No_Eb_Check):
+
+    # classify and plot a candidate with the blastn results in its folder
+    flk_plot_fmt = 'SVG'
+    output_c_full_len = '%s/%s/%s_full_length.txt' % (path_to_output_act_folder, folder_name, folder_name)
 
     ############################## check whether full length or end match ##############################
 
@@ -859,9 +587,6 @@ def get_gbk_blast_act2(arguments_list):
         candidates_2_contig_match_category_dict[folder_name] = match_category
     else:
 
-        # run blast
-        os.system(command_blast_full_len)
-
         # get qualified_ctg_match_list
         min_ctg_match_aln_len = 100
         qualified_ctg_match_list = []
@@ -881,12 +606,6 @@ def get_gbk_blast_act2(arguments_list):
 
     ############################## prepare for flanking plot ##############################
 
-    # read in gbk files
-    matche_pair_list = []
-    for each_gene in genes:
-        path_to_gbk_file = '%s/%s/%s_%sbp.gbk' % (path_to_output_act_folder, folder_name, each_gene, flanking_length)
-        gene_contig = SeqIO.read(path_to_gbk_file, "genbank")
-        matche_pair_list.append(gene_contig)
     bin_record_list = []
     bin_record_list.append(matche_pair_list)
 
@@ -1007,6 +726,118 @@ def get_gbk_blast_act2(arguments_list):
         os.system('mv %s/%s.%s %s/' % (path_to_output_act_folder, folder_name, flk_plot_fmt, pwd_normal_plot_folder))
 
 
+def get_gbk_blast_act2(arguments_list):
+
+    match = arguments_list[0]
+    pwd_gbk_folder = arguments_list[1]
+    flanking_length = arguments_list[2]
+    aln_len_cutoff = arguments_list[3]
+    name_to_group_number_dict = arguments_list[4]
+    path_to_output_act_folder = arguments_list[5]
+    pwd_normal_plot_folder = arguments_list[6]
+    pwd_at_ends_plot_folder = arguments_list[7]
+    pwd_full_contig_match_plot_folder = arguments_list[8]
+    pwd_blastn_exe = arguments_list[9]
+    keep_temp = arguments_list[10]
+    candidates_2_contig_match_category_dict = arguments_list[11]
+    end_match_iden_cutoff = arguments_list[12]
+    No_Eb_Check = arguments_list[13]
+
+    genes, folder_name, current_HGT_iden, matche_pair_list, dict_value_list = extract_candidate_flanking_regions(match, pwd_gbk_folder, flanking_length, path_to_output_act_folder, No_Eb_Check)
+    gene_1 = genes[0]
+    gene_2 = genes[1]
+
+    # Run Blast
+    prefix_c =              '%s/%s'                 % (path_to_output_act_folder, folder_name)
+    query_c =               '%s/%s_%sbp.fasta'      % (prefix_c, gene_1, flanking_length)
+    query_c_full_len =      '%s/%s.fasta'           % (prefix_c, gene_1)
+    subject_c =             '%s/%s_%sbp.fasta'      % (prefix_c, gene_2, flanking_length)
+    subject_c_full_len =    '%s/%s.fasta'           % (prefix_c, gene_2)
+    output_c =              '%s/%s.txt'             % (prefix_c, folder_name)
+    output_c_full_len =     '%s/%s_full_length.txt' % (prefix_c, folder_name)
+
+    command_blast =           '%s -query %s -subject %s -out %s %s' % (pwd_blastn_exe, query_c, subject_c, output_c, flanking_blastn_parameters)
+    command_blast_full_len =  '%s -query %s -subject %s -out %s %s' % (pwd_blastn_exe, query_c_full_len, subject_c_full_len, output_c_full_len, contig_blastn_parameters)
+    os.system(command_blast)
+    if No_Eb_Check is False:
+        os.system(command_blast_full_len)
+
+    plot_candidate_flanking_regions(genes, folder_name, current_HGT_iden, matche_pair_list, dict_value_list, name_to_group_number_dict, path_to_output_act_folder, pwd_normal_plot_folder, pwd_at_ends_plot_folder, pwd_full_contig_match_plot_folder, candidates_2_contig_match_category_dict, end_match_iden_cutoff, No_Eb_Check)
+
+
+def write_batch_blastn_input(candidate_list, path_to_output_act_folder, file_name_format, gene_index, pwd_batch_fasta, id_prefix):
+
+    # sequences (flanking regions or contigs) of the first (gene_index 0) or second genes of candidates, written once
+    # with ids from get_batch_seq_id, file_name_format: file name in candidate folders with the gene name as placeholder
+    # return {gene: sequence id}
+    batch_fasta_handle = open(pwd_batch_fasta, 'w')
+    gene_to_seq_id_dict = {}
+    for genes, folder_name, current_HGT_iden, matche_pair_list, dict_value_list in candidate_list:
+        each_gene = genes[gene_index]
+        if each_gene not in gene_to_seq_id_dict:
+            gene_to_seq_id_dict[each_gene] = get_batch_seq_id(len(gene_to_seq_id_dict) + 1, id_prefix)
+            each_fasta = open('%s/%s/%s' % (path_to_output_act_folder, folder_name, file_name_format % each_gene)).read()
+            batch_fasta_handle.write('>%s\n%s' % (gene_to_seq_id_dict[each_gene], each_fasta.split('\n', 1)[1]))
+    batch_fasta_handle.close()
+
+    return gene_to_seq_id_dict
+
+
+def demultiplex_batch_blastn_output(candidate_list, path_to_output_act_folder, pair_to_hit_dict, output_file_format, query_id_dict, subject_id_dict):
+
+    # write hits of each candidate to its folder, with sequence ids replaced by contig names (sequence ids when running
+    # blastn on the candidate alone), output_file_format: file name with the candidate folder name as placeholder
+    for genes, folder_name, current_HGT_iden, matche_pair_list, dict_value_list in candidate_list:
+        output_handle = open('%s/%s/%s' % (path_to_output_act_folder, folder_name, output_file_format % folder_name), 'w')
+        for blast_hit_split in pair_to_hit_dict.get((query_id_dict[genes[0]], subject_id_dict[genes[1]]), []):
+            output_handle.write('%s\n' % '\t'.join([matche_pair_list[0].id, matche_pair_list[1].id] + blast_hit_split[2:]))
+        output_handle.close()
+
+
+def get_gbk_blast_act2_batch(arguments_list):
+
+    # same as get_gbk_blast_act2 for a batch of candidates (arguments_list[0]), with one blastn for their flanking
+    # regions and one for their contigs. Second genes of the batch are searched as a database and only hits between
+    # the two genes of candidates are kept, with E-values of the candidate alone (see batch_blastn.py)
+    match_list = arguments_list[0]
+    pwd_gbk_folder = arguments_list[1]
+    flanking_length = arguments_list[2]
+    name_to_group_number_dict = arguments_list[4]
+    path_to_output_act_folder = arguments_list[5]
+    pwd_normal_plot_folder = arguments_list[6]
+    pwd_at_ends_plot_folder = arguments_list[7]
+    pwd_full_contig_match_plot_folder = arguments_list[8]
+    pwd_blastn_exe = arguments_list[9]
+    candidates_2_contig_match_category_dict = arguments_list[11]
+    end_match_iden_cutoff = arguments_list[12]
+    No_Eb_Check = arguments_list[13]
+    pwd_makeblastdb_exe = arguments_list[14]
+
+    candidate_list = [extract_candidate_flanking_regions(match, pwd_gbk_folder, flanking_length, path_to_output_act_folder, No_Eb_Check) for match in match_list]
+
+    # run blastn on flanking regions and contigs of the batch, files are named after its first candidate. Flanking
+    # region hits have the outfmt 6 columns, contig hits also have qlen and slen
+    batch_prefix = '%s/%s_batch' % (path_to_output_act_folder, candidate_list[0][1])
+    blastn_task_list = [['flanking', '%%s_%sbp.fasta' % flanking_length, 12, '%s.txt']]
+    if No_Eb_Check is False:
+        blastn_task_list.append(['full_length', '%s.fasta', 14, '%s_full_length.txt'])
+    for blastn_task, file_name_format, output_col_num, output_file_format in blastn_task_list:
+        batch_query = '%s_%s_query.fasta' % (batch_prefix, blastn_task)
+        batch_subject = '%s_%s_subject.fasta' % (batch_prefix, blastn_task)
+        batch_output = '%s_%s.txt' % (batch_prefix, blastn_task)
+        query_id_dict = write_batch_blastn_input(candidate_list, path_to_output_act_folder, file_name_format, 0, batch_query, 'q')
+        subject_id_dict = write_batch_blastn_input(candidate_list, path_to_output_act_folder, file_name_format, 1, batch_subject, 's')
+        candidate_pair_set = set([(query_id_dict[i[0][0]], subject_id_dict[i[0][1]]) for i in candidate_list])
+        makeblastdb_cmd, blastn_cmd = get_batch_blastn_cmds(pwd_blastn_exe, pwd_makeblastdb_exe, batch_query, batch_subject, batch_output, flanking_blastn_evalue)
+        run_batch_blastn_cmds(makeblastdb_cmd, blastn_cmd)
+        pair_to_hit_dict = read_batch_blastn_pair_hits(batch_output, candidate_pair_set, flanking_blastn_evalue, output_col_num)
+        demultiplex_batch_blastn_output(candidate_list, path_to_output_act_folder, pair_to_hit_dict, output_file_format, query_id_dict, subject_id_dict)
+        remove_batch_blastn_files(batch_query, batch_subject, batch_output)
+
+    for genes, folder_name, current_HGT_iden, matche_pair_list, dict_value_list in candidate_list:
+        plot_candidate_flanking_regions(genes, folder_name, current_HGT_iden, matche_pair_list, dict_value_list, name_to_group_number_dict, path_to_output_act_folder, pwd_normal_plot_folder, pwd_at_ends_plot_folder, pwd_full_contig_match_plot_folder, candidates_2_contig_match_category_dict, end_match_iden_cutoff, No_Eb_Check)
+
+
 def export_HGT_query_to_subjects(pwd_BM_HGTs, pwd_blast_subjects_in_one_line, pwd_query_to_subjects_file):
 
     HGT_candidates = set()
@@ -1043,24 +874,24 @@ def extract_gene_tree_seq_worker(argument_list):
     each_to_process =               argument_list[0]
     pwd_tree_folder =               argument_list[1]
     pwd_combined_faa_file_subset =  argument_list[2]
-    pwd_blastp_exe =                argument_list[3]
+    homology_search_backend =       argument_list[3]
     pwd_mafft_exe =                 argument_list[4]
     pwd_fasttree_exe =              argument_list[5]
     genome_to_group_dict =          argument_list[6]
-    genome_name_list =              argument_list[7]
+    genome_name_set =               set(argument_list[7])
     HGT_query_to_subjects_dict =    argument_list[8]
     pwd_SCG_tree_all =              argument_list[9]
+    config_dict =                   argument_list[10]
 
     gene_1 = each_to_process[0]
     gene_2 = each_to_process[1]
-    HGT_genome_1 = '_'.join(gene_1.split('_')[:-1])
-    HGT_genome_2 = '_'.join(gene_2.split('_')[:-1])
+    HGT_genome_1 = get_genome_name(gene_1)
+    HGT_genome_2 = get_genome_name(gene_2)
     paired_groups = [genome_to_group_dict[HGT_genome_1], genome_to_group_dict[HGT_genome_2]]
 
 
     each_to_process_concate = '___'.join(each_to_process)
     blast_output =            '%s/%s___%s_gene_tree_blast.tab'        % (pwd_tree_folder, gene_1, gene_2)
-    blast_output_sorted =     '%s/%s___%s_gene_tree_blast_sorted.tab' % (pwd_tree_folder, gene_1, gene_2)
     gene_tree_seq =           '%s/%s___%s_gene_tree.seq'              % (pwd_tree_folder, gene_1, gene_2)
     gene_tree_seq_uniq =      '%s/%s___%s_gene_tree_uniq.seq'         % (pwd_tree_folder, gene_1, gene_2)
     self_seq =                '%s/%s___%s_gene_tree_selfseq.seq'      % (pwd_tree_folder, gene_1, gene_2)
@@ -1085,13 +916,13 @@ def extract_gene_tree_seq_worker(argument_list):
 
     current_gene_member_grouped = []
     for gene_member in current_gene_member_BM:
-        gene_member_genome = '_'.join(gene_member.split('_')[:-1])
-        if gene_member_genome in genome_name_list:
+        gene_member_genome = get_genome_name(gene_member)
+        if gene_member_genome in genome_name_set:
             current_gene_member_grouped.append(gene_member)
 
     current_gene_member_grouped_from_paired_group = []
     for gene_member in current_gene_member_grouped:
-        current_gene_genome = '_'.join(gene_member.split('_')[:-1])
+        current_gene_genome = get_genome_name(gene_member)
         current_genome_group = genome_to_group_dict[current_gene_genome]
         if current_genome_group in paired_groups:
             current_gene_member_grouped_from_paired_group.append(gene_member)
@@ -1103,11 +934,12 @@ def extract_gene_tree_seq_worker(argument_list):
         genes_to_extract_list = current_gene_member_grouped_from_paired_group
 
     # get sequences of othorlog group to build gene tree
+    genes_to_extract_set = set(genes_to_extract_list)
     output_handle = open(gene_tree_seq, "w")
     extracted_gene_set = set()
     for seq_record in SeqIO.parse(pwd_combined_faa_file_subset, 'fasta'):
         # if seq_record.id in current_gene_member:
-        if seq_record.id in genes_to_extract_list:
+        if seq_record.id in genes_to_extract_set:
             output_handle.write('>%s\n' % seq_record.id)
             output_handle.write('%s\n' % str(seq_record.seq))
             extracted_gene_set.add(seq_record.id)
@@ -1118,7 +950,7 @@ def extract_gene_tree_seq_worker(argument_list):
         non_self_seq_handle = open(non_self_seq, 'w')
         non_self_seq_num = 0
         for each_seq in SeqIO.parse(gene_tree_seq, 'fasta'):
-            each_seq_genome_id = '_'.join(each_seq.id.split('_')[:-1])
+            each_seq_genome_id = get_genome_name(each_seq.id)
             if each_seq.id in each_to_process:
                 SeqIO.write(each_seq, self_seq_handle, 'fasta')
             elif each_seq_genome_id not in [HGT_genome_1, HGT_genome_2]:
@@ -1131,38 +963,28 @@ def extract_gene_tree_seq_worker(argument_list):
         # run blast
         genome_subset = set()
         if non_self_seq_num > 0:
-            os.system('%s -query %s -subject %s -outfmt 6 -out %s' % (pwd_blastp_exe, self_seq, non_self_seq, blast_output))
-            os.system('cat %s | sort > %s' % (blast_output, blast_output_sorted))
+            os.system(get_pairwise_search_cmd(homology_search_backend, self_seq, non_self_seq, blast_output, 'prot', config_dict))
 
-            # get best match from each genome
-            current_query_subject_genome = ''
-            current_bit_score = 0
-            current_best_match = ''
+            # get best match from each genome, search output is grouped by query, no need to sort it. ties in bit
+            # score go to the smallest hit line, which was the first one in sorted order
             best_match_list = []
-            for each_hit in open(blast_output_sorted):
-                each_hit_split = each_hit.strip().split('\t')
-                query = each_hit_split[0]
-                subject = each_hit_split[1]
-                subject_genome = '_'.join(subject.split('_')[:-1])
-                query_subject_genome = '%s___%s' % (query, subject_genome)
-                bit_score = float(each_hit_split[11])
-                if current_query_subject_genome == '':
-                    current_query_subject_genome = query_subject_genome
-                    current_bit_score = bit_score
-                    current_best_match = subject
-                elif current_query_subject_genome == query_subject_genome:
-                    if bit_score > current_bit_score:
-                        current_bit_score = bit_score
-                        current_best_match = subject
-                elif current_query_subject_genome != query_subject_genome:
-                    best_match_list.append(current_best_match)
-                    current_query_subject_genome = query_subject_genome
-                    current_bit_score = bit_score
-                    current_best_match = subject
-            best_match_list.append(current_best_match)
+            for query, query_hit_list in iter_line_groups(open(blast_output), key=lambda x: x.split('\t')[0]):
+                subject_genome_best_hit_dict = {}
+                for each_hit in query_hit_list:
+                    each_hit_split = each_hit.strip().split('\t')
+                    subject = each_hit_split[1]
+                    subject_genome = get_genome_name(subject)
+                    bit_score = float(each_hit_split[11])
+                    if subject_genome not in subject_genome_best_hit_dict:
+                        subject_genome_best_hit_dict[subject_genome] = [bit_score, each_hit, subject]
+                    else:
+                        current_bit_score, current_best_hit, current_best_match = subject_genome_best_hit_dict[subject_genome]
+                        if (bit_score > current_bit_score) or ((bit_score == current_bit_score) and (each_hit < current_best_hit)):
+                            subject_genome_best_hit_dict[subject_genome] = [bit_score, each_hit, subject]
+                best_match_list += [subject_genome_best_hit_dict[i][2] for i in subject_genome_best_hit_dict]
 
             # export sequences
-            gene_tree_seq_all = best_match_list + each_to_process
+            gene_tree_seq_all = set(best_match_list + each_to_process)
             gene_tree_seq_uniq_handle = open(gene_tree_seq_uniq, 'w')
             for each_seq2 in SeqIO.parse(gene_tree_seq, 'fasta'):
                 if each_seq2.id in gene_tree_seq_all:
@@ -1172,12 +994,12 @@ def extract_gene_tree_seq_worker(argument_list):
 
             cmd_mafft = '%s --quiet %s > %s' % (pwd_mafft_exe, gene_tree_seq_uniq, pwd_seq_file_1st_aln)
             for each_gene in SeqIO.parse(gene_tree_seq_uniq, 'fasta'):
-                each_gene_genome = '_'.join(str(each_gene.id).split('_')[:-1])
+                each_gene_genome = get_genome_name(str(each_gene.id))
                 genome_subset.add(each_gene_genome)
         else:
             cmd_mafft = '%s --quiet %s > %s' % (pwd_mafft_exe, gene_tree_seq, pwd_seq_file_1st_aln)
             for each_gene in SeqIO.parse(gene_tree_seq, 'fasta'):
-                each_gene_genome = '_'.join(str(each_gene.id).split('_')[:-1])
+                each_gene_genome = get_genome_name(str(each_gene.id))
                 genome_subset.add(each_gene_genome)
 
         # run mafft
@@ -1197,7 +1019,6 @@ def extract_gene_tree_seq_worker(argument_list):
         if non_self_seq_num > 0:
             os.remove(non_self_seq)
             os.remove(blast_output)
-            os.remove(blast_output_sorted)
             os.remove(gene_tree_seq_uniq)
 
 
@@ -1359,9 +1180,6 @@ def Get_circlize_plot(multi_level_detection, output_prefix, pwd_candidates_file_
 
     rank_abbre_dict_plural      = {'d': 'domains', 'p': 'phyla', 'c': 'classes', 'o': 'orders', 'f': 'families', 'g': 'genera', 's': 'species', 'x': 'specified groups'}
 
-    pwd_cir_plot_t1 =              '%s/%s_HGTs_among_%s_t1.txt'              % (pwd_MetaCHIP_op_folder, output_prefix, rank_abbre_dict_plural[taxon_rank])
-    pwd_cir_plot_t1_sorted =       '%s/%s_HGTs_among_%s_t1_sorted.txt'       % (pwd_MetaCHIP_op_folder, output_prefix, rank_abbre_dict_plural[taxon_rank])
-    pwd_cir_plot_t1_sorted_count = '%s/%s_HGTs_among_%s_sorted_count.txt'    % (pwd_MetaCHIP_op_folder, output_prefix, rank_abbre_dict_plural[taxon_rank])
     pwd_cir_plot_matrix_filename = '%s/%s_HGTs_among_%s.txt'                 % (pwd_MetaCHIP_op_folder, output_prefix, rank_abbre_dict_plural[taxon_rank])
 
 
@@ -1372,8 +1190,8 @@ def Get_circlize_plot(multi_level_detection, output_prefix, pwd_candidates_file_
             each_split = each.strip().split('\t')
             Gene_1 = each_split[0]
             Gene_2 = each_split[1]
-            Genome_1 = '_'.join(Gene_1.split('_')[:-1])
-            Genome_2 = '_'.join(Gene_2.split('_')[:-1])
+            Genome_1 = get_genome_name(Gene_1)
+            Genome_2 = get_genome_name(Gene_2)
 
             if Genome_1 in genome_to_taxon_dict:
                 Genome_1_taxon = '_'.join(genome_to_taxon_dict[Genome_1].split(' '))
@@ -1399,8 +1217,8 @@ def Get_circlize_plot(multi_level_detection, output_prefix, pwd_candidates_file_
             transfers.append(Direction)
 
 
-    tmp1 = open(pwd_cir_plot_t1, 'w')
     all_group_id = []
+    transfer_count = {}
     for each_t in transfers:
         each_t_split = each_t.split('-->')
         donor = each_t_split[0]
@@ -1411,36 +1229,8 @@ def Get_circlize_plot(multi_level_detection, output_prefix, pwd_candidates_file_
             all_group_id.append(donor_id)
         if recipient_id not in all_group_id:
             all_group_id.append(recipient_id)
-        tmp1.write('%s,%s\n' % (donor_id, recipient_id))
-
-    tmp1.close()
-
-    os.system('cat %s | sort > %s' % (pwd_cir_plot_t1, pwd_cir_plot_t1_sorted))
-
-    current_t = ''
-    count = 0
-    tmp2 = open(pwd_cir_plot_t1_sorted_count, 'w')
-    for each_t2 in open(pwd_cir_plot_t1_sorted):
-        each_t2 = each_t2.strip()
-        if current_t == '':
-            current_t = each_t2
-            count += 1
-        elif current_t == each_t2:
-            count += 1
-        elif current_t != each_t2:
-            tmp2.write('%s,%s\n' % (current_t, count))
-            current_t = each_t2
-            count = 1
-    tmp2.write('%s,%s\n' % (current_t, count))
-    tmp2.close()
-
-    # read in count as dict
-    transfer_count = {}
-    for each_3 in open(pwd_cir_plot_t1_sorted_count):
-        each_3_split = each_3.strip().split(',')
-        key = '%s,%s' % (each_3_split[0], each_3_split[1])
-        value = each_3_split[2]
-        transfer_count[key] = value
+        transfer_key = '%s,%s' % (donor_id, recipient_id)
+        transfer_count[transfer_key] = transfer_count.get(transfer_key, 0) + 1
 
     all_group_id = sorted(all_group_id)
 
@@ -1453,7 +1243,7 @@ def Get_circlize_plot(multi_level_detection, output_prefix, pwd_candidates_file_
             if current_key not in transfer_count:
                 row.append('0')
             else:
-                row.append(transfer_count[current_key])
+                row.append(str(transfer_count[current_key]))
         matrix_file.write('\t'.join(row) + '\n')
     matrix_file.close()
 
@@ -1465,17 +1255,9 @@ def Get_circlize_plot(multi_level_detection, output_prefix, pwd_candidates_file_
     else:
         print('Too many groups (>200), plot skipped')
 
-    # rm tmp files
-    os.system('rm %s' % pwd_cir_plot_t1)
-    os.system('rm %s' % pwd_cir_plot_t1_sorted)
-    os.system('rm %s' % pwd_cir_plot_t1_sorted_count)
-
 
 def Get_circlize_plot_customized_grouping(multi_level_detection, output_prefix, pwd_candidates_file_PG_normal_txt, genome_to_group_dict, circos_HGT_R, pwd_plot_circos, pwd_MetaCHIP_op_folder):
 
-    pwd_cir_plot_t1 =              '%s/%s_cir_plot_t1.txt'              % (pwd_MetaCHIP_op_folder, output_prefix)
-    pwd_cir_plot_t1_sorted =       '%s/%s_cir_plot_t1_sorted.txt'       % (pwd_MetaCHIP_op_folder, output_prefix)
-    pwd_cir_plot_t1_sorted_count = '%s/%s_cir_plot_t1_sorted_count.txt' % (pwd_MetaCHIP_op_folder, output_prefix)
     pwd_cir_plot_matrix_filename = '%s/%s_cir_plot_matrix.csv'          % (pwd_MetaCHIP_op_folder, output_prefix)
 
     transfers = []
@@ -1495,8 +1277,8 @@ def Get_circlize_plot_customized_grouping(multi_level_detection, output_prefix,
             transfers.append(Direction)
 
 
-    tmp1 = open(pwd_cir_plot_t1, 'w')
     all_group_id = []
+    transfer_count = {}
     for each_t in transfers:
         each_t_split = each_t.split('-->')
         donor = each_t_split[0]
@@ -1507,36 +1289,8 @@ def Get_circlize_plot_customized_grouping(multi_level_detection, output_prefix,
             all_group_id.append(donor_group)
         if recipient_group not in all_group_id:
             all_group_id.append(recipient_group)
-        tmp1.write('%s,%s\n' % (donor_group, recipient_group))
-
-    tmp1.close()
-
-    os.system('cat %s | sort > %s' % (pwd_cir_plot_t1, pwd_cir_plot_t1_sorted))
-
-    current_t = ''
-    count = 0
-    tmp2 = open(pwd_cir_plot_t1_sorted_count, 'w')
-    for each_t2 in open(pwd_cir_plot_t1_sorted):
-        each_t2 = each_t2.strip()
-        if current_t == '':
-            current_t = each_t2
-            count += 1
-        elif current_t == each_t2:
-            count += 1
-        elif current_t != each_t2:
-            tmp2.write('%s,%s\n' % (current_t, count))
-            current_t = each_t2
-            count = 1
-    tmp2.write('%s,%s\n' % (current_t, count))
-    tmp2.close()
-
-    # read in count as dict
-    transfer_count = {}
-    for each_3 in open(pwd_cir_plot_t1_sorted_count):
-        each_3_split = each_3.strip().split(',')
-        key = '%s,%s' % (each_3_split[0], each_3_split[1])
-        value = each_3_split[2]
-        transfer_count[key] = value
+        transfer_key = '%s,%s' % (donor_group, recipient_group)
+        transfer_count[transfer_key] = transfer_count.get(transfer_key, 0) + 1
 
     all_group_id = sorted(all_group_id)
 
@@ -1549,7 +1303,7 @@ def Get_circlize_plot_customized_grouping(multi_level_detection, output_prefix,
             if current_key not in transfer_count:
                 row.append('0')
             else:
-                row.append(transfer_count[current_key])
+                row.append(str(transfer_count[current_key]))
         matrix_file.write('\t'.join(row) + '\n')
     matrix_file.close()
 
@@ -1557,11 +1311,6 @@ def Get_circlize_plot_customized_grouping(multi_level_detection, output_prefix,
     if len(all_group_id) > 1:
         os.system('Rscript %s -m %s -p %s' % (circos_HGT_R, pwd_cir_plot_matrix_filename, pwd_plot_circos))
 
-    # rm tmp files
-    os.system('rm %s' % pwd_cir_plot_t1)
-    os.system('rm %s' % pwd_cir_plot_t1_sorted)
-    os.system('rm %s' % pwd_cir_plot_t1_sorted_count)
-
 
 def unique_list_elements(list_input):
 
@@ -1697,7 +1446,13 @@ def BP(args, config_dict):
     No_Eb_Check =               args['NoEbCheck']
     keep_quiet =                args['quiet']
     keep_temp =                 args['tmp']
+    homology_search_backend =   args['aligner']
+    resume_mode =               args['resume']
+    identity_sketch_resolution = args['sketch']
+    flanking_blastn_batch_size = args['flkbatch']
 
+    # per-stage wall time, CPU time, memory and I/O
+    run_report = new_run_report('BP', args)
 
     # get path to current script
     flanking_length = flanking_length_kbp * 1000
@@ -1708,7 +1463,7 @@ def BP(args, config_dict):
 
     # check whether executables exist
     pwd_blastn_exe = config_dict['blastn']
-    pwd_blastp_exe =    config_dict['blastp']
+    pwd_makeblastdb_exe = config_dict['makeblastdb']
     pwd_mafft_exe =     config_dict['mafft']
     pwd_fasttree_exe =  config_dict['fasttree']
     circos_HGT_R =      config_dict['circos_HGT_R']
@@ -1716,7 +1471,9 @@ def BP(args, config_dict):
     if platform.system() == 'Darwin':
         pwd_ranger_exe = config_dict['ranger_mac']
 
-    program_list = [pwd_blastn_exe, pwd_ranger_exe, pwd_mafft_exe, pwd_fasttree_exe, pwd_blastp_exe]
+    program_list = [pwd_blastn_exe, pwd_ranger_exe, pwd_mafft_exe, pwd_fasttree_exe] + get_homology_search_program_list(homology_search_backend, 'prot', config_dict)
+    if flanking_blastn_batch_size is not None:
+        program_list.append(pwd_makeblastdb_exe)
     not_detected_programs = []
     for needed_program in program_list:
         if find_executable(needed_program) is None:
@@ -1725,6 +1482,16 @@ def BP(args, config_dict):
         print('%s not detected, program exited!' % ','.join(not_detected_programs))
         exit()
 
+    # identities have 3 decimals, finer sketches would not be more accurate
+    if (identity_sketch_resolution is not None) and not (0.001 <= identity_sketch_resolution <= 100):
+        print('Sketch resolution (-sketch) needs to be between 0.001 and 100, program exited!')
+        exit()
+
+    # blastn reports hits to no more than 500 database sequences (-max_target_seqs) for each query
+    if (flanking_blastn_batch_size is not None) and not (1 <= flanking_blastn_batch_size <= 500):
+        print('Batch size for flanking region blastn (-flkbatch) needs to be between 1 and 500, program exited!')
+        exit()
+
     #################################### find matched grouping file if not provided  ###################################
 
     if grouping_levels is None:
@@ -1776,10 +1543,23 @@ def BP(args, config_dict):
     pwd_blast_result_folder             = '%s/%s'                                       % (MetaCHIP_wd, blast_result_folder)
     pwd_blast_result_filtered_folder    = '%s/%s'                                       % (MetaCHIP_wd, blast_result_filtered_folder)
     pwd_combined_ffn_file               = '%s/%s/%s'                                    % (MetaCHIP_wd, blast_db_folder, combined_ffn_file)
+    pwd_run_report_json                 = '%s/%s_%s_BP_run_report.json'                 % (MetaCHIP_wd, output_prefix, grouping_levels)
+    pwd_run_report_txt                  = '%s/%s_%s_BP_run_report.txt'                  % (MetaCHIP_wd, output_prefix, grouping_levels)
+    pwd_manifest                        = '%s/%s_%s_BP_manifest.txt'                    % (MetaCHIP_wd, output_prefix, grouping_levels)
+    pwd_blastn_hit_num_file             = '%s/%s_%s_blastn_hit_num.txt'                 % (MetaCHIP_wd, output_prefix, specified_ranks_for_PI)
+    pwd_hit_store                       = '%s/%s_%s_hit_store_al%sbp_cov%s'             % (MetaCHIP_wd, output_prefix, grouping_levels, align_len_cutoff, cover_cutoff)
+    pwd_gene_table                      = '%s/%s_%s_gene_table.txt'                     % (MetaCHIP_wd, output_prefix, specified_ranks_for_PI)
 
     if os.path.isdir(pwd_log_folder) is False:
         os.mkdir(pwd_log_folder)
 
+    # tasks completed by previous runs are skipped with -resume, the manifest restarts otherwise
+    manifest_dict = {}
+    if resume_mode is True:
+        manifest_dict = read_manifest(pwd_manifest)
+    elif os.path.isfile(pwd_manifest) is True:
+        os.remove(pwd_manifest)
+
     ############################################### filter blastn results ##############################################
 
     # get ignored rank list
@@ -1797,9 +1577,21 @@ def BP(args, config_dict):
         exit()
 
 
+    # blastn hits filtered during PI (-fuse), unfiltered results were not kept
+    fused_blastn_results = os.path.isfile(pwd_blastn_hit_num_file)
+    if fused_blastn_results is True:
+        fused_cutoff_list, blastn_hit_num_dict = read_blastn_hit_num(pwd_blastn_hit_num_file)
+        if fused_cutoff_list != [str(align_len_cutoff), str(cover_cutoff)]:
+            report_and_log(('Blastn hits were filtered during PI with -al %s -cov %s, please run BP with the same cutoffs, program exited!' % (fused_cutoff_list[0], fused_cutoff_list[1])), pwd_log_file, keep_quiet)
+            exit()
+        blast_result_folder = '%s_%s_blastn_results_filtered_al%sbp_cov%s' % (output_prefix, specified_ranks_for_PI, align_len_cutoff, cover_cutoff)
+        pwd_blast_result_filtered_folder = '%s/%s' % (MetaCHIP_wd, blast_result_folder)
+        blast_result_file_list = ['%s_blastn.tab' % i for i in blastn_hit_num_dict]
+
     # check whether blast results exist
-    blast_result_file_re                = '%s/*.tab' % pwd_blast_result_folder
-    blast_result_file_list              = [os.path.basename(file_name) for file_name in glob.glob(blast_result_file_re)]
+    else:
+        blast_result_file_re            = '%s/*.tab' % pwd_blast_result_folder
+        blast_result_file_list          = [os.path.basename(file_name) for file_name in glob.glob(blast_result_file_re)]
     blast_result_file_list_basename     = [i.split('_blastn.tab')[0] for i in blast_result_file_list]
 
     # exit if no blast result was found
@@ -1826,8 +1618,11 @@ def BP(args, config_dict):
     blast_result_file_list_empty = []
     blast_result_file_list_not_empty = []
     for blast_result_file in blast_result_file_list:
-        pwd_blast_result_file = '%s/%s' % (pwd_blast_result_folder, blast_result_file)
-        blast_result_file_size = os.stat(pwd_blast_result_file).st_size
+        if fused_blastn_results is True:
+            blast_result_file_size = blastn_hit_num_dict[blast_result_file.split('_blastn.tab')[0]][0]
+        else:
+            pwd_blast_result_file = '%s/%s' % (pwd_blast_result_folder, blast_result_file)
+            blast_result_file_size = os.stat(pwd_blast_result_file).st_size
         if blast_result_file_size == 0:
             blast_result_file_list_empty.append(blast_result_file)
         if blast_result_file_size > 0:
@@ -1854,13 +1649,19 @@ def BP(args, config_dict):
         if len(blast_result_filtered_file_list) == len(ffn_file_list):
             filtered_blast_results_found = True
 
-    if filtered_blast_results_found is True:
+    # with -resume, only results recorded in the manifest are reused, files of an interrupted run might be incomplete
+    if fused_blastn_results is True:
+        report_and_log(('Blastn hits were filtered during PI (-fuse), filtration step skipped.'), pwd_log_file, keep_quiet)
+    elif (filtered_blast_results_found is True) and (resume_mode is False):
         report_and_log(('Filtered blastn results detected, filtration step skipped.'), pwd_log_file, keep_quiet)
     else:
         report_and_log(('Filtering blastn results with the following criteria: Query genome != Subject genome, Alignment length >= %sbp and coverage >= %s%s.' % (align_len_cutoff, cover_cutoff, '%')), pwd_log_file, keep_quiet)
 
         # create folder
-        force_create_folder(pwd_blast_result_filtered_folder)
+        if resume_mode is False:
+            force_create_folder(pwd_blast_result_filtered_folder)
+        elif os.path.isdir(pwd_blast_result_filtered_folder) is False:
+            os.mkdir(pwd_blast_result_filtered_folder)
 
         # filter blastn results with multiprocessing
         list_for_multiple_arguments_filter_blast_results = []
@@ -1868,48 +1669,249 @@ def BP(args, config_dict):
             pwd_blast_result_file = '%s/%s' % (pwd_blast_result_folder, blast_result_file)
             blast_result_filtered_file = '%s_filtered.tab' % ('.'.join(blast_result_file.split('.')[:-1]))
             pwd_blast_result_filtered_file = '%s/%s' % (pwd_blast_result_filtered_folder, blast_result_filtered_file)
-            list_for_multiple_arguments_filter_blast_results.append([pwd_blast_result_file, align_len_cutoff, cover_cutoff, pwd_blast_result_filtered_file])
+            filter_fingerprint = get_fingerprint([pwd_blast_result_file], [align_len_cutoff, cover_cutoff])
+            if is_task_done(manifest_dict, 'filter_blast_results', blast_result_file, filter_fingerprint, [pwd_blast_result_filtered_file]) is False:
+                list_for_multiple_arguments_filter_blast_results.append([filter_blast_results_worker, [pwd_blast_result_file, align_len_cutoff, cover_cutoff, pwd_blast_result_filtered_file], pwd_manifest, 'filter_blast_results', blast_result_file, filter_fingerprint])
+
+        if resume_mode is True:
+            report_and_log(('Resume: filtered blastn results of %s genomes found.' % (len(blast_result_file_list) - len(list_for_multiple_arguments_filter_blast_results))), pwd_log_file, keep_quiet)
 
         # filter_blast_results with multiprocessing
+        start_stage(run_report, 'Filter blastn results', len(list_for_multiple_arguments_filter_blast_results))
         pool = mp.Pool(processes=num_threads)
-        pool.map(filter_blast_results_worker, list_for_multiple_arguments_filter_blast_results)
+        pool.map(checkpoint_worker, list_for_multiple_arguments_filter_blast_results)
         pool.close()
         pool.join()
 
+    ################################################# build hit store ##################################################
+
+    # filtered blastn hits are converted once into a columnar store shared by all ranks
+    report_and_log(('Converting filtered blastn results into a columnar hit store.'), pwd_log_file, keep_quiet)
+
+    if (resume_mode is False) or (os.path.isdir(pwd_hit_store) is False):
+        force_create_folder(pwd_hit_store)
+
+    # genes are interned with the genome table written by PI, working directories prepared by earlier versions
+    # have no gene table, genomes are sorted by name in the same way
+    if os.path.isfile(pwd_gene_table) is True:
+        hit_store_genome_list = read_gene_table(pwd_gene_table)[0]
+    else:
+        hit_store_genome_list = sorted(ffn_file_list_basename)
+    genome_to_index_dict = {hit_store_genome_list[i]: i for i in range(len(hit_store_genome_list))}
+    write_genome_table(pwd_hit_store, hit_store_genome_list)
+
+    list_for_multiple_arguments_build_hit_store = []
+    hit_store_partition_set = set()
+    for pwd_filtered_blast_result in glob.glob('%s/*_blastn_filtered.tab' % pwd_blast_result_filtered_folder):
+        genome_id = os.path.basename(pwd_filtered_blast_result).split('_blastn_filtered.tab')[0]
+        if genome_id in genome_to_index_dict:
+            hit_store_partition_set.add(genome_id)
+            pwd_hit_partition = '%s/%s' % (pwd_hit_store, genome_id)
+            hit_store_fingerprint = get_fingerprint([pwd_filtered_blast_result, '%s/%s.ffn' % (pwd_prodigal_output_folder, genome_id)], hit_store_genome_list)
+            if is_task_done(manifest_dict, 'hit_store', genome_id, hit_store_fingerprint, ['%s/identity.npy' % pwd_hit_partition]) is False:
+                list_for_multiple_arguments_build_hit_store.append([build_hit_store_worker, [pwd_filtered_blast_result, genome_to_index_dict, pwd_hit_partition], pwd_manifest, 'hit_store', genome_id, hit_store_fingerprint])
+
+    start_stage(run_report, 'Build hit store', len(list_for_multiple_arguments_build_hit_store))
+    pool = mp.Pool(processes=num_threads)
+    pool.map(checkpoint_worker, list_for_multiple_arguments_build_hit_store)
+    pool.close()
+    pool.join()
+
+
+    ######################################## perform BM detection at all ranks #########################################
+
+    # grouping of all ranks is read first, hits in the hit store are then scanned once for the group-to-group
+    # identities of all ranks and once for the BM candidates of all ranks, per-rank outputs stay the same
+    BM_rank_list = [i for i in grouping_levels if i not in ignored_rank_list]
+    rank_to_BM_dict = {}
+    customized_group_num = 0
+    for grouping_level in BM_rank_list:
+
+        # read in grouping information
+        pwd_grouping_file = ''
+        group_num = 0
+        if grouping_file is None:
+            grouping_file_re = '%s/%s_grouping_%s*.txt' % (MetaCHIP_wd, output_prefix, grouping_level)
+            grouping_file_list = [os.path.basename(file_name) for file_name in glob.glob(grouping_file_re)]
+            if len(grouping_file_list) == 1:
+                detected_grouping_file = grouping_file_list[0]
+                pwd_grouping_file = '%s/%s' % (MetaCHIP_wd, detected_grouping_file)
+                group_num = get_number_of_group(pwd_grouping_file)
+                report_and_log(('Detect HGT among %s: input genomes were clustered into %s %s.' % (rank_abbre_dict_plural[grouping_level], group_num, rank_abbre_dict_plural[grouping_level])), pwd_log_file, keep_quiet)
+
+            elif len(grouping_file_list) == 0:
+                report_and_log(('Detect HGT among %s: no grouping file at %s level found, program exited.' % (rank_abbre_dict_plural[grouping_level], rank_abbre_dict[grouping_level])), pwd_log_file, keep_quiet)
+                exit()
+
+            else:
+                report_and_log(('Detect HGT among %s: multiple grouping file at %s level found, program exited.' % (rank_abbre_dict_plural[grouping_level], rank_abbre_dict[grouping_level])), pwd_log_file, keep_quiet)
+                exit()
+
+        else:  # with provided grouping file
+            pwd_grouping_file = grouping_file
+            group_num = get_number_of_group(pwd_grouping_file)
+
+            customized_group_num = group_num
+
+        MetaCHIP_op_folder                          = '%s_HGT_ip%s_al%sbp_c%s_ei%s_f%skbp_%s%s'         % (output_prefix, str(identity_percentile), str(align_len_cutoff), str(cover_cutoff),str(end_match_identity_cutoff), flanking_length_kbp, grouping_level, group_num)
+        blast_result_filtered_folder_g2g            = '%s_%s%s_1_blastn_results_filtered_g2g'           % (output_prefix, grouping_level, group_num)
+        grouping_file_with_id_filename              = '%s_%s%s_grouping_with_id.txt'                    % (output_prefix, grouping_level, group_num)
+        blast_result_filtered_folder_with_group     = '%s_%s%s_2_blastn_results_filtered_with_group'    % (output_prefix, grouping_level, group_num)
+        blast_result_filtered_folder_in_one_line    = '%s_%s%s_3_blastn_results_filtered_in_one_line'   % (output_prefix, grouping_level, group_num)
+        op_candidates_only_gene_folder_name         = '%s_%s%s_4_HGTs_only_id'                          % (output_prefix, grouping_level, group_num)
+        op_candidates_with_group_folder_name        = '%s_%s%s_5_HGTs_with_group'                       % (output_prefix, grouping_level, group_num)
+
+        pwd_MetaCHIP_op_folder                          = '%s/%s'       % (MetaCHIP_wd, MetaCHIP_op_folder)
+        pwd_blast_result_filtered_folder_g2g            = '%s/%s/%s'    % (MetaCHIP_wd, MetaCHIP_op_folder, blast_result_filtered_folder_g2g)
+        pwd_grouping_file_with_id                       = '%s/%s/%s'    % (MetaCHIP_wd, MetaCHIP_op_folder, grouping_file_with_id_filename)
+        pwd_blast_result_filtered_folder_with_group     = '%s/%s/%s'    % (MetaCHIP_wd, MetaCHIP_op_folder, blast_result_filtered_folder_with_group)
+        pwd_blast_result_filtered_folder_in_one_line    = '%s/%s/%s'    % (MetaCHIP_wd, MetaCHIP_op_folder, blast_result_filtered_folder_in_one_line)
+        pwd_op_candidates_with_group_folder             = '%s/%s/%s'    % (MetaCHIP_wd, MetaCHIP_op_folder, op_candidates_with_group_folder_name)
+        pwd_op_candidates_only_gene_folder              = '%s/%s/%s'    % (MetaCHIP_wd, MetaCHIP_op_folder, op_candidates_only_gene_folder_name)
+
+        # gene trees and Ranger-DTL results in the output folder are reused with -resume
+        if (resume_mode is False) or (os.path.isdir(pwd_MetaCHIP_op_folder) is False):
+            force_create_folder(pwd_MetaCHIP_op_folder)
+
+        # create folder
+        force_create_folder(pwd_blast_result_filtered_folder_g2g)
+        force_create_folder(pwd_blast_result_filtered_folder_with_group)
+        force_create_folder(pwd_blast_result_filtered_folder_in_one_line)
+        force_create_folder(pwd_op_candidates_with_group_folder)
+        force_create_folder(pwd_op_candidates_only_gene_folder)
+
+        # index grouping file
+        index_grouping_file(pwd_grouping_file, pwd_grouping_file_with_id)
+
+        # create genome_group_dict and genome_list
+        qualified_genome_list = []
+        name_to_group_number_dict = {}
+        name_to_group_dict = {}
+        for each_bin in open(pwd_grouping_file_with_id):
+            each_bin_split = each_bin.strip().split(',')
+            bin_name = each_bin_split[1]
+            bin_group_number = each_bin_split[0]
+            bin_group = bin_group_number.split('_')[0]
+            qualified_genome_list.append(bin_name)
+            name_to_group_number_dict[bin_name] = bin_group_number
+            name_to_group_dict[bin_name] = bin_group
+
+        # group of genomes in the hit store genome table
+        group_id_list = []
+        group_to_index_dict = {}
+        genome_to_group_index_array = np.full(len(hit_store_genome_list), -1, dtype=np.int32)
+        genome_to_group_number_list = [None] * len(hit_store_genome_list)
+        for bin_name in qualified_genome_list:
+            bin_group = name_to_group_dict[bin_name]
+            if bin_group not in group_to_index_dict:
+                group_to_index_dict[bin_group] = len(group_id_list)
+                group_id_list.append(bin_group)
+            if bin_name in genome_to_index_dict:
+                genome_to_group_index_array[genome_to_index_dict[bin_name]] = group_to_index_dict[bin_group]
+                genome_to_group_number_list[genome_to_index_dict[bin_name]] = name_to_group_number_dict[bin_name]
+
+        rank_to_BM_dict[grouping_level] = {'pwd_grouping_file':                             pwd_grouping_file,
+                                           'group_num':                                     group_num,
+                                           'name_to_group_number_dict':                     name_to_group_number_dict,
+                                           'group_id_list':                                 group_id_list,
+                                           'genome_to_group_index_array':                   genome_to_group_index_array,
+                                           'genome_to_group_number_list':                   genome_to_group_number_list,
+                                           'pwd_blast_result_filtered_folder_g2g':          pwd_blast_result_filtered_folder_g2g,
+                                           'pwd_blast_result_filtered_folder_with_group':   pwd_blast_result_filtered_folder_with_group,
+                                           'pwd_blast_result_filtered_folder_in_one_line':  pwd_blast_result_filtered_folder_in_one_line,
+                                           'pwd_op_candidates_with_group_folder':           pwd_op_candidates_with_group_folder,
+                                           'pwd_op_candidates_only_gene_folder':            pwd_op_candidates_only_gene_folder}
+
+    # genomes with hits grouped at one or more ranks
+    BM_genome_list = [i for i in hit_store_genome_list if (i in hit_store_partition_set) and (True in [rank_to_BM_dict[j]['genome_to_group_number_list'][genome_to_index_dict[i]] is not None for j in BM_rank_list])]
+
+    report_and_log(('Detect HGT among %s: Best-match approach.' % ', '.join([rank_abbre_dict_plural[i] for i in BM_rank_list])), pwd_log_file, keep_quiet)
+
+    ########################################### get group-to-group identities ##########################################
+
+    report_and_log(('Get group-to-group identities at all ranks with %s cores.' % num_threads), pwd_log_file, keep_quiet)
+    start_stage(run_report, 'BM group-to-group identities (%s)' % ''.join(BM_rank_list))
+
+    list_for_multiple_arguments_get_g2g_identities = []
+    for genome_id in BM_genome_list:
+        rank_qualified_iden_file_g2g_list = []
+        for grouping_level in BM_rank_list:
+            if rank_to_BM_dict[grouping_level]['genome_to_group_number_list'][genome_to_index_dict[genome_id]] is None:
+                rank_qualified_iden_file_g2g_list.append(None)
+            else:
+                rank_qualified_iden_file_g2g_list.append('%s/%s_blastn_filtered_g2g' % (rank_to_BM_dict[grouping_level]['pwd_blast_result_filtered_folder_g2g'], genome_id))
+
+        list_for_multiple_arguments_get_g2g_identities.append(['%s/%s' % (pwd_hit_store, genome_id),
+                                                               genome_to_index_dict[genome_id],
+                                                               [rank_to_BM_dict[i]['genome_to_group_index_array'] for i in BM_rank_list],
+                                                               [len(rank_to_BM_dict[i]['group_id_list']) for i in BM_rank_list],
+                                                               rank_qualified_iden_file_g2g_list,
+                                                               identity_sketch_resolution])
+
+    # get group-to-group identities with multiprocessing
+    pool = mp.Pool(processes=num_threads)
+    pool.map(get_g2g_identities_worker, list_for_multiple_arguments_get_g2g_identities)
+    pool.close()
+    pool.join()
+
+    ##################################### get cutoff according to specified percentile #################################
+
+    for rank_index in range(len(BM_rank_list)):
+        grouping_level = BM_rank_list[rank_index]
+        pwd_qualified_iden_file_g2g_list = [i[4][rank_index] for i in list_for_multiple_arguments_get_g2g_identities if i[4][rank_index] is not None]
+        rank_to_BM_dict[grouping_level]['group_pair_iden_cutoff_dict'] = get_g2g_identity_cutoff(pwd_qualified_iden_file_g2g_list, rank_to_BM_dict[grouping_level]['group_id_list'], identity_percentile, identity_sketch_resolution)
+
+    ############################### add group to blast hits and put subjects in one line ###############################
+
+    report_and_log(('Analyzing Blast hits at all ranks with %s cores.' % num_threads), pwd_log_file, keep_quiet)
+    start_stage(run_report, 'BM candidates (%s)' % ''.join(BM_rank_list))
+
+    list_for_multiple_arguments_get_HGT = []
+    for genome_id in BM_genome_list:
+        filtered_blast_result = '%s_blastn_filtered' % genome_id
+        rank_argument_list = []
+        for grouping_level in BM_rank_list:
+            rank_BM_dict = rank_to_BM_dict[grouping_level]
+            if rank_BM_dict['genome_to_group_number_list'][genome_to_index_dict[genome_id]] is None:
+                rank_argument_list.append(None)
+            else:
+                pwd_filtered_blast_result_with_group    = '%s/%s_with_group_sorted.tab'     % (rank_BM_dict['pwd_blast_result_filtered_folder_with_group'], filtered_blast_result)
+                pwd_filtered_blast_result_in_one_line   = '%s/%s_subjects_in_one_line.tab'  % (rank_BM_dict['pwd_blast_result_filtered_folder_in_one_line'], filtered_blast_result)
+                pwd_hgt_candidates_with_group           = '%s/%s_HGTs_with_group.txt'       % (rank_BM_dict['pwd_op_candidates_with_group_folder'], genome_id)
+                pwd_hgt_candidates_only_gene            = '%s/%s_HGTs_only_gene.txt'        % (rank_BM_dict['pwd_op_candidates_only_gene_folder'], genome_id)
+                rank_argument_list.append([rank_BM_dict['genome_to_group_number_list'],
+                                           pwd_filtered_blast_result_with_group,
+                                           pwd_filtered_blast_result_in_one_line,
+                                           pwd_hgt_candidates_with_group,
+                                           pwd_hgt_candidates_only_gene,
+                                           rank_BM_dict['group_pair_iden_cutoff_dict']])
+
+        list_for_multiple_arguments_get_HGT.append(['%s/%s' % (pwd_hit_store, genome_id),
+                                                    genome_to_index_dict[genome_id],
+                                                    hit_store_genome_list,
+                                                    rank_argument_list,
+                                                    config_dict['sort_buffer_size'],
+                                                    config_dict['sort_spill_dir']])
+
+    # add group to blast hits with multiprocessing
+    pool = mp.Pool(processes=num_threads)
+    pool.map(get_HGT_worker, list_for_multiple_arguments_get_HGT)
+    pool.close()
+    pool.join()
+
+
     ############################################## perform HGT detection ###############################################
 
     # perform BM and PG approaches at all specified taxonomic ranks
     ploted_flk_plot_list = []
-    customized_group_num = 0
     for grouping_level in grouping_levels:
 
         if grouping_level not in ignored_rank_list:
 
-            # read in grouping information
-            pwd_grouping_file = ''
-            group_num = 0
-            if grouping_file is None:
-                grouping_file_re = '%s/%s_grouping_%s*.txt' % (MetaCHIP_wd, output_prefix, grouping_level)
-                grouping_file_list = [os.path.basename(file_name) for file_name in glob.glob(grouping_file_re)]
-                if len(grouping_file_list) == 1:
-                    detected_grouping_file = grouping_file_list[0]
-                    pwd_grouping_file = '%s/%s' % (MetaCHIP_wd, detected_grouping_file)
-                    group_num = get_number_of_group(pwd_grouping_file)
-                    report_and_log(('Detect HGT among %s: input genomes were clustered into %s %s.' % (rank_abbre_dict_plural[grouping_level], group_num, rank_abbre_dict_plural[grouping_level])), pwd_log_file, keep_quiet)
-
-                elif len(grouping_file_list) == 0:
-                    report_and_log(('Detect HGT among %s: no grouping file at %s level found, program exited.' % (rank_abbre_dict_plural[grouping_level], rank_abbre_dict[grouping_level])), pwd_log_file, keep_quiet)
-                    exit()
-
-                else:
-                    report_and_log(('Detect HGT among %s: multiple grouping file at %s level found, program exited.' % (rank_abbre_dict_plural[grouping_level], rank_abbre_dict[grouping_level])), pwd_log_file, keep_quiet)
-                    exit()
-
-            else:  # with provided grouping file
-                pwd_grouping_file = grouping_file
-                group_num = get_number_of_group(pwd_grouping_file)
-
-                customized_group_num = group_num
+            # grouping information read before BM detection
+            pwd_grouping_file = rank_to_BM_dict[grouping_level]['pwd_grouping_file']
+            group_num = rank_to_BM_dict[grouping_level]['group_num']
+            name_to_group_number_dict = rank_to_BM_dict[grouping_level]['name_to_group_number_dict']
 
 
             ############################################# define file/folder names #############################################
@@ -1917,8 +1919,6 @@ def BP(args, config_dict):
             MetaCHIP_op_folder                          = '%s_HGT_ip%s_al%sbp_c%s_ei%s_f%skbp_%s%s'         % (output_prefix, str(identity_percentile), str(align_len_cutoff), str(cover_cutoff),str(end_match_identity_cutoff), flanking_length_kbp, grouping_level, group_num)
             blast_result_filtered_folder_g2g            = '%s_%s%s_1_blastn_results_filtered_g2g'           % (output_prefix, grouping_level, group_num)
             grouping_file_with_id_filename              = '%s_%s%s_grouping_with_id.txt'                    % (output_prefix, grouping_level, group_num)
-            qual_idens_file_gg                          = '%s_%s%s_qualified_iden_gg.txt'                   % (output_prefix, grouping_level, group_num)
-            qual_idens_file_gg_sorted                   = '%s_%s%s_qualified_iden_gg_sorted.txt'            % (output_prefix, grouping_level, group_num)
             blast_result_filtered_folder_with_group     = '%s_%s%s_2_blastn_results_filtered_with_group'    % (output_prefix, grouping_level, group_num)
             blast_result_filtered_folder_in_one_line    = '%s_%s%s_3_blastn_results_filtered_in_one_line'   % (output_prefix, grouping_level, group_num)
             op_candidates_only_gene_folder_name         = '%s_%s%s_4_HGTs_only_id'                          % (output_prefix, grouping_level, group_num)
@@ -1949,8 +1949,6 @@ def BP(args, config_dict):
             pwd_MetaCHIP_op_folder                          = '%s/%s'       % (MetaCHIP_wd, MetaCHIP_op_folder)
             pwd_blast_result_filtered_folder_g2g            = '%s/%s/%s'    % (MetaCHIP_wd, MetaCHIP_op_folder, blast_result_filtered_folder_g2g)
             pwd_grouping_file_with_id                       = '%s/%s/%s'    % (MetaCHIP_wd, MetaCHIP_op_folder, grouping_file_with_id_filename)
-            pwd_qual_iden_file_gg                           = '%s/%s/%s'    % (MetaCHIP_wd, MetaCHIP_op_folder, qual_idens_file_gg)
-            pwd_qual_iden_file_gg_sorted                    = '%s/%s/%s'    % (MetaCHIP_wd, MetaCHIP_op_folder, qual_idens_file_gg_sorted)
             pwd_blast_result_filtered_folder_with_group     = '%s/%s/%s'    % (MetaCHIP_wd, MetaCHIP_op_folder, blast_result_filtered_folder_with_group)
             pwd_blast_result_filtered_folder_in_one_line    = '%s/%s/%s'    % (MetaCHIP_wd, MetaCHIP_op_folder, blast_result_filtered_folder_in_one_line)
             pwd_op_candidates_with_group_folder             = '%s/%s/%s'    % (MetaCHIP_wd, MetaCHIP_op_folder, op_candidates_with_group_folder_name)
@@ -1978,145 +1976,10 @@ def BP(args, config_dict):
             pwd_HGT_query_to_subjects_file                  = '%s/%s/%s'    % (MetaCHIP_wd, MetaCHIP_op_folder, HGT_query_to_subjects_filename)
             pwd_newick_tree_file                            = '%s/%s'       % (MetaCHIP_wd, newick_tree_file)
 
-            force_create_folder(pwd_MetaCHIP_op_folder)
-
-
-            ####################################################################################################################
-
-            # index grouping file
-            index_grouping_file(pwd_grouping_file, pwd_grouping_file_with_id)
-
-            # create genome_group_dict and genome_list
-            qualified_genome_list = []
-            name_to_group_number_dict = {}
-            name_to_group_dict = {}
-            for each_bin in open(pwd_grouping_file_with_id):
-                each_bin_split = each_bin.strip().split(',')
-                bin_name = each_bin_split[1]
-                bin_group_number = each_bin_split[0]
-                bin_group = bin_group_number.split('_')[0]
-                qualified_genome_list.append(bin_name)
-                name_to_group_number_dict[bin_name] = bin_group_number
-                name_to_group_dict[bin_name] = bin_group
-
-
             ############################################################################################################
             ################################## perform HGT detection with BM approach ##################################
             ############################################################################################################
 
-            report_and_log(('Detect HGT among %s: Best-match approach.' % rank_abbre_dict_plural[grouping_level]), pwd_log_file, keep_quiet)
-
-            ########################################### get group-to-group identities ##########################################
-
-            os.mkdir(pwd_blast_result_filtered_folder_g2g)
-
-            report_and_log(('Detect HGT among %s: get group-to-group identities with %s cores.' % (rank_abbre_dict_plural[grouping_level], num_threads)), pwd_log_file, keep_quiet)
-
-            # create folder
-            force_create_folder(pwd_blast_result_filtered_folder_g2g)
-
-            # get file list
-            blast_result_filtered_file_re = '%s/*_filtered.tab' % pwd_blast_result_filtered_folder
-            blast_result_filtered_file_list = [os.path.basename(file_name) for file_name in glob.glob(blast_result_filtered_file_re)]
-
-            list_for_multiple_arguments_get_g2g_identities = []
-            for filtered_blast_result in blast_result_filtered_file_list:
-                genome_id = filtered_blast_result.split('_blastn_filtered.tab')[0]
-                if genome_id in qualified_genome_list:
-                    pwd_filtered_blast_result = '%s/%s' % (pwd_blast_result_filtered_folder, filtered_blast_result)
-                    pwd_filtered_blast_result_g2g = '%s/%s_g2g.tab' % (pwd_blast_result_filtered_folder_g2g, filtered_blast_result.split('.tab')[0])
-                    list_for_multiple_arguments_get_g2g_identities.append([pwd_filtered_blast_result, qualified_genome_list, name_to_group_number_dict, pwd_filtered_blast_result_g2g])
-
-            # get group-to-group identities with multiprocessing
-            pool = mp.Pool(processes=num_threads)
-            pool.map(get_g2g_identities_worker, list_for_multiple_arguments_get_g2g_identities)
-            pool.close()
-            pool.join()
-
-            # combine g2g_files and sort it
-            os.system('cat %s/*_g2g.tab > %s' % (pwd_blast_result_filtered_folder_g2g, pwd_qual_iden_file_gg))
-            os.system('cat %s | sort > %s' % (pwd_qual_iden_file_gg, pwd_qual_iden_file_gg_sorted))
-
-
-            ###########################################  get cutoff according to specified percentile ###########################################
-
-            # get identities for each group pair and get group_pair to identity dict
-            current_group_pair_name = ''
-            current_group_pair_identities = []
-            group_pair_iden_cutoff_dict = {}
-            for each_identity_g in open(pwd_qual_iden_file_gg_sorted):
-                each_identity_g_split = each_identity_g.strip().split('\t')
-                group_pair = each_identity_g_split[0]
-                identity = float(each_identity_g_split[1])
-                group_pair_split = group_pair.split('_')
-                group_pair_swapped = '%s_%s' % (group_pair_split[1], group_pair_split[0])
-                if current_group_pair_name == '':
-                    current_group_pair_name = group_pair
-                    current_group_pair_identities.append(identity)
-                else:
-                    if (group_pair == current_group_pair_name) or (group_pair_swapped == current_group_pair_name):
-                        current_group_pair_identities.append(identity)
-                    else:
-                        # get group_pair to identity dict and identity cut off for defined percentile
-                        current_group_pair_identities_array = np.array(current_group_pair_identities)
-                        current_group_pair_identity_cut_off = np.percentile(current_group_pair_identities_array,identity_percentile)
-                        current_group_pair_identity_cut_off = float("{0:.2f}".format(current_group_pair_identity_cut_off))
-                        current_group_pair_name_split = current_group_pair_name.split('_')
-                        current_group_pair_name_swapped = '%s_%s' % (current_group_pair_name_split[1], current_group_pair_name_split[0])
-                        group_pair_iden_cutoff_dict[current_group_pair_name] = current_group_pair_identity_cut_off
-                        group_pair_iden_cutoff_dict[current_group_pair_name_swapped] = current_group_pair_identity_cut_off
-
-                        # reset
-                        current_group_pair_name = group_pair
-                        current_group_pair_identities = []
-                        current_group_pair_identities.append(identity)
-
-            # for the last group
-            current_group_pair_identities_array = np.array(current_group_pair_identities)
-            current_group_pair_identity_cut_off = np.percentile(current_group_pair_identities_array, identity_percentile)
-            current_group_pair_identity_cut_off = float("{0:.2f}".format(current_group_pair_identity_cut_off))
-            current_group_pair_name_split = current_group_pair_name.split('_')
-            current_group_pair_name_swapped = '%s_%s' % (current_group_pair_name_split[1], current_group_pair_name_split[0])
-            group_pair_iden_cutoff_dict[current_group_pair_name] = current_group_pair_identity_cut_off
-            group_pair_iden_cutoff_dict[current_group_pair_name_swapped] = current_group_pair_identity_cut_off
-
-
-            ############################### add group to blast hits and put subjects in one line ###############################
-
-            report_and_log(('Detect HGT among %s: analyzing Blast hits with %s cores.' % (rank_abbre_dict_plural[grouping_level], num_threads)), pwd_log_file, keep_quiet)
-
-            # create folder
-            force_create_folder(pwd_blast_result_filtered_folder_with_group)
-            force_create_folder(pwd_blast_result_filtered_folder_in_one_line)
-            force_create_folder(pwd_op_candidates_with_group_folder)
-            force_create_folder(pwd_op_candidates_only_gene_folder)
-
-            list_for_multiple_arguments_get_HGT = []
-            for filtered_blast_result in blast_result_filtered_file_list:
-                genome_id = filtered_blast_result.split('_blastn_filtered.tab')[0]
-                if genome_id in qualified_genome_list:
-                    pwd_filtered_blast_result               = '%s/%s'                           % (pwd_blast_result_filtered_folder, filtered_blast_result)
-                    pwd_filtered_blast_result_with_group    = '%s/%s_with_group_sorted.tab'     % (pwd_blast_result_filtered_folder_with_group, filtered_blast_result.split('.tab')[0])
-                    pwd_filtered_blast_result_in_one_line   = '%s/%s_subjects_in_one_line.tab'  % (pwd_blast_result_filtered_folder_in_one_line, filtered_blast_result.split('.tab')[0])
-                    pwd_hgt_candidates_with_group           = '%s/%s_HGTs_with_group.txt'       % (pwd_op_candidates_with_group_folder, genome_id)
-                    pwd_hgt_candidates_only_gene            = '%s/%s_HGTs_only_gene.txt'        % (pwd_op_candidates_only_gene_folder, genome_id)
-
-                    list_for_multiple_arguments_get_HGT.append([pwd_filtered_blast_result,
-                                                                name_to_group_number_dict,
-                                                                pwd_filtered_blast_result_with_group,
-                                                                pwd_filtered_blast_result_in_one_line,
-                                                                pwd_hgt_candidates_with_group,
-                                                                pwd_hgt_candidates_only_gene,
-                                                                group_pair_iden_cutoff_dict,
-                                                                qualified_genome_list])
-
-            # add group to blast hits with multiprocessing
-            pool = mp.Pool(processes=num_threads)
-            pool.map(get_HGT_worker, list_for_multiple_arguments_get_HGT)
-            pool.close()
-            pool.join()
-
-
             ################################ remove bidirection and add identity to output file ################################
 
             # combine pwd_op_candidates_with_group_file and pwd_op_candidates_only_gene_file
@@ -2138,9 +2001,10 @@ def BP(args, config_dict):
             ############################################### plot flanking region ###############################################
 
             report_and_log(('Detect HGT among %s: plotting flanking regions with %s cores.' % (rank_abbre_dict_plural[grouping_level], num_threads)), pwd_log_file, keep_quiet)
+            start_stage(run_report, 'Flanking plots (%s)' % grouping_level)
 
             # create folder to hold ACT output
-            os.makedirs(pwd_op_act_folder)
+            force_create_folder(pwd_op_act_folder)
             os.makedirs(pwd_normal_folder)
             os.makedirs(pwd_end_match_folder)
             os.makedirs(pwd_full_length_match_folder)
@@ -2149,8 +2013,21 @@ def BP(args, config_dict):
             manager = mp.Manager()
             candidates_2_contig_match_category_dict_mp = manager.dict()
 
+            # index gbk files of genomes annotated by PI versions without the gene coordinate index and contig store
+            candidate_genome_list = sorted({get_genome_name(j) for i in open(pwd_op_candidates_only_gene_file_uniq) for j in i.split('\t')[:2]})
+            for each_genome in candidate_genome_list:
+                if (os.path.isfile('%s/%s.npz' % (pwd_prodigal_output_folder, each_genome)) is False) or (os.path.isfile('%s/%s.fna.fai' % (pwd_prodigal_output_folder, each_genome)) is False):
+                    index_gbk_file('%s/%s.gbk' % (pwd_prodigal_output_folder, each_genome), '%s/%s.npz' % (pwd_prodigal_output_folder, each_genome), '%s/%s.fna' % (pwd_prodigal_output_folder, each_genome))
+
+            # with -flkbatch, each worker gets a batch of candidates
+            match_list = open(pwd_op_candidates_only_gene_file_uniq).readlines()
+            flanking_region_worker = get_gbk_blast_act2
+            if flanking_blastn_batch_size is not None:
+                match_list = [match_list[i:i + flanking_blastn_batch_size] for i in range(0, len(match_list), flanking_blastn_batch_size)]
+                flanking_region_worker = get_gbk_blast_act2_batch
+
             list_for_multiple_arguments_flanking_regions = []
-            for match in open(pwd_op_candidates_only_gene_file_uniq):
+            for match in match_list:
                 list_for_multiple_arguments_flanking_regions.append([match,
                                                                      pwd_prodigal_output_folder,
                                                                      flanking_length,
@@ -2164,10 +2041,11 @@ def BP(args, config_dict):
                                                                      keep_temp,
                                                                      candidates_2_contig_match_category_dict_mp,
                                                                      end_match_identity_cutoff,
-                                                                     No_Eb_Check])
+                                                                     No_Eb_Check,
+                                                                     pwd_makeblastdb_exe])
 
             pool_flanking_regions = mp.Pool(processes=num_threads)
-            pool_flanking_regions.map(get_gbk_blast_act2, list_for_multiple_arguments_flanking_regions)
+            pool_flanking_regions.map(flanking_region_worker, list_for_multiple_arguments_flanking_regions)
             pool_flanking_regions.close()
             pool_flanking_regions.join()
 
@@ -2184,17 +2062,19 @@ def BP(args, config_dict):
 
             ################################################ get BM output file ################################################
 
+            start_stage(run_report, 'BM output (%s)' % grouping_level)
+
             # add at_end information to output file
             BM_output_file_handle = open(pwd_op_candidates_BM, 'w')
             BM_output_file_handle.write('Gene_1\tGene_2\tGene_1_group\tGene_2_group\tIdentity\tend_match\tfull_length_match\n')
             for each_candidate in open(pwd_op_candidates_only_gene_file_uniq):
                 each_candidate_split = each_candidate.strip().split('\t')
                 recipient_gene = each_candidate_split[0]
-                recipient_genome = '_'.join(recipient_gene.split('_')[:-1])
+                recipient_genome = get_genome_name(recipient_gene)
                 recipient_genome_group_id = name_to_group_number_dict[recipient_genome]
                 recipient_genome_group = recipient_genome_group_id.split('_')[0]
                 donor_gene = each_candidate_split[1]
-                donor_genome = '_'.join(donor_gene.split('_')[:-1])
+                donor_genome = get_genome_name(donor_gene)
                 donor_genome_group_id = name_to_group_number_dict[donor_genome]
                 donor_genome_group = donor_genome_group_id.split('_')[0]
                 identity = each_candidate_split[2]
@@ -2252,8 +2132,11 @@ def BP(args, config_dict):
 
             ###################################### store ortholog information into dictionary ######################################
 
+            start_stage(run_report, 'PG input (%s)' % grouping_level)
+
             # create folders
-            force_create_folder(pwd_tree_folder)
+            if (resume_mode is False) or (os.path.isdir(pwd_tree_folder) is False):
+                force_create_folder(pwd_tree_folder)
 
             # get list of match pair list
             candidates_list = []
@@ -2337,43 +2220,67 @@ def BP(args, config_dict):
 
             # for report and log
             report_and_log(('Detect HGT among %s: get species and gene tree for %s BM approach identified HGTs.' % (rank_abbre_dict_plural[grouping_level], len(candidates_list))), pwd_log_file, keep_quiet)
+            start_stage(run_report, 'PG mafft/FastTree (%s)' % grouping_level, len(candidates_list))
+
+            # gene and species trees depend on the candidate pair, the subjects of both genes, their proteins and the SCG tree
+            candidate_to_fingerprint_dict = {}
+            for each_candidate in candidates_list:
+                candidate_gene_list = each_candidate + HGT_query_to_subjects_dict.get(each_candidate[0], []) + HGT_query_to_subjects_dict.get(each_candidate[1], [])
+                candidate_genome_list = sorted(set([get_genome_name(i) for i in candidate_gene_list]))
+                candidate_to_fingerprint_dict['___'.join(each_candidate)] = get_fingerprint([pwd_newick_tree_file] + ['%s/%s.faa' % (pwd_prodigal_output_folder, i) for i in candidate_genome_list],
+                                                                                           candidate_gene_list + [name_to_group_dict.get(i, '') for i in candidate_genome_list] + [homology_search_backend])
 
             # put multiple arguments in list
             list_for_multiple_arguments_extract_gene_tree_seq = []
             for each_to_extract in candidates_list:
-                list_for_multiple_arguments_extract_gene_tree_seq.append([each_to_extract,
-                                                                          pwd_tree_folder,
-                                                                          pwd_combined_faa_file_subset,
-                                                                          pwd_blastp_exe,
-                                                                          pwd_mafft_exe,
-                                                                          pwd_fasttree_exe,
-                                                                          name_to_group_dict,
-                                                                          genome_name_list,
-                                                                          HGT_query_to_subjects_dict,
-                                                                          pwd_newick_tree_file])
+                each_to_extract_concate = '___'.join(each_to_extract)
+                gene_tree_output_list = ['%s/%s_gene_tree.newick' % (pwd_tree_folder, each_to_extract_concate), '%s/%s_species_tree.newick' % (pwd_tree_folder, each_to_extract_concate)]
+                if is_task_done(manifest_dict, 'PG_tree_%s' % grouping_level, each_to_extract_concate, candidate_to_fingerprint_dict[each_to_extract_concate], gene_tree_output_list) is False:
+                    list_for_multiple_arguments_extract_gene_tree_seq.append([extract_gene_tree_seq_worker,
+                                                                              [each_to_extract,
+                                                                               pwd_tree_folder,
+                                                                               pwd_combined_faa_file_subset,
+                                                                               homology_search_backend,
+                                                                               pwd_mafft_exe,
+                                                                               pwd_fasttree_exe,
+                                                                               name_to_group_dict,
+                                                                               genome_name_list,
+                                                                               HGT_query_to_subjects_dict,
+                                                                               pwd_newick_tree_file,
+                                                                               config_dict],
+                                                                              pwd_manifest, 'PG_tree_%s' % grouping_level, each_to_extract_concate, candidate_to_fingerprint_dict[each_to_extract_concate]])
+
+            if resume_mode is True:
+                report_and_log(('Detect HGT among %s: resume, gene trees of %s candidates found.' % (rank_abbre_dict_plural[grouping_level], len(candidates_list) - len(list_for_multiple_arguments_extract_gene_tree_seq))), pwd_log_file, keep_quiet)
+
             pool = mp.Pool(processes=num_threads)
-            pool.map(extract_gene_tree_seq_worker, list_for_multiple_arguments_extract_gene_tree_seq)
+            pool.map(checkpoint_worker, list_for_multiple_arguments_extract_gene_tree_seq)
             pool.close()
             pool.join()
 
             ##################################################### Run Ranger-DTL ###################################################
 
             # prepare folders
-            force_create_folder(pwd_ranger_inputs_folder)
-            force_create_folder(pwd_ranger_outputs_folder)
+            for each_ranger_folder in [pwd_ranger_inputs_folder, pwd_ranger_outputs_folder]:
+                if (resume_mode is False) or (os.path.isdir(each_ranger_folder) is False):
+                    force_create_folder(each_ranger_folder)
 
             # for report and log
             report_and_log(('Detect HGT among %s: running Ranger-DTL2.'% rank_abbre_dict_plural[grouping_level]), pwd_log_file, keep_quiet)
+            start_stage(run_report, 'PG Ranger-DTL (%s)' % grouping_level, len(candidates_list))
 
             # put multiple arguments in list
             list_for_multiple_arguments_Ranger = []
             for each_paired_tree in candidates_list:
-                list_for_multiple_arguments_Ranger.append(
-                    [each_paired_tree, pwd_ranger_inputs_folder, pwd_tree_folder, pwd_ranger_exe,
-                     pwd_ranger_outputs_folder])
+                each_paired_tree_concate = '___'.join(each_paired_tree)
+                ranger_output_list = ['%s/%s_ranger_output.txt' % (pwd_ranger_outputs_folder, each_paired_tree_concate)]
+                if is_task_done(manifest_dict, 'Ranger_%s' % grouping_level, each_paired_tree_concate, candidate_to_fingerprint_dict[each_paired_tree_concate], ranger_output_list) is False:
+                    list_for_multiple_arguments_Ranger.append([Ranger_worker,
+                                                               [each_paired_tree, pwd_ranger_inputs_folder, pwd_tree_folder, pwd_ranger_exe, pwd_ranger_outputs_folder],
+                                                               pwd_manifest, 'Ranger_%s' % grouping_level, each_paired_tree_concate, candidate_to_fingerprint_dict[each_paired_tree_concate]])
 
             pool = mp.Pool(processes=num_threads)
-            pool.map(Ranger_worker, list_for_multiple_arguments_Ranger)
+            pool.map(checkpoint_worker, list_for_multiple_arguments_Ranger)
             pool.close()
             pool.join()
 
@@ -2381,6 +2288,7 @@ def BP(args, config_dict):
 
             # for report and log
             report_and_log(('Detect HGT among %s: parsing Ranger-DTL2 outputs.' % rank_abbre_dict_plural[grouping_level]), pwd_log_file, keep_quiet)
+            start_stage(run_report, 'PG output (%s)' % grouping_level)
 
             candidate_2_predictions_dict = {}
             candidate_2_possible_direction_dict = {}
@@ -2416,7 +2324,7 @@ def BP(args, config_dict):
                     candidate_split_gene = each_ranger_prediction_concate.split('___')
                     candidate_split_gene_only_genome = []
                     for each_candidate in candidate_split_gene:
-                        each_candidate_genome = '_'.join(each_candidate.split('_')[:-1])
+                        each_candidate_genome = get_genome_name(each_candidate)
                         candidate_split_gene_only_genome.append(each_candidate_genome)
 
                     possible_hgt_1 = '%s-->%s' % (
@@ -2485,8 +2393,6 @@ def BP(args, config_dict):
 
                 os.remove(pwd_HGT_query_to_subjects_file)
                 os.remove(pwd_subjects_in_one_line)
-                os.remove(pwd_qual_iden_file_gg)
-                os.remove(pwd_qual_iden_file_gg_sorted)
                 os.remove(pwd_op_candidates_with_group_file)
                 os.remove(pwd_op_candidates_only_gene_file)
                 os.remove(pwd_op_candidates_only_gene_file_uniq)
@@ -2494,10 +2400,17 @@ def BP(args, config_dict):
                 os.remove(pwd_combined_faa_file_subset)
 
 
+    # the hit store is shared by all ranks
+    if keep_temp is False:
+        shutil.rmtree(pwd_hit_store, ignore_errors=True)
+
+
     ####################################################################################################################
     ########################################### combine BM and PG predictions ##########################################
     ####################################################################################################################
 
+    start_stage(run_report, 'Combine predictions')
+
     if grouping_file is not None:
 
         multi_level_detection = False
@@ -2535,8 +2448,8 @@ def BP(args, config_dict):
                 each_HGT_split = each_HGT.strip().split('\t')
                 gene_1 = each_HGT_split[0]
                 gene_2 = each_HGT_split[1]
-                gene_1_genome = '_'.join(gene_1.split('_')[:-1])
-                gene_2_genome = '_'.join(gene_2.split('_')[:-1])
+                gene_1_genome = get_genome_name(gene_1)
+                gene_2_genome = get_genome_name(gene_2)
                 identity = float(each_HGT_split[4])
                 end_match = each_HGT_split[5]
                 full_length_match = each_HGT_split[6]
@@ -2573,11 +2486,7 @@ def BP(args, config_dict):
             pwd_plot_circos =               '%s/%s_x%s_HGTs_among_provided_groups.pdf'                   % (pwd_MetaCHIP_op_folder, output_prefix, group_num)
 
             # get genome to group dict
-            genome_to_group_dict = {}
-            for genome in open(grouping_file):
-                group_id2 = genome.strip().split(',')[0]
-                genome_name = genome.strip().split(',')[1]
-                genome_to_group_dict[genome_name] = group_id2
+            genome_to_group_dict = get_genome_to_group_dict(grouping_file)
 
             Get_circlize_plot_customized_grouping(multi_level_detection, output_prefix, pwd_detected_HGT_txt, genome_to_group_dict, circos_HGT_R, pwd_plot_circos, pwd_MetaCHIP_op_folder)
 
@@ -2623,8 +2532,8 @@ def BP(args, config_dict):
                     each_HGT_split = each_HGT.strip().split('\t')
                     gene_1 = each_HGT_split[0]
                     gene_2 = each_HGT_split[1]
-                    gene_1_genome = '_'.join(gene_1.split('_')[:-1])
-                    gene_2_genome = '_'.join(gene_2.split('_')[:-1])
+                    gene_1_genome = get_genome_name(gene_1)
+                    gene_2_genome = get_genome_name(gene_2)
                     identity = float(each_HGT_split[4])
                     end_match = each_HGT_split[5]
                     full_length_match = each_HGT_split[6]
@@ -2659,19 +2568,8 @@ def BP(args, config_dict):
             pwd_grouping_file =         '%s/%s'                                     % (MetaCHIP_wd, grouping_file)
             pwd_plot_circos =           '%s/%s_%s_HGTs_among_provided_groups.pdf'   % (pwd_MetaCHIP_op_folder, output_prefix, taxon_rank_num)
 
-            taxon_to_group_id_dict = {}
-            for group in open(pwd_grouping_file):
-                group_id = group.strip().split(',')[0]
-                group_taxon = group.strip().split(',')[2]
-                if group_id not in taxon_to_group_id_dict:
-                    taxon_to_group_id_dict[group_id] = group_taxon
-
             # get genome to taxon dict
-            genome_to_taxon_dict = {}
-            for genome in open(pwd_grouping_file):
-                group_id2 = genome.strip().split(',')[0]
-                genome_name = genome.strip().split(',')[1]
-                genome_to_taxon_dict[genome_name] = taxon_to_group_id_dict[group_id2]
+            genome_to_taxon_dict = get_genome_to_group_dict(pwd_grouping_file, col_index=2)
 
             detected_HGT_num = -1
             for each_line in open(pwd_detected_HGT_txt):
@@ -2746,8 +2644,8 @@ def BP(args, config_dict):
                     each_split = each.strip().split('\t')
                     gene_1 = each_split[0]
                     gene_2 = each_split[1]
-                    gene_1_genome = '_'.join(gene_1.split('_')[:-1])
-                    gene_2_genome = '_'.join(gene_2.split('_')[:-1])
+                    gene_1_genome = get_genome_name(gene_1)
+                    gene_2_genome = get_genome_name(gene_2)
                     direction = each_split[6]
                     plot_file = '%s___%s.SVG' % (gene_1, gene_2)
                     plot_file_list.add(plot_file)
@@ -2800,11 +2698,7 @@ def BP(args, config_dict):
                     pwd_df_circos =             '%s/%s_HGTs_among_%s.tab'                   % (pwd_combined_prediction_folder, output_prefix, rank_abbre_dict_plural[detection_rank])
 
                     # get genome to taxon dict
-                    genome_to_taxon_dict = {}
-                    for genome in open(pwd_grouping_file):
-                        genome_name = genome.strip().split(',')[1]
-                        genome_taxon = genome.strip().split(',')[2]
-                        genome_to_taxon_dict[genome_name] = genome_taxon
+                    genome_to_taxon_dict = get_genome_to_group_dict(pwd_grouping_file, col_index=2)
 
                     detected_HGT_num = -1
                     for each_line in open(pwd_detected_HGT_txt_combined):
@@ -2821,6 +2715,10 @@ def BP(args, config_dict):
             # remove tmp files
             os.system('rm -r %s' % pwd_flanking_plot_folder_combined_tmp)
 
+    # write out run report
+    run_report_table = write_run_report(run_report, pwd_run_report_json, pwd_run_report_txt)
+    report_and_log(('Run report exported to: %s, time and resources used by each stage:\n%s' % (os.path.basename(pwd_run_report_json), run_report_table)), pwd_log_file, keep_quiet)
+
 
 if __name__ == '__main__':
 
@@ -2840,6 +2738,10 @@ if __name__ == '__main__':
     parser.add_argument('-force',         required=False, action="store_true",          help='overwrite previous results')
     parser.add_argument('-quiet',         required=False, action="store_true",          help='Do not report progress')
     parser.add_argument('-tmp',           required=False, action="store_true",          help='keep temporary files')
+    parser.add_argument('-aligner',       required=False, default='blast', choices=homology_search_backend_list, help='homology search backend for the PG approach, default: blast')
+    parser.add_argument('-resume',        required=False, action="store_true",          help='resume an interrupted run, tasks recorded as completed in the manifest will be skipped')
+    parser.add_argument('-sketch',        required=False, type=float,   default=None,   help='get identity cutoffs from histogram sketches with the given resolution (e.g. 0.01), cutoffs are within half the resolution of exact ones, default: exact')
+    parser.add_argument('-flkbatch',      required=False, type=int,     default=None,   help=argparse.SUPPRESS)  # blastn on batches of candidates, hidden until compared with per-candidate blastn (benchmark/flanking_blastn_batch_benchmark.py)
 
     args = vars(parser.parse_args())
 
@@ -17,9 +17,14 @@ config_dict = {'prodigal'        : 'prodigal',
                'blastn'          : 'blastn',
                'makeblastdb'     : 'makeblastdb',
                'fasttree'        : 'FastTree',
+               'mmseqs'          : 'mmseqs',                                        # only needed with -aligner mmseqs
                'ranger_mac'      : '%s/Ranger-DTL-Dated.mac'   % config_file_path,  # do not edit this line
                'ranger_linux'    : '%s/Ranger-DTL-Dated.linux' % config_file_path,  # do not edit this line
                'path_to_hmm'     : '%s/MetaCHIP_phylo.hmm'     % config_file_path,  # do not edit this line
-               'circos_HGT_R'    : '%s/MetaCHIP_circos_HGT.R'  % config_file_path   # do not edit this line
+               'circos_HGT_R'    : '%s/MetaCHIP_circos_HGT.R'  % config_file_path,  # do not edit this line
+               'cache_dir'       : os.path.expanduser('~/.MetaCHIP_cache'),         # cached Prodigal/hmmsearch results, used with -cache
+               'cache_max_size'  : 20,                                              # maximum cache size in GB
+               'sort_spill_dir'  : '',                                              # folder for temporary files of BP sorting, system temporary folder if empty
+               'sort_buffer_size': 256                                              # lines sorted in memory before spilling to disk, in MB
                }
 
@@ -17,22 +17,31 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import os
-import re
 import glob
 import shutil
+import subprocess
 import argparse
 import warnings
 import itertools
-from time import sleep
+import numpy as np
+from time import sleep, time
 from datetime import datetime
 from string import ascii_uppercase
 from Bio import SeqIO, AlignIO, Align
 from Bio.Seq import Seq
-from Bio import SeqFeature as SF
 from Bio.SeqRecord import SeqRecord
-from Bio.SeqFeature import SeqFeature, FeatureLocation
 import multiprocessing as mp
 from MetaCHIP.MetaCHIP_config import config_dict
+from MetaCHIP.homology_search import homology_search_backend_list, get_homology_search_program_list, get_db_name, get_makedb_cmd, get_search_cmd
+from MetaCHIP.gene_table import get_genome_name, write_gene_table
+from MetaCHIP.gene_index import write_gene_index
+from MetaCHIP.genbank_writer import get_gbk_date, gbk_record, gbk_cds_feature
+from MetaCHIP.contig_store import contig_store_record, write_contig_store_index
+from MetaCHIP.genome_cache import get_file_md5, get_cache_key, link_from_cache, add_to_cache, update_cache_stats, evict_cache
+from MetaCHIP.blastn_filter import filter_blastn_hits, get_blastn_hit_num_header, record_blastn_hit_num
+from MetaCHIP.checkpoint import get_fingerprint, read_manifest, record_task, reset_stage, is_task_done, checkpoint_worker
+from MetaCHIP.run_report import new_run_report, start_stage, write_run_report
+from MetaCHIP.taxonomy_index import read_taxonomy_file, index_taxonomy, read_grouping_file, get_qualified_genome_list
 from distutils.spawn import find_executable
 warnings.filterwarnings("ignore")
 
@@ -81,28 +90,137 @@ def get_group_index_list():
     return group_index_list
 
 
-def prodigal_parser(seq_file, sco_file, prefix, output_folder):
+# amino acids encoded by the NCBI genetic codes supported by Prodigal, codons ordered as TTT, TTC, TTA, TTG, TCT ... GGG
+ncbi_genetic_code_dict = {1:  'FFLLSSSSYY**CC*WLLLLPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG',
+                          2:  'FFLLSSSSYY**CCWWLLLLPPPPHHQQRRRRIIMMTTTTNNKKSS**VVVVAAAADDEEGGGG',
+                          3:  'FFLLSSSSYY**CCWWTTTTPPPPHHQQRRRRIIMMTTTTNNKKSSRRVVVVAAAADDEEGGGG',
+                          4:  'FFLLSSSSYY**CCWWLLLLPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG',
+                          5:  'FFLLSSSSYY**CCWWLLLLPPPPHHQQRRRRIIMMTTTTNNKKSSSSVVVVAAAADDEEGGGG',
+                          6:  'FFLLSSSSYYQQCC*WLLLLPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG',
+                          9:  'FFLLSSSSYY**CCWWLLLLPPPPHHQQRRRRIIIMTTTTNNNKSSSSVVVVAAAADDEEGGGG',
+                          10: 'FFLLSSSSYY**CCCWLLLLPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG',
+                          11: 'FFLLSSSSYY**CC*WLLLLPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG',
+                          12: 'FFLLSSSSYY**CC*WLLLSPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG',
+                          13: 'FFLLSSSSYY**CCWWLLLLPPPPHHQQRRRRIIMMTTTTNNKKSSGGVVVVAAAADDEEGGGG',
+                          14: 'FFLLSSSSYYY*CCWWLLLLPPPPHHQQRRRRIIIMTTTTNNNKSSSSVVVVAAAADDEEGGGG',
+                          15: 'FFLLSSSSYY*QCC*WLLLLPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG',
+                          16: 'FFLLSSSSYY*LCC*WLLLLPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG',
+                          21: 'FFLLSSSSYY**CCWWLLLLPPPPHHQQRRRRIIMMTTTTNNNKSSSSVVVVAAAADDEEGGGG',
+                          22: 'FFLLSS*SYY*LCC*WLLLLPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG',
+                          23: 'FF*LSSSSYY**CC*WLLLLPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG',
+                          24: 'FFLLSSSSYY**CCWWLLLLPPPPHHQQRRRRIIIMTTTTNNKKSSSKVVVVAAAADDEEGGGG',
+                          25: 'FFLLSSSSYY**CCGWLLLLPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG'}
+
+iupac_nucleotide_dict = {'A': 'A', 'C': 'C', 'G': 'G', 'T': 'T',
+                         'M': 'AC', 'R': 'AG', 'W': 'AT', 'S': 'CG', 'Y': 'CT', 'K': 'GT',
+                         'V': 'ACG', 'H': 'ACT', 'D': 'AGT', 'B': 'CGT', 'N': 'ACGT'}
+
+# ambiguous amino acids, checked from the most to the least specific one
+ambiguous_aa_list = [('B', 'DN'), ('J', 'IL'), ('Z', 'EQ')]
+
+nucleotide_index_array = np.full(256, 4, dtype=np.uint8)
+for base_index, base in enumerate('TCAG'):
+    nucleotide_index_array[ord(base)] = base_index
+
+dna_complement_table = str.maketrans('ACGTUMRWSYKVHDBNacgtumrwsykvhdbn', 'TGCAAKYWSRMBDHVNtgcaakywsrmbdhvn')
+
+
+class CodonTable(dict):
+
+    # maps codons to amino acids, ambiguous codons are resolved on first use and cached
+
+    def __init__(self, transl_table):
+        dict.__init__(self)
+        self.transl_table = transl_table
+        aa_string = ncbi_genetic_code_dict[int(transl_table)]
+        for codon, aa in zip((a + b + c for a in 'TCAG' for b in 'TCAG' for c in 'TCAG'), aa_string):
+            self[codon] = aa
+
+        # amino acids indexed by base1 * 25 + base2 * 5 + base3 (T:0, C:1, A:2, G:3, others:4), 0 for codons with other bases
+        self.aa_array = np.zeros(125, dtype=np.uint8)
+        for codon_index, aa in enumerate(aa_string):
+            self.aa_array[(codon_index // 16) * 25 + (codon_index // 4 % 4) * 5 + codon_index % 4] = ord(aa)
+
+    def __missing__(self, codon):
+
+        if (len(codon) != 3) or (set(codon).issubset(iupac_nucleotide_dict) is False):
+            # leave anything beyond IUPAC DNA codes (U, gaps, ...) to Biopython, as before
+            aa = str(Seq(codon).translate(table=self.transl_table))
+        else:
+            possible_aa_set = set()
+            for a in iupac_nucleotide_dict[codon[0]]:
+                for b in iupac_nucleotide_dict[codon[1]]:
+                    for c in iupac_nucleotide_dict[codon[2]]:
+                        possible_aa_set.add(self[a + b + c])
+
+            if len(possible_aa_set) == 1:
+                aa = possible_aa_set.pop()
+            elif '*' in possible_aa_set:
+                aa = 'X'
+            else:
+                aa = 'X'
+                for ambiguous_aa, represented_aa in ambiguous_aa_list:
+                    if possible_aa_set.issubset(represented_aa):
+                        aa = ambiguous_aa
+                        break
 
-    bin_ffn_file =     '%s.ffn' % prefix
-    bin_faa_file =     '%s.faa' % prefix
-    bin_gbk_file =     '%s.gbk' % prefix
-    pwd_bin_ffn_file = '%s/%s'  % (output_folder, bin_ffn_file)
-    pwd_bin_faa_file = '%s/%s'  % (output_folder, bin_faa_file)
-    pwd_bin_gbk_file = '%s/%s'  % (output_folder, bin_gbk_file)
+        self[codon] = aa
+        return aa
+
+
+codon_table_dict = {}
+
+
+def translate_nc(sequence_nc, transl_table):
+
+    if transl_table not in codon_table_dict:
+        if int(transl_table) in ncbi_genetic_code_dict:
+            codon_table_dict[transl_table] = CodonTable(transl_table)
+        else:
+            return str(Seq(sequence_nc).translate(table=transl_table))
+
+    codon_table = codon_table_dict[transl_table]
+    sequence_nc = sequence_nc.upper()
+    seq_len = len(sequence_nc) - len(sequence_nc) % 3
+
+    # look up all codons at once, then fill in the ones with ambiguous bases
+    base_array = nucleotide_index_array[np.frombuffer(sequence_nc.encode('ascii', 'replace'), dtype=np.uint8)]
+    aa_array = codon_table.aa_array[base_array[0:seq_len:3] * 25 + base_array[1:seq_len:3] * 5 + base_array[2:seq_len:3]]
+    for codon_index in np.flatnonzero(aa_array == 0):
+        aa_array[codon_index] = ord(codon_table[sequence_nc[codon_index * 3:codon_index * 3 + 3]])
+
+    return aa_array.tobytes().decode()
+
+
+def reverse_complement(sequence_nc):
+    return sequence_nc.translate(dna_complement_table)[::-1]
+
+
+def iter_fasta(seq_file):
+
+    # yield (seq_id, sequence) one by one, the same way as SeqIO.parse(seq_file, 'fasta')
+    seq_id = None
+    seq_line_list = []
+    for each_line in open(seq_file):
+        if each_line.startswith('>'):
+            if seq_id is not None:
+                yield seq_id, ''.join(''.join(seq_line_list).split())
+            title = each_line[1:].rstrip()
+            seq_id = title.split(None, 1)[0] if title != '' else ''
+            seq_line_list = []
+        elif seq_id is not None:
+            seq_line_list.append(each_line)
+
+    if seq_id is not None:
+        yield seq_id, ''.join(''.join(seq_line_list).split())
 
-    # get sequence id list
-    id_to_sequence_dict = {}
-    sequence_id_list = []
-    for each_seq in SeqIO.parse(seq_file, 'fasta'):
-        id_to_sequence_dict[each_seq.id] = str(each_seq.seq)
-        sequence_id_list.append(each_seq.id)
 
-    # get sequence to cds dict and sequence to transl_table dict
+def iter_prodigal_sco(sco_file):
+
+    # yield (seq_id, transl_table, cds_list) for each sequence in a Prodigal sco file
     current_seq_id = ''
     current_transl_table = ''
     current_seq_csd_list = []
-    seq_to_cds_dict = {}
-    seq_to_transl_table_dict = {}
     for each_cds in open(sco_file):
 
         if each_cds.startswith('"'):
@@ -110,10 +228,8 @@ def prodigal_parser(seq_file, sco_file, prefix, output_folder):
 
         elif each_cds.startswith('# Sequence Data'):
 
-            # add to dict
             if current_seq_id != '':
-                seq_to_cds_dict[current_seq_id] = current_seq_csd_list
-                seq_to_transl_table_dict[current_seq_id] = current_transl_table
+                yield current_seq_id, current_transl_table, current_seq_csd_list
 
             # reset value
             if each_cds.strip().split(';seqhdr=')[1][-1] == '"':
@@ -131,91 +247,118 @@ def prodigal_parser(seq_file, sco_file, prefix, output_folder):
             current_seq_csd_list.append('_'.join(each_cds.strip().split('_')[1:]))
 
     if current_seq_id != '':
-        seq_to_cds_dict[current_seq_id] = current_seq_csd_list
-        seq_to_transl_table_dict[current_seq_id] = current_transl_table
+        yield current_seq_id, current_transl_table, current_seq_csd_list
+
+
+def prodigal_parser(seq_file, sco_file, prefix, output_folder, write_gbk=True):
 
-    bin_gbk_file_handle = open(pwd_bin_gbk_file, 'w')
-    bin_ffn_file_handle = open(pwd_bin_ffn_file, 'w')
-    bin_faa_file_handle = open(pwd_bin_faa_file, 'w')
+    bin_ffn_file =     '%s.ffn' % prefix
+    bin_faa_file =     '%s.faa' % prefix
+    bin_gbk_file =     '%s.gbk' % prefix
+    bin_npz_file =     '%s.npz' % prefix
+    bin_fna_file =     '%s.fna' % prefix
+    pwd_bin_ffn_file = '%s/%s'  % (output_folder, bin_ffn_file)
+    pwd_bin_faa_file = '%s/%s'  % (output_folder, bin_faa_file)
+    pwd_bin_gbk_file = '%s/%s'  % (output_folder, bin_gbk_file)
+    pwd_bin_npz_file = '%s/%s'  % (output_folder, bin_npz_file)
+    pwd_bin_fna_file = '%s/%s'  % (output_folder, bin_fna_file)
+
+    # gbk files are not needed by BP, which reads the gene coordinate index and contig store, PI -nogbk skips them
+    gbk_date = get_gbk_date()
+    if write_gbk is True:
+        bin_gbk_file_handle = open(pwd_bin_gbk_file, 'w', buffering=1048576)
+    bin_ffn_file_handle = open(pwd_bin_ffn_file, 'w', buffering=1048576)
+    bin_faa_file_handle = open(pwd_bin_faa_file, 'w', buffering=1048576)
+    bin_fna_file_handle = open(pwd_bin_fna_file, 'wb', buffering=1048576)
+
+    # Prodigal reports sequences in the order of the input file, walk through both files contig by contig
+    sco_iterator = iter_prodigal_sco(sco_file)
+    sco_pending_dict = {}
     gene_index = 1
-    for seq_id in sequence_id_list:
-
-        # create SeqRecord
-        current_SeqRecord = SeqRecord(Seq(id_to_sequence_dict[seq_id]), id=seq_id, annotations={"molecule_type": "DNA"})
-        transl_table = seq_to_transl_table_dict[seq_id]
-
-        # add SeqRecord annotations
-        current_SeqRecord_annotations = current_SeqRecord.annotations
-        current_SeqRecord_annotations['date'] =                 (datetime.now().strftime('%d-%b-%Y')).upper()
-        current_SeqRecord_annotations['accession'] =            ''
-        current_SeqRecord_annotations['version'] =              ''
-        current_SeqRecord_annotations['keywords'] =             ['.']
-        current_SeqRecord_annotations['source'] =               prefix
-        current_SeqRecord_annotations['organism'] =             prefix
-        current_SeqRecord_annotations['taxonomy'] =             ['Unclassified']
-        current_SeqRecord_annotations['comment'] =              '.'
-
-        # add SeqFeature to SeqRecord
-        for cds in seq_to_cds_dict[seq_id]:
+
+    # gene coordinate index (see gene_index.py) and contig store (see contig_store.py)
+    contig_name_list = []
+    contig_len_list = []
+    contig_transl_table_list = []
+    gene_contig_list = []
+    gene_start_list = []
+    gene_end_list = []
+    gene_strand_list = []
+    fna_offset = 0
+    fai_line_list = []
+    for seq_id, seq_str in iter_fasta(seq_file):
+
+        while seq_id not in sco_pending_dict:
+            sco_record = next(sco_iterator, None)
+            if sco_record is None:
+                raise KeyError(seq_id)
+            sco_pending_dict[sco_record[0]] = sco_record[1:]
+        transl_table, seq_cds_list = sco_pending_dict.pop(seq_id)
+
+        ffn_line_list = []
+        faa_line_list = []
+        feature_line_list = []
+        for cds in seq_cds_list:
 
             # define locus_tag id
             locus_tag_id = '%s_%s' % (prefix, "{:0>5}".format(gene_index))
 
-            # define FeatureLocation
             cds_split = cds.split('_')
-            cds_start = SF.ExactPosition(int(cds_split[0]))
-            cds_end = SF.ExactPosition(int(cds_split[1]))
+            cds_start = int(cds_split[0])
+            cds_end = int(cds_split[1])
             cds_strand = cds_split[2]
-            current_strand = None
-            if cds_strand == '+':
-                current_strand = 1
-            if cds_strand == '-':
-                current_strand = -1
-            current_feature_location = FeatureLocation(cds_start, cds_end, strand=current_strand)
 
             # get nc sequence
             sequence_nc = ''
             if cds_strand == '+':
-                sequence_nc = id_to_sequence_dict[seq_id][cds_start-1:cds_end]
+                sequence_nc = seq_str[cds_start-1:cds_end]
             if cds_strand == '-':
-                sequence_nc = str(Seq(id_to_sequence_dict[seq_id][cds_start-1:cds_end]).reverse_complement())
+                sequence_nc = reverse_complement(seq_str[cds_start-1:cds_end])
 
-            # translate to aa sequence
-            sequence_aa = str(SeqRecord(Seq(sequence_nc)).seq.translate(table=transl_table))
+            # translate to aa sequence and remove * at the end
+            sequence_aa = translate_nc(sequence_nc, transl_table)[:-1]
 
-            # remove * at the end
-            sequence_aa = sequence_aa[:-1]
+            ffn_line_list.append('>%s\n%s\n' % (locus_tag_id, sequence_nc))
+            faa_line_list.append('>%s\n%s\n' % (locus_tag_id, sequence_aa))
+            if write_gbk is True:
+                feature_line_list += gbk_cds_feature(cds_start, cds_end, cds_strand, locus_tag_id, transl_table, sequence_aa)
 
-            # export nc and aa sequences
-            #export_dna_record(sequence_nc, locus_tag_id, '', bin_ffn_file_handle)
-            bin_ffn_file_handle.write('>%s\n' % locus_tag_id)
-            bin_ffn_file_handle.write('%s\n' % sequence_nc)
-            #export_aa_record(sequence_aa, locus_tag_id, '', bin_faa_file_handle)
-            bin_faa_file_handle.write('>%s\n' % locus_tag_id)
-            bin_faa_file_handle.write('%s\n' % sequence_aa)
-
-            # Define feature type
-            current_feature_type = 'CDS'
+            # Biopython reads the gbk location of the gene as start = cds_start (0-based) and end = cds_end
+            gene_contig_list.append(len(contig_name_list))
+            gene_start_list.append(cds_start)
+            gene_end_list.append(cds_end)
+            gene_strand_list.append({'+': 1, '-': -1}[cds_strand])
+            gene_index += 1
 
-            # Define feature qualifiers
-            current_qualifiers_dict = {}
-            current_qualifiers_dict['locus_tag'] = locus_tag_id
-            current_qualifiers_dict['transl_table'] = transl_table
-            current_qualifiers_dict['translation'] = sequence_aa
+        bin_ffn_file_handle.write(''.join(ffn_line_list))
+        bin_faa_file_handle.write(''.join(faa_line_list))
+        if write_gbk is True:
+            bin_gbk_file_handle.write(gbk_record(seq_id, seq_str, feature_line_list, prefix, gbk_date))
+        fna_record, fai_line = contig_store_record(seq_id, seq_str, fna_offset)
+        bin_fna_file_handle.write(fna_record)
+        fna_offset += len(fna_record)
+        fai_line_list.append(fai_line)
+        contig_name_list.append(seq_id)
+        contig_len_list.append(len(seq_str))
+        contig_transl_table_list.append(int(transl_table))
+
+    if write_gbk is True:
+        bin_gbk_file_handle.close()
+    bin_ffn_file_handle.close()
+    bin_faa_file_handle.close()
+    bin_fna_file_handle.close()
 
-            # Create a SeqFeature
-            current_feature = SeqFeature(current_feature_location, type=current_feature_type, qualifiers=current_qualifiers_dict)
+    write_contig_store_index(pwd_bin_fna_file, fai_line_list)
+    write_gene_index(pwd_bin_npz_file, contig_name_list, contig_len_list, contig_transl_table_list, gene_contig_list, gene_start_list, gene_end_list, gene_strand_list)
 
-            # Append Feature to SeqRecord
-            current_SeqRecord.features.append(current_feature)
-            gene_index += 1
 
-        # export to gbk file
-        SeqIO.write(current_SeqRecord, bin_gbk_file_handle, 'genbank')
+def get_prodigal_output_ext_list(write_gbk):
 
-    bin_gbk_file_handle.close()
-    bin_ffn_file_handle.close()
-    bin_faa_file_handle.close()
+    # files written for each genome by prodigal_worker
+    if write_gbk is True:
+        return ['sco', 'ffn', 'faa', 'gbk', 'npz', 'fna', 'fna.fai']
+    else:
+        return ['sco', 'ffn', 'faa', 'npz', 'fna', 'fna.fai']
 
 
 def prodigal_worker(argument_list):
@@ -225,12 +368,21 @@ def prodigal_worker(argument_list):
     pwd_prodigal_exe            = argument_list[2]
     nonmeta_mode                = argument_list[3]
     pwd_prodigal_output_folder  = argument_list[4]
+    cache_dir                   = argument_list[5]
+    write_gbk                   = argument_list[6]
 
     # prepare command (according to Prokka)
     input_genome_basename, input_genome_ext = os.path.splitext(input_genome)
     pwd_input_genome = '%s/%s' % (input_genome_folder, input_genome)
     pwd_output_sco = '%s/%s.sco' % (pwd_prodigal_output_folder, input_genome_basename)
 
+    # link cached results if the same genome has been annotated before
+    output_file_list = ['%s/%s.%s' % (pwd_prodigal_output_folder, input_genome_basename, i) for i in get_prodigal_output_ext_list(write_gbk)]
+    if cache_dir is not None:
+        cache_key = get_cache_key(pwd_input_genome, input_genome_basename, 'prodigal_PI', {True: 'nonmeta', False: 'meta'}[nonmeta_mode])
+        if link_from_cache(cache_dir, cache_key, output_file_list) is True:
+            return 'hit'
+
     prodigal_cmd_meta = '%s -f sco -q -c -m -g 11 -p meta -i %s -o %s' % (pwd_prodigal_exe, pwd_input_genome, pwd_output_sco)
     prodigal_cmd_nonmeta = '%s -f sco -q -c -m -g 11 -i %s -o %s' % (pwd_prodigal_exe, pwd_input_genome, pwd_output_sco)
 
@@ -242,7 +394,11 @@ def prodigal_worker(argument_list):
     os.system(prodigal_cmd)
 
     # prepare ffn, faa and gbk files from prodigal output
-    prodigal_parser(pwd_input_genome, pwd_output_sco, input_genome_basename, pwd_prodigal_output_folder)
+    prodigal_parser(pwd_input_genome, pwd_output_sco, input_genome_basename, pwd_prodigal_output_folder, write_gbk)
+
+    if cache_dir is not None:
+        add_to_cache(cache_dir, cache_key, output_file_list)
+        return 'miss'
 
 
 def hmmsearch_worker(argument_list):
@@ -252,62 +408,195 @@ def hmmsearch_worker(argument_list):
     pwd_hmmsearch_exe = argument_list[2]
     path_to_hmm = argument_list[3]
     pwd_faa_folder = argument_list[4]
+    cache_dir = argument_list[5]
+    hmm_md5 = argument_list[6]
 
-    # run hmmsearch
+    # run hmmsearch, domtblout from previous run will be reused (e.g. PI -update)
     pwd_faa_file = '%s/%s.faa' % (pwd_faa_folder, faa_file_basename)
-    os.system('%s -o /dev/null --domtblout %s/%s_hmmout.tbl %s %s' % (pwd_hmmsearch_exe, pwd_SCG_tree_wd, faa_file_basename, path_to_hmm, pwd_faa_file))
-
-    # Reading the protein file in a dictionary
+    pwd_hmmout_tbl = '%s/%s_hmmout.tbl' % (pwd_SCG_tree_wd, faa_file_basename)
+    cache_status = None
+    if os.path.isfile(pwd_hmmout_tbl) is False:
+
+        # per-marker hits of the same proteins and hmm profiles are linked from cache
+        if cache_dir is not None:
+            cache_key = get_cache_key(pwd_faa_file, faa_file_basename, 'hmmsearch', hmm_md5)
+            cache_status = 'hit'
+            if link_from_cache(cache_dir, cache_key, [pwd_hmmout_tbl]) is False:
+                cache_status = 'miss'
+
+        if cache_status != 'hit':
+            os.system('%s -o /dev/null --domtblout %s %s %s' % (pwd_hmmsearch_exe, pwd_hmmout_tbl, path_to_hmm, pwd_faa_file))
+            if cache_dir is not None:
+                add_to_cache(cache_dir, cache_key, [pwd_hmmout_tbl])
+
+    return [parse_hmmsearch_output(pwd_hmmout_tbl, pwd_faa_file), cache_status]
+
+
+def parse_hmmsearch_output(pwd_hmmout_tbl, pwd_faa_file):
+
+    # read the domtblout, keep the best domain (highest domain score) of each hmm profile
+    best_hit_dict = {}
+    for line in open(pwd_hmmout_tbl):
+        if line[0] == "#": continue
+        splitLine = line.split()
+        hmm_id = splitLine[4]
+        hmm_score = float(splitLine[13])
+        if (hmm_id not in best_hit_dict) or (hmm_score > best_hit_dict[hmm_id][3]):
+            best_hit_dict[hmm_id] = [splitLine[0], int(splitLine[17]) - 1, int(splitLine[18]), hmm_score]
+
+    # get the aligned part of best hits, sequences will be written out by the parent process
+    best_hit_protein_set = set([i[0] for i in best_hit_dict.values()])
     proteinSequence = {}
     for seq_record in SeqIO.parse(pwd_faa_file, 'fasta'):
-        proteinSequence[seq_record.id] = str(seq_record.seq)
-
-    # Reading the hmmersearch table/extracting the protein part found beu hmmsearch out of the protein/Writing
-    # each protein sequence that was extracted to a fasta file (one for each hmm in phylo.hmm
-    hmm_id = ''
-    hmm_name = ''
-    hmm_pos1 = 0
-    hmm_pos2 = 0
-    hmm_score = 0
-    pwd_hmmout_tbl = pwd_SCG_tree_wd + '/' + faa_file_basename + '_hmmout.tbl'
-    with open(pwd_hmmout_tbl, 'r') as tbl:
-        for line in tbl:
+        if seq_record.id in best_hit_protein_set:
+            proteinSequence[seq_record.id] = str(seq_record.seq)
+
+    hmm_hit_dict = {}
+    for hmm_id in best_hit_dict:
+        hmm_name, hmm_pos1, hmm_pos2, hmm_score = best_hit_dict[hmm_id]
+        hmm_hit_dict[hmm_id] = proteinSequence[hmm_name][hmm_pos1:hmm_pos2]
+
+    return hmm_hit_dict
+
+
+def get_seq_num(seq_file):
+
+    seq_num = 0
+    for each_line in open(seq_file):
+        if each_line.startswith('>'):
+            seq_num += 1
+
+    return seq_num
+
+
+def get_hmmsearch_chunk_list(genome_list, pwd_faa_folder, num_threads, chunk_min_size):
+
+    # split genomes into no more chunks than cores, each with at least chunk_min_size bytes of proteins (except
+    # when there is only one chunk), larger genomes are assigned first to the currently smallest chunk
+    genome_size_list = sorted([[os.path.getsize('%s/%s.faa' % (pwd_faa_folder, i)), i] for i in genome_list], key=lambda x: x[0], reverse=True)
+    total_size = sum([i[0] for i in genome_size_list])
+    chunk_num = max(1, min(len(genome_list), num_threads, total_size // chunk_min_size))
+
+    chunk_list = [[] for i in range(chunk_num)]
+    chunk_size_list = [0] * chunk_num
+    for genome_size, genome in genome_size_list:
+        smallest_chunk_index = chunk_size_list.index(min(chunk_size_list))
+        chunk_list[smallest_chunk_index].append(genome)
+        chunk_size_list[smallest_chunk_index] += genome_size
+
+    # cores left are used by hmmsearch (--cpu)
+    cpu_num = max(1, num_threads // chunk_num)
+
+    return chunk_list, cpu_num
+
+
+def rescale_hmmout_lines(line_split_list, genome_seq_num, evalue_cutoff=10):
+
+    # domtblout lines (split) of a genome from a search with -Z 1 --domZ 1, with E-values of a search of the genome
+    # alone: sequence and independent domain E-values are P-values x number of proteins (Z), conditional domain
+    # E-values are P-values x number of reported proteins of the hmm profile (domZ)
+    line_split_list = [i for i in line_split_list if float(i[6]) * genome_seq_num <= evalue_cutoff]
+
+    hmm_to_reported_seq_dict = {}
+    for splitLine in line_split_list:
+        if splitLine[3] not in hmm_to_reported_seq_dict:
+            hmm_to_reported_seq_dict[splitLine[3]] = set()
+        hmm_to_reported_seq_dict[splitLine[3]].add(splitLine[0])
+
+    hit_line_list = []
+    for splitLine in line_split_list:
+        c_evalue = float(splitLine[11]) * len(hmm_to_reported_seq_dict[splitLine[3]])
+        if c_evalue <= evalue_cutoff:
+            splitLine[6] = '%.2g' % (float(splitLine[6]) * genome_seq_num)
+            splitLine[11] = '%.2g' % c_evalue
+            splitLine[12] = '%.2g' % (float(splitLine[12]) * genome_seq_num)
+            hit_line_list.append('%s\n' % ' '.join(splitLine))
+
+    return hit_line_list
+
+
+def hmmsearch_batch_worker(argument_list):
+
+    genome_list = argument_list[0]
+    pwd_SCG_tree_wd = argument_list[1]
+    pwd_hmmsearch_exe = argument_list[2]
+    path_to_hmm = argument_list[3]
+    pwd_faa_folder = argument_list[4]
+    cache_dir = argument_list[5]
+    hmm_md5 = argument_list[6]
+    cpu_num = argument_list[7]
+    chunk_index = argument_list[8]
+
+    # domtblout from previous run or cache will be reused, same as hmmsearch_worker. E-values converted from P-values
+    # are rounded differently from those of hmmsearch_worker, so they are cached separately
+    genome_to_cache_status_dict = {}
+    genome_to_cache_key_dict = {}
+    genome_to_search_list = []
+    for genome in genome_list:
+        pwd_hmmout_tbl = '%s/%s_hmmout.tbl' % (pwd_SCG_tree_wd, genome)
+        genome_to_cache_status_dict[genome] = None
+        if os.path.isfile(pwd_hmmout_tbl) is False:
+            if cache_dir is not None:
+                genome_to_cache_key_dict[genome] = get_cache_key('%s/%s.faa' % (pwd_faa_folder, genome), genome, 'hmmsearch_batch', hmm_md5)
+                genome_to_cache_status_dict[genome] = 'hit'
+                if link_from_cache(cache_dir, genome_to_cache_key_dict[genome], [pwd_hmmout_tbl]) is False:
+                    genome_to_cache_status_dict[genome] = 'miss'
+            if genome_to_cache_status_dict[genome] != 'hit':
+                genome_to_search_list.append(genome)
+
+    if len(genome_to_search_list) > 0:
+
+        # search all proteins of the chunk at once
+        pwd_chunk_faa = '%s/hmmsearch_chunk%s.faa' % (pwd_SCG_tree_wd, chunk_index)
+        pwd_chunk_tbl = '%s/hmmsearch_chunk%s_hmmout.tbl' % (pwd_SCG_tree_wd, chunk_index)
+        os.system('cat %s > %s' % (' '.join(['%s/%s.faa' % (pwd_faa_folder, i) for i in genome_to_search_list]), pwd_chunk_faa))
+
+        # E-values depend on the number of searched sequences (-Z) and, for domains, on the number of reported
+        # sequences (--domZ). Both are set to 1 so hmmsearch reports P-values, which are converted to the E-values a
+        # search of each genome alone would report, and hits are filtered with the default cutoffs (-E and --domE 10)
+        os.system('%s -o /dev/null --cpu %s -Z 1 --domZ 1 --domtblout %s %s %s' % (pwd_hmmsearch_exe, cpu_num, pwd_chunk_tbl, path_to_hmm, pwd_chunk_faa))
+
+        # demultiplex hits by locus tag prefix, the description (last column) may contain spaces
+        genome_to_line_split_dict = {i: [] for i in genome_to_search_list}
+        for line in open(pwd_chunk_tbl):
             if line[0] == "#": continue
-            line = re.sub('\s+', ' ', line)
-            splitLine = line.split(' ')
-
-            if (hmm_id == ''):
-                hmm_id = splitLine[4]
-                hmm_name = splitLine[0]
-                hmm_pos1 = int(splitLine[17]) - 1
-                hmm_pos2 = int(splitLine[18])
-                hmm_score = float(splitLine[13])
-            elif (hmm_id == splitLine[4]):
-                if (float(splitLine[13]) > hmm_score):
-                    hmm_name = splitLine[0]
-                    hmm_pos1 = int(splitLine[17]) - 1
-                    hmm_pos2 = int(splitLine[18])
-                    hmm_score = float(splitLine[13])
-            else:
-                file_out = open(pwd_SCG_tree_wd + '/' + hmm_id + '.fasta', 'a+')
-                file_out.write('>' + faa_file_basename + '\n')
-                if hmm_name != '':
-                    seq = str(proteinSequence[hmm_name][hmm_pos1:hmm_pos2])
-                    file_out.write(str(seq) + '\n')
-                    file_out.close()
-                hmm_id = splitLine[4]
-                hmm_name = splitLine[0]
-                hmm_pos1 = int(splitLine[17]) - 1
-                hmm_pos2 = int(splitLine[18])
-                hmm_score = float(splitLine[13])
+            splitLine = line.rstrip('\n').split(None, 22)
+            genome_to_line_split_dict[get_genome_name(splitLine[0])].append(splitLine)
+
+        for genome in genome_to_search_list:
+            genome_seq_num = get_seq_num('%s/%s.faa' % (pwd_faa_folder, genome))
+            pwd_hmmout_tbl = '%s/%s_hmmout.tbl' % (pwd_SCG_tree_wd, genome)
+            hmmout_tbl_handle = open(pwd_hmmout_tbl, 'w')
+            hmmout_tbl_handle.write(''.join(rescale_hmmout_lines(genome_to_line_split_dict[genome], genome_seq_num)))
+            hmmout_tbl_handle.close()
+            if cache_dir is not None:
+                add_to_cache(cache_dir, genome_to_cache_key_dict[genome], [pwd_hmmout_tbl])
+
+        os.remove(pwd_chunk_faa)
+        os.remove(pwd_chunk_tbl)
+
+    hmmsearch_output_list = []
+    for genome in genome_list:
+        hmm_hit_dict = parse_hmmsearch_output('%s/%s_hmmout.tbl' % (pwd_SCG_tree_wd, genome), '%s/%s.faa' % (pwd_faa_folder, genome))
+        hmmsearch_output_list.append([genome, hmm_hit_dict, genome_to_cache_status_dict[genome]])
+
+    return hmmsearch_output_list
 
-        else:
-            file_out = open(pwd_SCG_tree_wd + '/' + hmm_id + '.fasta', 'a+')
-            file_out.write('>' + faa_file_basename + '\n')
-            if hmm_name != '':
-                seq = str(proteinSequence[hmm_name][hmm_pos1:hmm_pos2])
-                file_out.write(str(seq) + '\n')
-                file_out.close()
+
+def write_SCG_hits(hmmsearch_output_list, genome_list, pwd_SCG_tree_wd):
+
+    # write out hits of each hmm profile once, in the order of genome_list
+    hmm_to_hits_dict = {}
+    for genome, hmmsearch_output in zip(genome_list, hmmsearch_output_list):
+        for hmm_id in hmmsearch_output[0]:
+            if hmm_id not in hmm_to_hits_dict:
+                hmm_to_hits_dict[hmm_id] = []
+            hmm_to_hits_dict[hmm_id].append('>%s\n%s\n' % (genome, hmmsearch_output[0][hmm_id]))
+
+    for hmm_id in sorted(hmm_to_hits_dict):
+        file_out = open('%s/%s.fasta' % (pwd_SCG_tree_wd, hmm_id), 'w')
+        file_out.write(''.join(hmm_to_hits_dict[hmm_id]))
+        file_out.close()
 
 
 def sep_combined_hmm(combined_hmm_file, hmm_profile_sep_folder, hmmfetch_exe, pwd_hmmstat_exe):
@@ -398,167 +687,236 @@ def hmmalign_worker(argument_list):
     os.system('rm %s' % pwd_aln_out_tmp)
 
 
-def remove_low_cov_and_consensus_columns(alignment_file_in, minimal_cov, min_consensus, alignment_file_out):
+def get_alignment_column_mask(alignment_array, minimal_cov, min_consensus, block_col_num=10000):
+
+    # columns to keep: gap percent not higher than minimal_cov and percent of the most abundant residue not lower
+    # than min_consensus, columns are processed in blocks to limit the memory used by temporary arrays
+    sequence_number = alignment_array.shape[0]
+    column_mask = np.zeros(alignment_array.shape[1], dtype=bool)
+    for block_start in range(0, alignment_array.shape[1], block_col_num):
+        block_array = np.asarray(alignment_array[:, block_start:(block_start + block_col_num)])
+
+        dash_number_array = np.count_nonzero(block_array == ord('-'), axis=0)
+        gap_percent_array = (dash_number_array / float(sequence_number)) * 100
 
-    def list_to_segments(list_in):
+        most_abundant_aa_number_array = np.zeros(block_array.shape[1], dtype=np.int64)
+        for each_aa in np.unique(block_array):
+            most_abundant_aa_number_array = np.maximum(most_abundant_aa_number_array, np.count_nonzero(block_array == each_aa, axis=0))
+        most_abundant_aa_percent_array = (most_abundant_aa_number_array / float(sequence_number)) * 100
 
-        segments_out = []
-        current_element = None
-        current_segment = [None, None]
-        for each_element in list_in:
+        column_mask[block_start:(block_start + block_array.shape[1])] = (gap_percent_array <= minimal_cov) & (most_abundant_aa_percent_array >= min_consensus)
 
-            # for the first ellment
-            if current_element == None:
-                current_element = each_element
-                current_segment = [each_element, each_element]
+    return column_mask
 
-            elif each_element == current_element + 1:
-                current_segment[1] = each_element
-                current_element = each_element
 
-            elif each_element != current_element + 1:
+def write_alignment_array(seq_id_list, alignment_array, column_mask, alignment_file_out):
+
+    column_index_array = np.flatnonzero(column_mask)
+    alignment_file_out_handle = open(alignment_file_out, 'w')
+    for seq_index in range(len(seq_id_list)):
+        alignment_file_out_handle.write('>%s\n' % seq_id_list[seq_index])
+        alignment_file_out_handle.write('%s\n' % np.asarray(alignment_array[seq_index])[column_index_array].tobytes().decode())
+    alignment_file_out_handle.close()
 
-                # add segment to list
-                segments_out.append(current_segment)
 
-                # resetting segment
-                current_segment = [each_element, each_element]
-                current_element = each_element
+def remove_low_cov_and_consensus_columns(alignment_file_in, minimal_cov, min_consensus, alignment_file_out):
 
-        # add segment to list
-        segments_out.append(current_segment)
+    # read in alignment, one row per sequence and one column per alignment column
+    alignment = AlignIO.read(alignment_file_in, "fasta")
+    alignment_array = np.array([np.frombuffer(str(each_seq.seq).encode(), dtype=np.uint8) for each_seq in alignment], dtype=np.uint8).reshape(len(alignment), -1)
 
-        return segments_out
+    # remove columns with low coverage and low consensus, write filtered alignment
+    column_mask = get_alignment_column_mask(alignment_array, minimal_cov, min_consensus)
+    write_alignment_array([str(each_seq.id) for each_seq in alignment], alignment_array, column_mask, alignment_file_out)
 
-    def remove_columns_from_msa(alignment_in, cols_to_remove):
 
-        # get 0 based index of all wanted columns
-        cols_to_remove_0_base = [(i - 1) for i in cols_to_remove]
-        aln_cols_index_all = list(range(alignment_in.get_alignment_length()))
-        aln_cols_index_wanted = []
-        for i in aln_cols_index_all:
-            if i not in cols_to_remove_0_base:
-                aln_cols_index_wanted.append(i)
+def concatenate_alignments(aln_file_list, seq_id_list, pwd_memmap_file, memmap_min_size):
 
-        # get wanted alignment segments
-        wanted_segments = list_to_segments(aln_cols_index_wanted)
+    # concatenate alignments into a preallocated (sequences x total columns) matrix, sequences not found in an
+    # alignment are filled with gaps, the matrix is memory-mapped to pwd_memmap_file if larger than memmap_min_size
+    aln_len_list = []
+    for aln_file in aln_file_list:
+        aln_len = 0
+        for seq_id, aligned_seq in iter_fasta(aln_file):
+            aln_len = len(aligned_seq)
+            break
+        aln_len_list.append(aln_len)
 
-        # create an empty Alignment object
-        alignment_new = Align.MultipleSeqAlignment([])
-        for sequence in alignment_in:
-            new_seq_object = Seq('')
-            new_seq_record = SeqRecord(new_seq_object)
-            new_seq_record.id = sequence.id
-            new_seq_record.description = sequence.description
-            alignment_new.append(new_seq_record)
+    matrix_shape = (len(seq_id_list), sum(aln_len_list))
+    if (matrix_shape[0] * matrix_shape[1]) >= memmap_min_size:
+        alignment_array = np.memmap(pwd_memmap_file, dtype=np.uint8, mode='w+', shape=matrix_shape)
+        alignment_array[:] = ord('-')
+    else:
+        alignment_array = np.full(matrix_shape, ord('-'), dtype=np.uint8)
 
-        # add wanted columns to empty Alignment object
-        for segment in wanted_segments:
+    seq_id_to_row_dict = {seq_id_list[i]: i for i in range(len(seq_id_list))}
+    col_start = 0
+    for aln_file, aln_len in zip(aln_file_list, aln_len_list):
+        for seq_id, aligned_seq in iter_fasta(aln_file):
+            if seq_id in seq_id_to_row_dict:
+                alignment_array[seq_id_to_row_dict[seq_id], col_start:(col_start + aln_len)] = np.frombuffer(aligned_seq.encode(), dtype=np.uint8)
+        col_start += aln_len
 
-            # for single column segment
-            if segment[0] == segment[1]:
-                segment_value = alignment_in[:, segment[0]]
+    return alignment_array
 
-                m = 0
-                for each_seq in alignment_new:
-                    each_seq.seq = Seq(str(each_seq.seq) + segment_value[m])
-                    m += 1
 
-            # for multiple columns segment
-            else:
-                segment_value = alignment_in[:, (segment[0]):(segment[1] + 1)]
-                alignment_new += segment_value
+def parallel_blastn_worker(argument_list):
+    query_file = argument_list[0]
+    pwd_query_folder = argument_list[1]
+    pwd_blast_db = argument_list[2]
+    pwd_blast_result_folder = argument_list[3]
+    db_size = argument_list[4]
+    homology_search_backend = argument_list[5]
+    config_dict = argument_list[6]
+    num_threads = argument_list[7]
 
-        return alignment_new
+    pwd_blast_result_file = '%s/%s_blastn.tab' % (pwd_blast_result_folder, '.'.join(query_file.split('.')[:-1]))
+    blastn_cmd = get_search_cmd(homology_search_backend, '%s/%s' % (pwd_query_folder, query_file), pwd_blast_db, pwd_blast_result_file, 'nucl', num_threads, config_dict, db_size=db_size)
+    time_start = time()
+    os.system(blastn_cmd)
 
-    def remove_low_cov_columns(alignment_in, min_cov_cutoff):
+    return time() - time_start
 
-        # get columns with low coverage
-        sequence_number = len(alignment_in)
-        total_col_num = alignment_in.get_alignment_length()
-        low_cov_columns = []
-        n = 0
-        while n < total_col_num:
-            current_column = alignment_in[:, n]
-            dash_number = current_column.count('-')
-            gap_percent = (dash_number / float(sequence_number)) * 100
 
-            if gap_percent > min_cov_cutoff:
-                low_cov_columns.append(n + 1)
+def parallel_blastn_append_worker(argument_list):
+    query_file = argument_list[0]
+    pwd_query_folder = argument_list[1]
+    pwd_blast_db = argument_list[2]
+    pwd_blast_result_folder = argument_list[3]
+    db_size = argument_list[4]
+    homology_search_backend = argument_list[5]
+    config_dict = argument_list[6]
+    num_threads = argument_list[7]
 
-            n += 1
+    # append hits to existing blast results (used by PI -update)
+    pwd_blast_result_file = '%s/%s_blastn.tab' % (pwd_blast_result_folder, '.'.join(query_file.split('.')[:-1]))
+    blastn_cmd = get_search_cmd(homology_search_backend, '%s/%s' % (pwd_query_folder, query_file), pwd_blast_db, pwd_blast_result_file, 'nucl', num_threads, config_dict, db_size=db_size, append=True)
+    time_start = time()
+    os.system(blastn_cmd)
 
-        # remove identified columns
-        alignment_new = remove_columns_from_msa(alignment_in, low_cov_columns)
+    return time() - time_start
 
-        return alignment_new
 
-    def remove_low_consensus_columns(alignment_in, min_css_cutoff):
+def parallel_blastn_fused_worker(argument_list):
+    query_file = argument_list[0]
+    pwd_query_folder = argument_list[1]
+    pwd_blast_db = argument_list[2]
+    pwd_blast_result_filtered_folder = argument_list[3]
+    db_size = argument_list[4]
+    homology_search_backend = argument_list[5]
+    config_dict = argument_list[6]
+    align_len_cutoff = argument_list[7]
+    cover_cutoff = argument_list[8]
+    pwd_blastn_hit_num_file = argument_list[9]
+    num_threads = argument_list[10]
+
+    # filter blastn hits as they are produced (-fuse), only qualified hits are written
+    query_genome = '.'.join(query_file.split('.')[:-1])
+    pwd_blast_result_filtered_file = '%s/%s_blastn_filtered.tab' % (pwd_blast_result_filtered_folder, query_genome)
+    blastn_cmd = get_search_cmd(homology_search_backend, '%s/%s' % (pwd_query_folder, query_file), pwd_blast_db, '/dev/stdout', 'nucl', num_threads, config_dict, db_size=db_size)
+    time_start = time()
+    blastn_process = subprocess.Popen(blastn_cmd, shell=True, stdout=subprocess.PIPE, universal_newlines=True)
+    hit_num, qualified_hit_num = filter_blastn_hits(blastn_process.stdout, pwd_blast_result_filtered_file, align_len_cutoff, cover_cutoff)
+    blastn_process.wait()
+
+    # hits of a failed blastn are incomplete, the job is not recorded as done so it is rerun with -resume
+    if blastn_process.returncode != 0:
+        if os.path.isfile(pwd_blast_result_filtered_file) is True:
+            os.remove(pwd_blast_result_filtered_file)
+        raise subprocess.CalledProcessError(blastn_process.returncode, blastn_cmd)
+
+    record_blastn_hit_num(pwd_blastn_hit_num_file, query_genome, hit_num, qualified_hit_num)
+
+    return time() - time_start
+
+
+def schedule_blastn_jobs(blastn_worker, list_for_multiple_arguments_blastn, job_cost_list, num_threads, pwd_job_timing_file, checkpoint_list=None):
+
+    # longest processing time first: jobs are started in decreasing order of estimated cost (query size x db size),
+    # when there are fewer jobs left than free cores, the remaining jobs get more blastn threads
+    # finished jobs are recorded in the manifest if checkpoint_list ([pwd_manifest, stage, {query: fingerprint}]) is provided
+    job_list = sorted(zip(job_cost_list, list_for_multiple_arguments_blastn), key=lambda x: x[0], reverse=True)
 
-        # get columns with low coverage
-        sequence_number = len(alignment_in)
-        total_col_num = alignment_in.get_alignment_length()
-        low_css_columns = []
-        n = 0
-        while n < total_col_num:
-            current_column = alignment_in[:, n]
+    pool = mp.Pool(processes=num_threads)
+    running_job_list = []
+    free_core_num = num_threads
+    job_timing_list = []
+    while (len(job_list) > 0) or (len(running_job_list) > 0):
+
+        # start jobs
+        while (len(job_list) > 0) and (free_core_num > 0):
+            job_thread_num = max(1, -(-free_core_num // len(job_list)))
+            job_cost, argument_list = job_list.pop(0)
+            running_job_list.append([pool.apply_async(blastn_worker, (argument_list + [job_thread_num],)), argument_list[0], job_cost, job_thread_num])
+            free_core_num -= job_thread_num
+
+        # collect finished jobs
+        finished_job_list = [i for i in running_job_list if i[0].ready() is True]
+        for finished_job in finished_job_list:
+            job_timing_list.append([finished_job[1], finished_job[2], finished_job[3], finished_job[0].get()])
+            if checkpoint_list is not None:
+                record_task(checkpoint_list[0], checkpoint_list[1], finished_job[1], checkpoint_list[2][finished_job[1]])
+            free_core_num += finished_job[3]
+            running_job_list.remove(finished_job)
+        if len(finished_job_list) == 0:
+            sleep(0.1)
 
-            # get all aa in current column
-            aa_list = set()
-            for aa in current_column:
-                aa_list.add(aa)
+    pool.close()
+    pool.join()
 
-            # get maximum aa percent
-            most_abundant_aa_percent = 0
-            for each_aa in aa_list:
-                each_aa_percent = (current_column.count(each_aa) / float(sequence_number)) * 100
-                if each_aa_percent > most_abundant_aa_percent:
-                    most_abundant_aa_percent = each_aa_percent
+    # per-job timing, for calibrating cost estimates across runs
+    write_header = os.path.isfile(pwd_job_timing_file) is False
+    job_timing_file_handle = open(pwd_job_timing_file, 'a')
+    if write_header is True:
+        job_timing_file_handle.write('Query\tEstimated_cost\tThreads\tTime(s)\n')
+    for job_timing in job_timing_list:
+        job_timing_file_handle.write('%s\t%s\t%s\t%.2f\n' % tuple(job_timing))
+    job_timing_file_handle.close()
 
-            # if maximum percent lower than provided cutoff, add current column to low consensus column list
-            if most_abundant_aa_percent < min_css_cutoff:
-                low_css_columns.append(n + 1)
 
-            n += 1
+def mirror_blastn_hit(blastn_hit_split):
 
-        # remove identified columns
-        alignment_new = remove_columns_from_msa(alignment_in, low_css_columns)
+    # swap query and subject of a blastn hit (outfmt 6 with qlen and slen), query stays on the plus strand
+    qseqid, sseqid, pident, align_len, mismatch, gapopen, qstart, qend, sstart, send, evalue, bitscore, qlen, slen = blastn_hit_split
+    if int(sstart) <= int(send):
+        return [sseqid, qseqid, pident, align_len, mismatch, gapopen, sstart, send, qstart, qend, evalue, bitscore, slen, qlen]
+    else:
+        return [sseqid, qseqid, pident, align_len, mismatch, gapopen, send, sstart, qend, qstart, evalue, bitscore, slen, qlen]
 
-        return alignment_new
 
-    # read in alignment
-    alignment = AlignIO.read(alignment_file_in, "fasta")
+def mirror_blastn_results(pwd_blast_result_folder, genome_list, genome_to_shard_dict, blast_result_suffix='blastn.tab'):
 
-    # remove_low_cov_columns
-    alignment_cov = remove_low_cov_columns(alignment, minimal_cov)
+    # in symmetric mode, genomes were searched only against their own and following shards, append hits between
+    # shards to the blast results of subject genomes with query and subject swapped
+    # filtered results (-fuse, blast_result_suffix blastn_filtered.tab) are not written if no hit qualified
+    for query_genome in genome_list:
+        query_shard = genome_to_shard_dict[query_genome]
+        subject_genome_to_hits_dict = {}
+        pwd_blast_result_file = '%s/%s_%s' % (pwd_blast_result_folder, query_genome, blast_result_suffix)
+        if os.path.isfile(pwd_blast_result_file) is False:
+            continue
+        for blastn_hit in open(pwd_blast_result_file):
+            blastn_hit_split = blastn_hit.strip().split('\t')
+            subject_genome = get_genome_name(blastn_hit_split[1])
+            if genome_to_shard_dict[subject_genome] > query_shard:
+                if subject_genome not in subject_genome_to_hits_dict:
+                    subject_genome_to_hits_dict[subject_genome] = []
+                subject_genome_to_hits_dict[subject_genome].append('\t'.join(mirror_blastn_hit(blastn_hit_split)))
 
-    # remove_low_consensus_columns
-    alignment_cov_css = remove_low_consensus_columns(alignment_cov, min_consensus)
+        for subject_genome in subject_genome_to_hits_dict:
+            subject_blastn_results_handle = open('%s/%s_%s' % (pwd_blast_result_folder, subject_genome, blast_result_suffix), 'a')
+            subject_blastn_results_handle.write('%s\n' % '\n'.join(subject_genome_to_hits_dict[subject_genome]))
+            subject_blastn_results_handle.close()
 
-    # write filtered alignment
-    alignment_file_out_handle = open(alignment_file_out, 'w')
-    for each_seq in alignment_cov_css:
-        alignment_file_out_handle.write('>%s\n' % str(each_seq.id))
-        alignment_file_out_handle.write('%s\n' % str(each_seq.seq))
-    alignment_file_out_handle.close()
 
+def get_total_seq_len(seq_file):
 
-def parallel_blastn_worker(argument_list):
-    query_file = argument_list[0]
-    pwd_query_folder = argument_list[1]
-    pwd_blast_db = argument_list[2]
-    pwd_blast_result_folder = argument_list[3]
-    blast_parameters = argument_list[4]
-    pwd_blastn_exe = argument_list[5]
+    total_seq_len = 0
+    for each_line in open(seq_file):
+        if not each_line.startswith('>'):
+            total_seq_len += len(each_line.strip())
 
-    pwd_blast_result_file = '%s/%s_blastn.tab' % (pwd_blast_result_folder, '.'.join(query_file.split('.')[:-1]))
-    blastn_cmd = '%s -query %s/%s -db %s -out %s %s' % (pwd_blastn_exe,
-                                                        pwd_query_folder,
-                                                        query_file,
-                                                        pwd_blast_db,
-                                                        pwd_blast_result_file,
-                                                        blast_parameters)
-    os.system(blastn_cmd)
+    return total_seq_len
 
 
 def PI(args, config_dict):
@@ -576,11 +934,22 @@ def PI(args, config_dict):
     keep_quiet =            args['quiet']
     force_overwrite =       args['force']
     noblast =               args['noblast']
+    update_mode =           args['update']
+    use_cache =             args['cache']
+    symmetric_mode =        args['symmetric']
+    homology_search_backend = args['aligner']
+    hmmsearch_batch_mode =  args['hmmbatch']
+    resume_mode =           args['resume']
+    fused_mode =            args['fuse']
+    align_len_cutoff =      args['al']
+    cover_cutoff =          args['cov']
+    write_gbk =             args['nogbk'] is False
+
+    # per-stage wall time, CPU time, memory and I/O
+    run_report = new_run_report('PI', args)
 
     # read in config file
     path_to_hmm =           config_dict['path_to_hmm']
-    pwd_makeblastdb_exe =   config_dict['makeblastdb']
-    pwd_blastn_exe =        config_dict['blastn']
     pwd_prodigal_exe =      config_dict['prodigal']
     pwd_hmmsearch_exe =     config_dict['hmmsearch']
     pwd_hmmfetch_exe =      config_dict['hmmfetch']
@@ -588,14 +957,21 @@ def PI(args, config_dict):
     pwd_hmmstat_exe =       config_dict['hmmstat']
     pwd_fasttree_exe =      config_dict['fasttree']
 
+    # cached Prodigal and hmmsearch results are used with -cache
+    cache_dir = None
+    if use_cache is True:
+        cache_dir = config_dict['cache_dir']
+        os.makedirs(cache_dir, exist_ok=True)
+
     warnings.filterwarnings("ignore")
 
     minimal_cov_in_msa          = 50
     min_consensus_in_msa        = 25
     rank_abbre_dict             = {'d': 'domain', 'p': 'phylum', 'c': 'class', 'o': 'order', 'f': 'family', 'g': 'genus', 's': 'species'}
     rank_abbre_dict_plural      = {'d': 'domains', 'p': 'phyla', 'c': 'classes', 'o': 'orders', 'f': 'families', 'g': 'genera', 's': 'species'}
-    rank_to_position_dict       = {'d': 0, 'p': 1, 'c': 2, 'o': 3, 'f': 4, 'g': 5, 's': 6}
-    blast_parameters            = '-evalue 1e-5 -outfmt "6 qseqid sseqid pident length mismatch gapopen qstart qend sstart send evalue bitscore qlen slen" -task blastn -num_threads %s' % 1
+    symmetric_shard_num         = 100
+    hmmsearch_chunk_min_size    = 20 * 1024 * 1024
+    alignment_memmap_min_size   = 1024 * 1024 * 1024
 
 
     ######################################## check input file and dependencies #########################################
@@ -604,7 +980,7 @@ def PI(args, config_dict):
         input_genome_folder = input_genome_folder[:-1]
 
     # check whether executables exist
-    program_list = [pwd_makeblastdb_exe, pwd_blastn_exe, pwd_prodigal_exe, pwd_hmmsearch_exe, pwd_hmmfetch_exe, pwd_hmmalign_exe, pwd_hmmstat_exe, pwd_fasttree_exe]
+    program_list = get_homology_search_program_list(homology_search_backend, 'nucl', config_dict) + [pwd_prodigal_exe, pwd_hmmsearch_exe, pwd_hmmfetch_exe, pwd_hmmalign_exe, pwd_hmmstat_exe, pwd_fasttree_exe]
     not_detected_programs = []
     for needed_program in program_list:
         if find_executable(needed_program) is None:
@@ -658,95 +1034,61 @@ def PI(args, config_dict):
     pwd_log_file =   '%s/%s_%s_PI_%s.log'    % (pwd_log_folder, output_prefix, grouping_levels, datetime.now().strftime('%Y-%m-%d_%Hh-%Mm-%Ss_%f'))
     pwd_ignored_taxonomic_rank_file = '%s/ignored_taxonomic_rank.txt' % MetaCHIP_wd
 
-    if (os.path.isdir(MetaCHIP_wd) is True) and (force_overwrite is False):
+    pwd_manifest =   '%s/%s_%s_PI_manifest.txt' % (MetaCHIP_wd, output_prefix, grouping_levels)
+
+    if update_mode is True:
+        if os.path.isdir(MetaCHIP_wd) is False:
+            print('MetaCHIP working directory not found, program exited!')
+            exit()
+        if os.path.isdir(pwd_log_folder) is False:
+            os.mkdir(pwd_log_folder)
+        if resume_mode is True:
+            print('-resume is ignored in update mode.')
+            resume_mode = False
+
+    # keep completed tasks recorded in the manifest
+    elif (os.path.isdir(MetaCHIP_wd) is True) and (resume_mode is True):
+        if os.path.isdir(pwd_log_folder) is False:
+            os.mkdir(pwd_log_folder)
+
+    elif (os.path.isdir(MetaCHIP_wd) is True) and (force_overwrite is False):
         print('MetaCHIP working directory detected, program exited!')
         exit()
     else:
         force_create_folder(MetaCHIP_wd)
         force_create_folder(pwd_log_folder)
 
+    manifest_dict = {}
+    if resume_mode is True:
+        manifest_dict = read_manifest(pwd_manifest)
+
 
     ############################################ read GTDB output into dict  ###########################################
 
+    start_stage(run_report, 'Grouping')
     genomes_with_grouping = set()
     taxon_2_genome_dict_of_dict = {}
     ignored_genome_num = 0
     if grouping_levels == 'x':
 
         # read in grouping file
-        group_id_2_genome_dict = {}
-        for each_genome in open(grouping_file):
-            each_genome_split = each_genome.strip().split(',')
-            group_id = each_genome_split[0]
-            genome_name = each_genome_split[1]
-
-            genomes_with_grouping.add(genome_name)
-
-            if group_id not in group_id_2_genome_dict:
-                group_id_2_genome_dict[group_id] = [genome_name]
-            else:
-                group_id_2_genome_dict[group_id].append(genome_name)
+        group_id_2_genome_dict = read_grouping_file(grouping_file)
+        for group_id in group_id_2_genome_dict:
+            genomes_with_grouping.update(group_id_2_genome_dict[group_id])
 
         taxon_2_genome_dict_of_dict['x'] = group_id_2_genome_dict
 
     else:
         # read GTDB output into dict
-        taxon_assignment_dict = {}
-        for each_genome in open(GTDB_output_file):
-            if not each_genome.startswith('user_genome'):
-                each_split = each_genome.strip().split('\t')
-
-                if len(each_split) == 1:
-                    print('Unrecognisable %s, please make sure columns are tab separated, program exited!' % GTDB_output_file)
-                    exit()
-
-                bin_name = each_split[0]
-
-                if bin_name in input_genome_basename_list:
-
-                    assignment_full = []
-                    if len(each_split) == 1:
-                        assignment_full = ['d__', 'p__', 'c__', 'o__', 'f__', 'g__', 's__']
-                    elif (len(each_split) > 1) and (';' in each_split[1]):
-                        assignment = each_split[1].split(';')
-                        if len(assignment) == 7:
-                            assignment_full = assignment
-                        if len(assignment) == 6:
-                            assignment_full = assignment + ['s__']
-                        if len(assignment) == 5:
-                            assignment_full = assignment + ['g__', 's__']
-                        if len(assignment) == 4:
-                            assignment_full = assignment + ['f__', 'g__', 's__']
-                        if len(assignment) == 3:
-                            assignment_full = assignment + ['o__', 'f__', 'g__', 's__']
-                        if len(assignment) == 2:
-                            assignment_full = assignment + ['c__', 'o__', 'f__', 'g__', 's__']
-
-                    elif (len(each_split) > 1) and (';' not in each_split[1]):
-                        assignment_full = [each_split[1]] + ['p__', 'c__', 'o__', 'f__', 'g__', 's__']
-
-                    # store in dict
-                    taxon_assignment_dict[bin_name] = assignment_full
+        taxon_assignment_dict = read_taxonomy_file(GTDB_output_file, input_genome_basename_list)
+
+        # group genomes at all specified ranks in one pass
+        taxon_index_dict = index_taxonomy(taxon_assignment_dict, grouping_levels)
 
         # get all identified taxon at defined ranks
         for grouping_level in grouping_levels:
 
-            taxon_2_genome_dict = {}
-
-            specified_rank_pos = rank_to_position_dict[grouping_level]
-            identified_taxon_list = []
-            for each_TaxonAssign in taxon_assignment_dict:
-                specified_rank_id = taxon_assignment_dict[each_TaxonAssign][specified_rank_pos]
-                if specified_rank_id not in identified_taxon_list:
-                    identified_taxon_list.append(specified_rank_id)
-
-            # get the id of genomes assigned to each taxon at specified level
-            for each_taxon in identified_taxon_list:
-                genome_list = []
-                for genome in taxon_assignment_dict:
-                    if taxon_assignment_dict[genome][specified_rank_pos] == each_taxon:
-                        genome_list.append(genome)
-                taxon_2_genome_dict[each_taxon] = genome_list
+            taxon_2_genome_dict = taxon_index_dict[grouping_level]
 
             # get the number of ignored genome
             unclassified_symbol = '%s__' % grouping_level
@@ -758,12 +1100,10 @@ def PI(args, config_dict):
             group_num = len(taxon_2_genome_dict)
 
             # for report and log
-            sleep(0.5)
             report_and_log(('Input genomes grouped into %s %s.' % (group_num, rank_abbre_dict_plural[grouping_level])), pwd_log_file, keep_quiet)
 
             # report ignored genomes
             if ignored_genome_num > 0:
-                sleep(0.5)
                 report_and_log(('Ignored %s genome(s) for %s level HGT detection (unknown %s assignment).' % (ignored_genome_num, rank_abbre_dict[grouping_level], rank_abbre_dict[grouping_level])), pwd_log_file, keep_quiet)
 
             taxon_2_genome_dict_of_dict[grouping_level] = taxon_2_genome_dict
@@ -783,27 +1123,19 @@ def PI(args, config_dict):
         pwd_ignored_taxonomic_rank_file_handle = open(pwd_ignored_taxonomic_rank_file, 'w')
         pwd_ignored_taxonomic_rank_file_handle.write('%s\n' % '\n'.join(ignored_rank_list))
         pwd_ignored_taxonomic_rank_file_handle.close()
+    elif os.path.isfile(pwd_ignored_taxonomic_rank_file) is True:
+        os.remove(pwd_ignored_taxonomic_rank_file)
 
     if len(ignored_rank_list) == len(taxon_2_genome_dict_of_dict):
-        sleep(0.5)
         report_and_log(('Input genomes come from the same taxonomic group at all specified levels, program exited!'),pwd_log_file, keep_quiet)
         report_and_log(('Please note that file extension (e.g. fa, fasta) of the input genomes should NOT be included in the taxonomy or grouping file.'),pwd_log_file, keep_quiet)
         exit()
     else:
         for ignored_rank in ignored_rank_list:
-            sleep(0.5)
             report_and_log(('Input genomes come from the same %s, ignored %s level HGT detection.' % (rank_abbre_dict[ignored_rank], rank_abbre_dict[ignored_rank])),pwd_log_file, keep_quiet)
 
-    genome_for_HGT_detection_list = []
-    for each_qualified_rank in taxon_2_genome_dict_of_dict_qualified:
-        current_rank_group_to_genome_dict = taxon_2_genome_dict_of_dict_qualified[each_qualified_rank]
-        for each_group in current_rank_group_to_genome_dict:
-            genome_members = current_rank_group_to_genome_dict[each_group]
-            for each_genome in genome_members:
-                if each_genome not in genome_for_HGT_detection_list:
-                    genome_for_HGT_detection_list.append('%s' % each_genome)
+    genome_for_HGT_detection_list = get_qualified_genome_list(taxon_2_genome_dict_of_dict_qualified)
 
-    sleep(0.5)
     report_and_log(('Total number of qualified genomes for HGT detection: %s.' % len(genome_for_HGT_detection_list)), pwd_log_file, keep_quiet)
 
 
@@ -814,7 +1146,7 @@ def PI(args, config_dict):
     prodigal_output_folder =             '%s_%s_prodigal_output'               % (output_prefix, grouping_levels)
     newick_tree_file =                   '%s_%s_SCG_tree.newick'               % (output_prefix, grouping_levels)
     SCG_tree_wd =                        '%s_%s_get_SCG_tree_wd'               % (output_prefix, grouping_levels)
-    combined_alignment_file_tmp =        '%s_%s_SCG_tree_tmp.aln'              % (output_prefix, grouping_levels)
+    combined_alignment_memmap =          '%s_%s_SCG_tree_tmp.mmap'             % (output_prefix, grouping_levels)
     combined_alignment_file =            '%s_%s_SCG_tree_cov%s_css%s.aln'      % (output_prefix, grouping_levels, minimal_cov_in_msa, min_consensus_in_msa)
     hmm_profile_sep_folder =             '%s_%s_hmm_profile_fetched'           % (output_prefix, grouping_levels)
     blast_db_folder =                    '%s_%s_blastdb'                       % (output_prefix, grouping_levels)
@@ -824,7 +1156,7 @@ def PI(args, config_dict):
     pwd_combined_ffn_file =              '%s/%s/%s'                            % (MetaCHIP_wd, blast_db_folder, combined_ffn_file)
     pwd_combined_faa_file =              '%s/%s'                               % (MetaCHIP_wd, combined_faa_file)
     pwd_prodigal_output_folder =         '%s/%s'                               % (MetaCHIP_wd, prodigal_output_folder)
-    pwd_combined_alignment_file_tmp =    '%s/%s/%s'                            % (MetaCHIP_wd, SCG_tree_wd, combined_alignment_file_tmp)
+    pwd_combined_alignment_memmap =      '%s/%s/%s'                            % (MetaCHIP_wd, SCG_tree_wd, combined_alignment_memmap)
     pwd_hmm_profile_sep_folder =         '%s/%s/%s'                            % (MetaCHIP_wd, SCG_tree_wd, hmm_profile_sep_folder)
     pwd_combined_alignment_file =        '%s/%s'                               % (MetaCHIP_wd, combined_alignment_file)
     pwd_SCG_tree_wd =                    '%s/%s'                               % (MetaCHIP_wd, SCG_tree_wd)
@@ -832,6 +1164,60 @@ def PI(args, config_dict):
     pwd_blast_db_folder =                '%s/%s'                               % (MetaCHIP_wd, blast_db_folder)
     pwd_blast_result_folder =            '%s/%s'                               % (MetaCHIP_wd, blast_result_folder)
     pwd_blast_cmd_file =                 '%s/%s'                               % (MetaCHIP_wd, blast_cmd_file)
+    blast_result_filtered_folder =       '%s_%s_blastn_results_filtered_al%sbp_cov%s' % (output_prefix, grouping_levels, align_len_cutoff, cover_cutoff)
+    pwd_blast_result_filtered_folder =   '%s/%s'                               % (MetaCHIP_wd, blast_result_filtered_folder)
+    pwd_blastn_hit_num_file =            '%s/%s_%s_blastn_hit_num.txt'         % (MetaCHIP_wd, output_prefix, grouping_levels)
+    pwd_blastn_job_timing_file =         '%s/%s_%s_blastn_job_timing.txt'      % (MetaCHIP_wd, output_prefix, grouping_levels)
+    pwd_gene_table =                     '%s/%s_%s_gene_table.txt'             % (MetaCHIP_wd, output_prefix, grouping_levels)
+    blast_db_folder_new_genomes =        '%s_%s_blastdb_new_genomes'           % (output_prefix, grouping_levels)
+    pwd_blast_db_folder_new_genomes =    '%s/%s'                               % (MetaCHIP_wd, blast_db_folder_new_genomes)
+    pwd_combined_ffn_file_new_genomes =  '%s/%s_%s_new_genomes_ffn.fasta'      % (pwd_blast_db_folder_new_genomes, output_prefix, grouping_levels)
+    pwd_run_report_json =                '%s/%s_%s_PI_run_report.json'         % (MetaCHIP_wd, output_prefix, grouping_levels)
+    pwd_run_report_txt =                 '%s/%s_%s_PI_run_report.txt'          % (MetaCHIP_wd, output_prefix, grouping_levels)
+
+
+    ######################################## find out new genomes (update mode) ########################################
+
+    new_genome_list = genome_for_HGT_detection_list
+    previous_genome_list = []
+    if update_mode is True:
+
+        if os.path.isdir(pwd_prodigal_output_folder) is False:
+            report_and_log(('Previous PI results (%s) not found, program exited!' % prodigal_output_folder), pwd_log_file, keep_quiet)
+            exit()
+
+        previous_genome_list = [os.path.basename(i)[:-len('.ffn')] for i in glob.glob('%s/*.ffn' % pwd_prodigal_output_folder)]
+        previous_genome_set = set(previous_genome_list)
+        current_genome_set = set(genome_for_HGT_detection_list)
+        new_genome_list = [i for i in genome_for_HGT_detection_list if i not in previous_genome_set]
+
+        removed_genome_list = sorted(previous_genome_set - current_genome_set)
+        if len(removed_genome_list) > 0:
+            report_and_log(('%s previously processed genome(s) not found in current input (e.g. %s), please rerun PI with -force, program exited!' % (len(removed_genome_list), removed_genome_list[0])), pwd_log_file, keep_quiet)
+            exit()
+
+        if len(new_genome_list) == 0:
+            report_and_log('No new genome detected, nothing to update, program exited!', pwd_log_file, keep_quiet)
+            exit()
+
+        # unfiltered blastn results are needed to append hits of previously processed genomes
+        if os.path.isfile(pwd_blastn_hit_num_file) is True:
+            report_and_log(('Previous blastn results were filtered during PI (-fuse) and can not be updated, please rerun PI with -force, program exited!'), pwd_log_file, keep_quiet)
+            exit()
+        if fused_mode is True:
+            report_and_log(('-fuse is ignored in update mode.'), pwd_log_file, keep_quiet)
+            fused_mode = False
+
+        report_and_log(('Update mode: %s new genome(s) will be added to %s previously processed genome(s).' % (len(new_genome_list), len(previous_genome_list))), pwd_log_file, keep_quiet)
+
+        # filtered blast results from previous BP runs are outdated
+        for previous_filtered_folder in glob.glob('%s/%s_*_blastn_results_filtered_al*bp_cov*' % (MetaCHIP_wd, output_prefix)):
+            shutil.rmtree(previous_filtered_folder, ignore_errors=True)
+
+        # grouping files will be regenerated
+        if grouping_levels != 'x':
+            for previous_grouping_file in glob.glob('%s/%s_grouping_*.txt' % (MetaCHIP_wd, output_prefix)):
+                os.remove(previous_grouping_file)
 
 
     ################################################### get grouping ###################################################
@@ -863,178 +1249,405 @@ def PI(args, config_dict):
             grouping_file_handle.close()
 
             # for report and log
-            sleep(0.5)
             report_and_log(('Grouping file exported to: %s.' % grouping_file_name), pwd_log_file, keep_quiet)
 
 
     ######################################## run prodigal with multiprocessing #########################################
 
     # for report and log
-    report_and_log(('Running Prodigal for %s qualified genomes with %s cores (1-3 minutes per genome per core).' % (len(genome_for_HGT_detection_list), num_threads)), pwd_log_file, keep_quiet)
+    report_and_log(('Running Prodigal for %s qualified genomes with %s cores (1-3 minutes per genome per core).' % (len(new_genome_list), num_threads)), pwd_log_file, keep_quiet)
 
     # create prodigal output folder
-    os.mkdir(pwd_prodigal_output_folder)
+    if os.path.isdir(pwd_prodigal_output_folder) is False:
+        os.mkdir(pwd_prodigal_output_folder)
 
-    # prepare arguments for prodigal_worker
+    # prepare arguments for prodigal_worker, genomes annotated by an interrupted run will be skipped with -resume
     list_for_multiple_arguments_Prodigal = []
-    for input_genome in genome_for_HGT_detection_list:
+    for input_genome in new_genome_list:
         input_genome_with_extension = '%s.%s' % (input_genome, file_extension)
-        list_for_multiple_arguments_Prodigal.append([input_genome_with_extension, input_genome_folder, pwd_prodigal_exe, nonmeta_mode, pwd_prodigal_output_folder])
+        prodigal_fingerprint = get_fingerprint(['%s/%s' % (input_genome_folder, input_genome_with_extension)], [nonmeta_mode])
+        prodigal_output_list = ['%s/%s.%s' % (pwd_prodigal_output_folder, input_genome, i) for i in get_prodigal_output_ext_list(write_gbk)]
+        if is_task_done(manifest_dict, 'prodigal', input_genome, prodigal_fingerprint, prodigal_output_list) is False:
+            list_for_multiple_arguments_Prodigal.append([prodigal_worker, [input_genome_with_extension, input_genome_folder, pwd_prodigal_exe, nonmeta_mode, pwd_prodigal_output_folder, cache_dir, write_gbk], pwd_manifest, 'prodigal', input_genome, prodigal_fingerprint])
+
+    if resume_mode is True:
+        report_and_log(('Resume: Prodigal results of %s genomes found in %s.' % (len(new_genome_list) - len(list_for_multiple_arguments_Prodigal), prodigal_output_folder)), pwd_log_file, keep_quiet)
 
     # run prodigal with multiprocessing
+    start_stage(run_report, 'Prodigal', len(list_for_multiple_arguments_Prodigal))
     pool = mp.Pool(processes=num_threads)
-    pool.map(prodigal_worker, list_for_multiple_arguments_Prodigal)
+    prodigal_cache_status_list = pool.map(checkpoint_worker, list_for_multiple_arguments_Prodigal)
     pool.close()
     pool.join()
 
+    if use_cache is True:
+        update_cache_stats(cache_dir, 'prodigal', prodigal_cache_status_list)
+        report_and_log(('Prodigal results of %s genomes linked from cache.' % prodigal_cache_status_list.count('hit')), pwd_log_file, keep_quiet)
+
+        # also enforced here as hmmsearch is skipped if the SCG tree is done
+        evict_cache(cache_dir, config_dict['cache_max_size'])
+
+    # genome table with the number of genes in each genome, BP refers to genes by (genome index, gene index)
+    write_gene_table(pwd_gene_table, genome_for_HGT_detection_list, pwd_prodigal_output_folder)
+
 
     ########################################### get species tree (hmmsearch) ###########################################
 
-    # create wd
-    os.mkdir(pwd_SCG_tree_wd)
+    # the SCG tree depends on proteins of all qualified genomes and the hmm profiles, skipped with -resume if unchanged
+    hmmsearch_fingerprint_dict = {i: get_fingerprint(['%s/%s.faa' % (pwd_prodigal_output_folder, i), path_to_hmm]) for i in genome_for_HGT_detection_list}
+    SCG_tree_fingerprint = get_fingerprint([], [hmmsearch_fingerprint_dict[i] for i in genome_for_HGT_detection_list])
+    SCG_tree_done = is_task_done(manifest_dict, 'SCG_tree', 'SCG_tree', SCG_tree_fingerprint, [pwd_newick_tree_file])
 
-    # for report and log
-    report_and_log(('Get SCG tree: running hmmsearch with %s cores.' % num_threads), pwd_log_file, keep_quiet)
+    if SCG_tree_done is True:
+        report_and_log(('Resume: SCG tree found at %s.' % newick_tree_file), pwd_log_file, keep_quiet)
 
-    # prepare arguments for hmmsearch_worker
-    list_for_multiple_arguments_hmmsearch = []
-    for faa_file_basename in genome_for_HGT_detection_list:
-        list_for_multiple_arguments_hmmsearch.append([faa_file_basename, pwd_SCG_tree_wd, pwd_hmmsearch_exe, path_to_hmm, pwd_prodigal_output_folder])
+    else:
 
-    # run hmmsearch with multiprocessing
-    pool = mp.Pool(processes=num_threads)
-    pool.map(hmmsearch_worker, list_for_multiple_arguments_hmmsearch)
-    pool.close()
-    pool.join()
+        # create wd, hmmsearch results of previously processed genomes will be reused in update mode
+        if os.path.isdir(pwd_SCG_tree_wd) is False:
+            os.mkdir(pwd_SCG_tree_wd)
+        else:
+            for previous_alignment in glob.glob('%s/*.fasta' % pwd_SCG_tree_wd):
+                os.remove(previous_alignment)
+
+        # with -resume, domtblout files not recorded in the manifest might be incomplete
+        if resume_mode is True:
+            for genome in genome_for_HGT_detection_list:
+                pwd_hmmout_tbl = '%s/%s_hmmout.tbl' % (pwd_SCG_tree_wd, genome)
+                if (os.path.isfile(pwd_hmmout_tbl) is True) and (is_task_done(manifest_dict, 'hmmsearch', genome, hmmsearch_fingerprint_dict[genome]) is False):
+                    os.remove(pwd_hmmout_tbl)
+
+        # for report and log
+        report_and_log(('Get SCG tree: running hmmsearch with %s cores.' % num_threads), pwd_log_file, keep_quiet)
+        start_stage(run_report, 'hmmsearch', len(genome_for_HGT_detection_list))
+
+        # hmm profiles are part of the cache key of hmmsearch results
+        hmm_md5 = None
+        if use_cache is True:
+            hmm_md5 = get_file_md5(path_to_hmm)
+
+        if hmmsearch_batch_mode is False:
+
+            # prepare arguments for hmmsearch_worker
+            list_for_multiple_arguments_hmmsearch = []
+            for faa_file_basename in genome_for_HGT_detection_list:
+                list_for_multiple_arguments_hmmsearch.append([hmmsearch_worker, [faa_file_basename, pwd_SCG_tree_wd, pwd_hmmsearch_exe, path_to_hmm, pwd_prodigal_output_folder, cache_dir, hmm_md5], pwd_manifest, 'hmmsearch', faa_file_basename, hmmsearch_fingerprint_dict[faa_file_basename]])
+
+            # run hmmsearch with multiprocessing
+            pool = mp.Pool(processes=num_threads)
+            hmmsearch_output_list = pool.map(checkpoint_worker, list_for_multiple_arguments_hmmsearch)
+            pool.close()
+            pool.join()
 
+        else:
 
-    ############################################# get species tree (hmmalign) #############################################
+            # search chunks of genomes, each with multiple cores
+            hmmsearch_chunk_list, hmmsearch_cpu_num = get_hmmsearch_chunk_list(genome_for_HGT_detection_list, pwd_prodigal_output_folder, num_threads, hmmsearch_chunk_min_size)
+            report_and_log(('Get SCG tree: hmmsearch in %s batches, %s cores per batch.' % (len(hmmsearch_chunk_list), hmmsearch_cpu_num)), pwd_log_file, keep_quiet)
 
-    # for report and log
-    report_and_log(('Get SCG tree: running hmmalign with %s cores.' % num_threads), pwd_log_file, keep_quiet)
+            list_for_multiple_arguments_hmmsearch_batch = []
+            for chunk_index in range(len(hmmsearch_chunk_list)):
+                list_for_multiple_arguments_hmmsearch_batch.append([hmmsearch_chunk_list[chunk_index], pwd_SCG_tree_wd, pwd_hmmsearch_exe, path_to_hmm, pwd_prodigal_output_folder, cache_dir, hmm_md5, hmmsearch_cpu_num, chunk_index + 1])
 
-    # fetch combined hmm profiles
-    os.mkdir(pwd_hmm_profile_sep_folder)
-    sep_combined_hmm(path_to_hmm, pwd_hmm_profile_sep_folder, pwd_hmmfetch_exe, pwd_hmmstat_exe)
+            pool = mp.Pool(processes=len(hmmsearch_chunk_list))
+            hmmsearch_batch_output_list = pool.map(hmmsearch_batch_worker, list_for_multiple_arguments_hmmsearch_batch)
+            pool.close()
+            pool.join()
 
-    # Call hmmalign to align all single fasta files with hmms
-    files = os.listdir(pwd_SCG_tree_wd)
-    fastaFiles = [i for i in files if i.endswith('.fasta')]
+            # back to the order of genomes
+            genome_to_hmmsearch_output_dict = {}
+            for hmmsearch_batch_output in hmmsearch_batch_output_list:
+                for genome, hmm_hit_dict, cache_status in hmmsearch_batch_output:
+                    genome_to_hmmsearch_output_dict[genome] = [hmm_hit_dict, cache_status]
+                    record_task(pwd_manifest, 'hmmsearch', genome, hmmsearch_fingerprint_dict[genome])
+            hmmsearch_output_list = [genome_to_hmmsearch_output_dict[i] for i in genome_for_HGT_detection_list]
 
-    # prepare arguments for hmmalign_worker
-    list_for_multiple_arguments_hmmalign = []
-    for fastaFile in fastaFiles:
+        # write out sequences of each SCG
+        write_SCG_hits(hmmsearch_output_list, genome_for_HGT_detection_list, pwd_SCG_tree_wd)
+        hmmsearch_cache_status_list = [i[1] for i in hmmsearch_output_list]
 
-        fastaFiles_basename = '.'.join(fastaFile.split('.')[:-1])
-        list_for_multiple_arguments_hmmalign.append([fastaFiles_basename, pwd_SCG_tree_wd, pwd_hmm_profile_sep_folder, pwd_hmmalign_exe])
+        if use_cache is True:
+            update_cache_stats(cache_dir, 'hmmsearch', hmmsearch_cache_status_list)
+            evict_cache(cache_dir, config_dict['cache_max_size'])
 
-    # run hmmalign with multiprocessing
-    pool = mp.Pool(processes=num_threads)
-    pool.map(hmmalign_worker, list_for_multiple_arguments_hmmalign)
-    pool.close()
-    pool.join()
 
+        ############################################# get species tree (hmmalign) #############################################
 
-    ################################### get species tree (Concatenating alignments) ####################################
+        # for report and log
+        report_and_log(('Get SCG tree: running hmmalign with %s cores.' % num_threads), pwd_log_file, keep_quiet)
 
-    # for report and log
-    report_and_log('Get SCG tree: concatenating alignments.', pwd_log_file, keep_quiet)
-
-    # concatenating the single alignments
-    concatAlignment = {}
-    for element in genome_for_HGT_detection_list:
-        concatAlignment[element] = ''
-
-    # Reading all single alignment files and append them to the concatenated alignment
-    files = os.listdir(pwd_SCG_tree_wd)
-    fastaFiles = [i for i in files if i.endswith('.fasta')]
-    for faa_file_basename in fastaFiles:
-        fastaFile = pwd_SCG_tree_wd + '/' + faa_file_basename
-        proteinSequence = {}
-        alignmentLength = 0
-        for seq_record_2 in SeqIO.parse(fastaFile, 'fasta'):
-            proteinName = seq_record_2.id
-            proteinSequence[proteinName] = str(seq_record_2.seq)
-            alignmentLength = len(proteinSequence[proteinName])
-
-        for element in genome_for_HGT_detection_list:
-            if element in proteinSequence.keys():
-                concatAlignment[element] += proteinSequence[element]
-            else:
-                concatAlignment[element] += '-' * alignmentLength
+        # fetch combined hmm profiles
+        if os.path.isdir(pwd_hmm_profile_sep_folder) is False:
+            os.mkdir(pwd_hmm_profile_sep_folder)
+            sep_combined_hmm(path_to_hmm, pwd_hmm_profile_sep_folder, pwd_hmmfetch_exe, pwd_hmmstat_exe)
+
+        # Call hmmalign to align all single fasta files with hmms
+        files = os.listdir(pwd_SCG_tree_wd)
+        fastaFiles = [i for i in files if i.endswith('.fasta')]
 
-    # writing alignment to file
-    file_out = open(pwd_combined_alignment_file_tmp, 'w')
-    for element in genome_for_HGT_detection_list:
-        file_out.write('>' + element + '\n' + concatAlignment[element] + '\n')
-    file_out.close()
+        # prepare arguments for hmmalign_worker
+        list_for_multiple_arguments_hmmalign = []
+        for fastaFile in fastaFiles:
 
-    # remove columns with low coverage and low consensus
-    report_and_log(('Get SCG tree: removing columns from concatenated alignment represented by <%s%s of genomes and with amino acid consensus <%s%s.' % (minimal_cov_in_msa, '%', min_consensus_in_msa, '%')), pwd_log_file, keep_quiet)
-    remove_low_cov_and_consensus_columns(pwd_combined_alignment_file_tmp, minimal_cov_in_msa, min_consensus_in_msa, pwd_combined_alignment_file)
+            fastaFiles_basename = '.'.join(fastaFile.split('.')[:-1])
+            list_for_multiple_arguments_hmmalign.append([fastaFiles_basename, pwd_SCG_tree_wd, pwd_hmm_profile_sep_folder, pwd_hmmalign_exe])
 
+        # run hmmalign with multiprocessing
+        start_stage(run_report, 'hmmalign', len(list_for_multiple_arguments_hmmalign))
+        pool = mp.Pool(processes=num_threads)
+        pool.map(hmmalign_worker, list_for_multiple_arguments_hmmalign)
+        pool.close()
+        pool.join()
 
-    ########################################### get species tree (fasttree) ############################################
 
-    # for report and log
-    report_and_log('Get SCG tree: running FastTree.', pwd_log_file, keep_quiet)
+        ################################### get species tree (Concatenating alignments) ####################################
 
-    # calling fasttree for tree calculation
-    fasttree_cmd = '%s -quiet %s > %s 2>/dev/null' % (pwd_fasttree_exe, pwd_combined_alignment_file, pwd_newick_tree_file)
-    os.system(fasttree_cmd)
+        # for report and log
+        report_and_log('Get SCG tree: concatenating alignments.', pwd_log_file, keep_quiet)
+        start_stage(run_report, 'Concatenate alignments')
 
-    # for report and log
-    report_and_log(('SCG tree exported to: %s.' % newick_tree_file), pwd_log_file, keep_quiet)
+        # concatenating the single alignments
+        files = os.listdir(pwd_SCG_tree_wd)
+        fastaFiles = ['%s/%s' % (pwd_SCG_tree_wd, i) for i in files if i.endswith('.fasta')]
+        concatenated_alignment_array = concatenate_alignments(fastaFiles, genome_for_HGT_detection_list, pwd_combined_alignment_memmap, alignment_memmap_min_size)
+
+        # remove columns with low coverage and low consensus
+        report_and_log(('Get SCG tree: removing columns from concatenated alignment represented by <%s%s of genomes and with amino acid consensus <%s%s.' % (minimal_cov_in_msa, '%', min_consensus_in_msa, '%')), pwd_log_file, keep_quiet)
+        column_mask = get_alignment_column_mask(concatenated_alignment_array, minimal_cov_in_msa, min_consensus_in_msa)
+        write_alignment_array(genome_for_HGT_detection_list, concatenated_alignment_array, column_mask, pwd_combined_alignment_file)
+        del concatenated_alignment_array
+        if os.path.isfile(pwd_combined_alignment_memmap) is True:
+            os.remove(pwd_combined_alignment_memmap)
+
+
+        ########################################### get species tree (fasttree) ############################################
+
+        # for report and log
+        report_and_log('Get SCG tree: running FastTree.', pwd_log_file, keep_quiet)
+        start_stage(run_report, 'FastTree')
+
+        # calling fasttree for tree calculation
+        fasttree_cmd = '%s -quiet %s > %s 2>/dev/null' % (pwd_fasttree_exe, pwd_combined_alignment_file, pwd_newick_tree_file)
+        os.system(fasttree_cmd)
+
+        # for report and log
+        report_and_log(('SCG tree exported to: %s.' % newick_tree_file), pwd_log_file, keep_quiet)
+        record_task(pwd_manifest, 'SCG_tree', 'SCG_tree', SCG_tree_fingerprint)
 
 
     ############################################### run all vs all blastn ##############################################
 
+    start_stage(run_report, 'Make database')
+
     # get combined faa file
     os.system('cat %s/*.faa > %s' % (pwd_prodigal_output_folder, pwd_combined_faa_file))
 
     # create folder
-    os.mkdir(pwd_blast_db_folder)
-    os.mkdir(pwd_blast_result_folder)
+    if os.path.isdir(pwd_blast_db_folder) is False:
+        os.mkdir(pwd_blast_db_folder)
+    if fused_mode is False:
+        if os.path.isdir(pwd_blast_result_folder) is False:
+            os.mkdir(pwd_blast_result_folder)
+
+        # BP takes the hit number summary as a sign of fused results
+        if os.path.isfile(pwd_blastn_hit_num_file) is True:
+            os.remove(pwd_blastn_hit_num_file)
+
+    # with -fuse, blastn hits are filtered as they are produced and written to the folder BP would filter them into,
+    # the number of hits of each genome is recorded for the checks in BP
+    else:
+        if os.path.isdir(pwd_blast_result_filtered_folder) is False:
+            os.mkdir(pwd_blast_result_filtered_folder)
+        if (resume_mode is False) or (os.path.isfile(pwd_blastn_hit_num_file) is False):
+            with open(pwd_blastn_hit_num_file, 'w') as blastn_hit_num_file_handle:
+                blastn_hit_num_file_handle.write(get_blastn_hit_num_header(align_len_cutoff, cover_cutoff))
+
+    # symmetric mode only applies to full runs
+    if (symmetric_mode is True) and (update_mode is True):
+        report_and_log(('Symmetric blastn is not used in update mode, previously processed genomes will be searched against new genomes only.'), pwd_log_file, keep_quiet)
+        symmetric_mode = False
+
+    # hits are mirrored after blastn, which is not run with -noblast
+    if (symmetric_mode is True) and (noblast is True):
+        report_and_log(('Symmetric blastn is not used with -noblast, exported commands search all genomes against the full database.'), pwd_log_file, keep_quiet)
+        symmetric_mode = False
+
+    # shards are combined with blast alias files
+    if (symmetric_mode is True) and (homology_search_backend != 'blast'):
+        report_and_log(('Symmetric mode is only supported by the blast backend, all genomes will be searched against the full database.'), pwd_log_file, keep_quiet)
+        symmetric_mode = False
+
+    # databases built by an interrupted run will be reused with -resume
+    makeblastdb_fingerprint = get_fingerprint(['%s/%s.ffn' % (pwd_prodigal_output_folder, i) for i in sorted(genome_for_HGT_detection_list)], [homology_search_backend, symmetric_mode])
+    makeblastdb_done = is_task_done(manifest_dict, 'makeblastdb', 'makeblastdb', makeblastdb_fingerprint, [pwd_combined_ffn_file])
 
     # run makeblastdb
-    report_and_log(('Making blast database.'), pwd_log_file, keep_quiet)
-    os.system('cat %s/*.ffn > %s/%s' % (pwd_prodigal_output_folder, pwd_blast_db_folder, combined_ffn_file))
-
-    makeblastdb_cmd = '%s -in %s/%s -dbtype nucl -parse_seqids' % (pwd_makeblastdb_exe, pwd_blast_db_folder, combined_ffn_file)
-    os.system(makeblastdb_cmd)
-
-    # check db files
+    if makeblastdb_done is True:
+        report_and_log(('Resume: %s database found in %s.' % (homology_search_backend, blast_db_folder)), pwd_log_file, keep_quiet)
+    else:
+        report_and_log(('Making %s database.' % homology_search_backend), pwd_log_file, keep_quiet)
+        os.system('cat %s/*.ffn > %s/%s' % (pwd_prodigal_output_folder, pwd_blast_db_folder, combined_ffn_file))
+
+    if (symmetric_mode is False) and (makeblastdb_done is False):
+        makeblastdb_cmd = get_makedb_cmd(homology_search_backend, pwd_combined_ffn_file, 'nucl', config_dict)
+        if makeblastdb_cmd is not None:
+            os.system(makeblastdb_cmd)
+
+    # in symmetric mode, genomes are split into shards and each genome is searched against its own shard and the
+    # following ones (with the size of the full database), hits between shards will be mirrored afterwards
+    query_to_db_dict = {}
+    db_to_size_dict = {get_db_name(homology_search_backend, pwd_combined_ffn_file): os.path.getsize(pwd_combined_ffn_file)}
+    db_size_query = None
+    genome_to_shard_dict = {}
+    if symmetric_mode is True:
+        shard_num = min(len(new_genome_list), symmetric_shard_num)
+        shard_size = len(new_genome_list) // shard_num + (len(new_genome_list) % shard_num > 0)
+        genome_list_sorted = sorted(new_genome_list)
+        shard_list = [genome_list_sorted[i:(i + shard_size)] for i in range(0, len(genome_list_sorted), shard_size)]
+
+        shard_db_list = []
+        for shard_index in range(len(shard_list)):
+            shard_db = '%s_%s_shard%s.fasta' % (output_prefix, grouping_levels, shard_index + 1)
+            if makeblastdb_done is False:
+                os.system('cat %s > %s/%s' % (' '.join(['%s/%s.ffn' % (pwd_prodigal_output_folder, i) for i in shard_list[shard_index]]), pwd_blast_db_folder, shard_db))
+                os.system(get_makedb_cmd(homology_search_backend, '%s/%s' % (pwd_blast_db_folder, shard_db), 'nucl', config_dict))
+            shard_db_list.append(shard_db)
+            for genome in shard_list[shard_index]:
+                genome_to_shard_dict[genome] = shard_index
+
+        # alias of each shard and its following shards
+        for shard_index in range(len(shard_list)):
+            shard_alias = '%s_%s_shard%s_onwards' % (output_prefix, grouping_levels, shard_index + 1)
+            shard_alias_handle = open('%s/%s.nal' % (pwd_blast_db_folder, shard_alias), 'w')
+            shard_alias_handle.write('TITLE %s\nDBLIST %s\n' % (shard_alias, ' '.join(shard_db_list[shard_index:])))
+            shard_alias_handle.close()
+            for genome in shard_list[shard_index]:
+                query_to_db_dict[genome] = '%s/%s' % (pwd_blast_db_folder, shard_alias)
+            db_to_size_dict['%s/%s' % (pwd_blast_db_folder, shard_alias)] = sum([os.path.getsize('%s/%s' % (pwd_blast_db_folder, i)) for i in shard_db_list[shard_index:]])
+
+        db_size_query = get_total_seq_len(pwd_combined_ffn_file)
+
+    if makeblastdb_done is False:
+        record_task(pwd_manifest, 'makeblastdb', 'makeblastdb', makeblastdb_fingerprint)
 
     # prepare arguments list for parallel_blastn_worker
-    ffn_file_list = ['%s.ffn' % i for i in genome_for_HGT_detection_list]
+    ffn_file_list = ['%s.ffn' % i for i in new_genome_list]
+
+    # blastn results completed by an interrupted run will be kept with -resume
+    blastn_fingerprint_dict = {}
+    blastn_done_set = set()
+    for ffn_file in ffn_file_list:
+        query_db = query_to_db_dict.get(ffn_file[:-len('.ffn')], get_db_name(homology_search_backend, pwd_combined_ffn_file))
+        blastn_fingerprint_dict[ffn_file] = get_fingerprint(['%s/%s' % (pwd_prodigal_output_folder, ffn_file)], [makeblastdb_fingerprint, query_db, db_size_query, fused_mode, align_len_cutoff, cover_cutoff])
+
+        # fused results are not written if no hit qualified
+        blastn_output_list = ['%s/%s_blastn.tab' % (pwd_blast_result_folder, ffn_file[:-len('.ffn')])]
+        if fused_mode is True:
+            blastn_output_list = []
+        if is_task_done(manifest_dict, 'blastn', ffn_file, blastn_fingerprint_dict[ffn_file], blastn_output_list) is True:
+            blastn_done_set.add(ffn_file)
+
+    # in symmetric mode, mirrored hits were appended to the results of other genomes, partially mirrored
+    # results can not be reused
+    mirror_done = False
+    if symmetric_mode is True:
+        mirror_started = is_task_done(manifest_dict, 'mirror', 'started', makeblastdb_fingerprint)
+        mirror_done = is_task_done(manifest_dict, 'mirror', 'done', makeblastdb_fingerprint) and (len(blastn_done_set) == len(ffn_file_list))
+        if (mirror_started is True) and (mirror_done is False):
+            reset_stage(pwd_manifest, 'blastn')
+            reset_stage(pwd_manifest, 'mirror')
+            blastn_done_set = set()
+
+    if resume_mode is True:
+        report_and_log(('Resume: blastn results of %s genomes found in %s.' % (len(blastn_done_set), blast_result_folder)), pwd_log_file, keep_quiet)
 
     pwd_blast_cmd_file_handle = open(pwd_blast_cmd_file, 'w')
     list_for_multiple_arguments_blastn = []
+    blastn_job_cost_list = []
     for ffn_file in ffn_file_list:
-        list_for_multiple_arguments_blastn.append([ffn_file, pwd_prodigal_output_folder, pwd_combined_ffn_file, pwd_blast_result_folder, blast_parameters, pwd_blastn_exe])
-        blastn_cmd = '%s -query %s/%s -db %s -out %s/%s %s' % (pwd_blastn_exe, pwd_prodigal_output_folder, ffn_file, pwd_combined_ffn_file, pwd_blast_result_folder, '%s_blastn.tab' % '.'.join(ffn_file.split('.')[:-1]), blast_parameters)
+        query_db = query_to_db_dict.get(ffn_file[:-len('.ffn')], get_db_name(homology_search_backend, pwd_combined_ffn_file))
+        query_genome = '.'.join(ffn_file.split('.')[:-1])
+        if ffn_file not in blastn_done_set:
+            if fused_mode is False:
+                list_for_multiple_arguments_blastn.append([ffn_file, pwd_prodigal_output_folder, query_db, pwd_blast_result_folder, db_size_query, homology_search_backend, config_dict])
+            else:
+                list_for_multiple_arguments_blastn.append([ffn_file, pwd_prodigal_output_folder, query_db, pwd_blast_result_filtered_folder, db_size_query, homology_search_backend, config_dict, align_len_cutoff, cover_cutoff, pwd_blastn_hit_num_file])
+            blastn_job_cost_list.append(os.path.getsize('%s/%s' % (pwd_prodigal_output_folder, ffn_file)) * db_to_size_dict[query_db])
+        if fused_mode is False:
+            blastn_cmd = get_search_cmd(homology_search_backend, '%s/%s' % (pwd_prodigal_output_folder, ffn_file), query_db, '%s/%s_blastn.tab' % (pwd_blast_result_folder, query_genome), 'nucl', 1, config_dict, db_size=db_size_query)
+        else:
+            blastn_cmd = '%s | python3 -m MetaCHIP.blastn_filter -o %s/%s_blastn_filtered.tab -al %s -cov %s -summary %s -genome %s' % (get_search_cmd(homology_search_backend, '%s/%s' % (pwd_prodigal_output_folder, ffn_file), query_db, '/dev/stdout', 'nucl', 1, config_dict, db_size=db_size_query),
+                                                                                                                               pwd_blast_result_filtered_folder, query_genome, align_len_cutoff, cover_cutoff, pwd_blastn_hit_num_file, query_genome)
         pwd_blast_cmd_file_handle.write('%s\n' % blastn_cmd)
+
+    # in update mode, previously processed genomes only need to be searched against new genomes, with the
+    # size of the full database to keep e-values comparable, hits will be appended to their blast results
+    list_for_multiple_arguments_blastn_append = []
+    blastn_append_job_cost_list = []
+    if update_mode is True:
+        force_create_folder(pwd_blast_db_folder_new_genomes)
+        os.system('cat %s > %s' % (' '.join(['%s/%s.ffn' % (pwd_prodigal_output_folder, i) for i in new_genome_list]), pwd_combined_ffn_file_new_genomes))
+        makeblastdb_cmd = get_makedb_cmd(homology_search_backend, pwd_combined_ffn_file_new_genomes, 'nucl', config_dict)
+        if makeblastdb_cmd is not None:
+            os.system(makeblastdb_cmd)
+
+        db_new_genomes = get_db_name(homology_search_backend, pwd_combined_ffn_file_new_genomes)
+        db_size_append = get_total_seq_len(pwd_combined_ffn_file)
+        for previous_genome in previous_genome_list:
+            ffn_file = '%s.ffn' % previous_genome
+            list_for_multiple_arguments_blastn_append.append([ffn_file, pwd_prodigal_output_folder, db_new_genomes, pwd_blast_result_folder, db_size_append, homology_search_backend, config_dict])
+            blastn_append_job_cost_list.append(os.path.getsize('%s/%s' % (pwd_prodigal_output_folder, ffn_file)) * os.path.getsize(pwd_combined_ffn_file_new_genomes))
+            blastn_cmd = get_search_cmd(homology_search_backend, '%s/%s' % (pwd_prodigal_output_folder, ffn_file), db_new_genomes, '%s/%s_blastn.tab' % (pwd_blast_result_folder, previous_genome), 'nucl', 1, config_dict, db_size=db_size_append, append=True)
+            pwd_blast_cmd_file_handle.write('%s\n' % blastn_cmd)
+
     pwd_blast_cmd_file_handle.close()
 
     report_and_log(('Blastn commands exported to: %s.' % blast_cmd_file), pwd_log_file, keep_quiet)
 
     if noblast is False:
 
-        report_and_log(('Running blastn for %s qualified genomes with %s cores.' % (len(genome_for_HGT_detection_list), num_threads)), pwd_log_file, keep_quiet)
+        report_and_log(('Running blastn for %s qualified genomes with %s cores.' % (len(list_for_multiple_arguments_blastn), num_threads)), pwd_log_file, keep_quiet)
 
-        # run blastn with multiprocessing
-        pool = mp.Pool(processes=num_threads)
-        pool.map(parallel_blastn_worker, list_for_multiple_arguments_blastn)
-        pool.close()
-        pool.join()
+        # run blastn with multiprocessing, largest jobs first
+        start_stage(run_report, 'blastn', len(list_for_multiple_arguments_blastn))
+        if fused_mode is False:
+            schedule_blastn_jobs(parallel_blastn_worker, list_for_multiple_arguments_blastn, blastn_job_cost_list, num_threads, pwd_blastn_job_timing_file, [pwd_manifest, 'blastn', blastn_fingerprint_dict])
+        else:
+            report_and_log(('Filtering blastn hits with the following criteria: Query genome != Subject genome, Alignment length >= %sbp and coverage >= %s%s.' % (align_len_cutoff, cover_cutoff, '%')), pwd_log_file, keep_quiet)
+            schedule_blastn_jobs(parallel_blastn_fused_worker, list_for_multiple_arguments_blastn, blastn_job_cost_list, num_threads, pwd_blastn_job_timing_file, [pwd_manifest, 'blastn', blastn_fingerprint_dict])
+
+        if (symmetric_mode is True) and (mirror_done is False):
+            report_and_log(('Mirroring blastn hits between genome shards.'), pwd_log_file, keep_quiet)
+            start_stage(run_report, 'Mirror blastn hits')
+            record_task(pwd_manifest, 'mirror', 'started', makeblastdb_fingerprint)
+            if fused_mode is False:
+                mirror_blastn_results(pwd_blast_result_folder, sorted(new_genome_list), genome_to_shard_dict)
+            else:
+                mirror_blastn_results(pwd_blast_result_filtered_folder, sorted(new_genome_list), genome_to_shard_dict, 'blastn_filtered.tab')
+            record_task(pwd_manifest, 'mirror', 'done', makeblastdb_fingerprint)
+
+        if update_mode is True:
+            report_and_log(('Running blastn for %s previously processed genomes against new genomes with %s cores.' % (len(previous_genome_list), num_threads)), pwd_log_file, keep_quiet)
+            start_stage(run_report, 'blastn (previous genomes)', len(list_for_multiple_arguments_blastn_append))
+            schedule_blastn_jobs(parallel_blastn_append_worker, list_for_multiple_arguments_blastn_append, blastn_append_job_cost_list, num_threads, pwd_blastn_job_timing_file)
+            shutil.rmtree(pwd_blast_db_folder_new_genomes, ignore_errors=True)
+
+        if fused_mode is False:
+            report_and_log(('Blast results exported to: %s.' % pwd_blast_result_folder), pwd_log_file, keep_quiet)
+        else:
+            report_and_log(('Filtered blast results exported to: %s, please run BP with -al %s -cov %s.' % (pwd_blast_result_filtered_folder, align_len_cutoff, cover_cutoff)), pwd_log_file, keep_quiet)
 
-        report_and_log(('Blast results exported to: %s.' % pwd_blast_result_folder), pwd_log_file, keep_quiet)
+    # write out run report
+    run_report_table = write_run_report(run_report, pwd_run_report_json, pwd_run_report_txt)
+    report_and_log(('Run report exported to: %s, time and resources used by each stage:\n%s' % (os.path.basename(pwd_run_report_json), run_report_table)), pwd_log_file, keep_quiet)
 
     if noblast is False:
         report_and_log('PI step done!', pwd_log_file, keep_quiet)
     else:
         report_and_log('PI step done!', pwd_log_file, keep_quiet)
         report_and_log(('All-vs-all blastn disabled, please run blastn with commands in: %s before the BP module.' % blast_cmd_file), pwd_log_file, keep_quiet)
+        if fused_mode is True:
+            report_and_log(('Blastn hits will be filtered with -al %s -cov %s, please run BP with the same cutoffs.' % (align_len_cutoff, cover_cutoff)), pwd_log_file, keep_quiet)
 
 
 if __name__ == '__main__':
@@ -1054,6 +1667,16 @@ if __name__ == '__main__':
     parser.add_argument('-quiet',   required=False, action="store_true", help='not report progress')
     parser.add_argument('-force',   required=False, action="store_true", help='force overwrite existing results')
     parser.add_argument('-noblast', required=False, action="store_true", help='skip running all-vs-all blastn, provide if you have other ways (e.g. with job scripts) to speed up the blastn step')
+    parser.add_argument('-update',  required=False, action="store_true", help='add new genomes in the input folder to an existing MetaCHIP working directory')
+    parser.add_argument('-cache',   required=False, action="store_true", help='reuse cached Prodigal and hmmsearch results of previously processed genomes')
+    parser.add_argument('-symmetric', required=False, action="store_true", help='search each pair of genomes only once and mirror blastn hits, roughly halves the blastn step')
+    parser.add_argument('-aligner', required=False, default='blast', choices=homology_search_backend_list, help='homology search backend for the all-vs-all step, default: blast')
+    parser.add_argument('-hmmbatch', required=False, action="store_true", help='run hmmsearch on batches of genomes with multiple cores, faster for many small genomes')
+    parser.add_argument('-resume',  required=False, action="store_true", help='resume an interrupted run, tasks recorded as completed in the manifest will be skipped')
+    parser.add_argument('-fuse',    required=False, action="store_true", help='filter blastn hits as they are produced with -al and -cov, unfiltered hits will not be kept')
+    parser.add_argument('-al',      required=False, type=int, default=200, help='alignment length cutoff for -fuse, default: 200')
+    parser.add_argument('-cov',     required=False, type=int, default=75, help='coverage cutoff for -fuse, default: 75')
+    parser.add_argument('-nogbk',   required=False, action="store_true", help='do not write gbk files, BP uses the gene coordinate index and contig store instead')
 
     args = vars(parser.parse_args())
 
@@ -1,5 +1,6 @@
 import os
 import argparse
+from MetaCHIP.taxonomy_index import get_full_assignment
 
 
 SankeyTaxon_parser_usage ='''
@@ -15,16 +16,6 @@ MetaCHIP SankeyTaxon -taxon KelpBins_gtdbtk.tsv -r pg -p KelpBins -ec
 '''
 
 
-def unique_list_elements(list_input):
-
-    list_output = []
-    for each_element in list_input:
-        if each_element not in list_output:
-            list_output.append(each_element)
-
-    return list_output
-
-
 def SankeyTaxon(args):
 
     GTDB_output =                       args['taxon']
@@ -60,27 +51,9 @@ def SankeyTaxon(args):
 
             genome_taxon_split = each_genome_taxon.strip().split('\t')
 
-            taxon_asign_full = []
-            if len(genome_taxon_split) == 1:
-                taxon_asign_full = ['d__', 'p__', 'c__', 'o__', 'f__', 'g__', 's__']
-
-            elif (len(genome_taxon_split) > 1) and (';' in genome_taxon_split[1]):
-                assignment = genome_taxon_split[1].split(';')
-                if len(assignment) == 7:
-                    taxon_asign_full = assignment
-                if len(assignment) == 6:
-                    taxon_asign_full = assignment + ['s__']
-                if len(assignment) == 5:
-                    taxon_asign_full = assignment + ['g__', 's__']
-                if len(assignment) == 4:
-                    taxon_asign_full = assignment + ['f__', 'g__', 's__']
-                if len(assignment) == 3:
-                    taxon_asign_full = assignment + ['o__', 'f__', 'g__', 's__']
-                if len(assignment) == 2:
-                    taxon_asign_full = assignment + ['c__', 'o__', 'f__', 'g__', 's__']
-
-            elif (len(genome_taxon_split) > 1) and (';' not in genome_taxon_split[1]):
-                taxon_asign_full = [genome_taxon_split[1]] + ['p__', 'c__', 'o__', 'f__', 'g__', 's__']
+            taxon_asign_full = get_full_assignment(None)
+            if len(genome_taxon_split) > 1:
+                taxon_asign_full = get_full_assignment(genome_taxon_split[1])
 
 
             rank_to_plot_paired = []
@@ -106,10 +79,9 @@ def SankeyTaxon(args):
                         paired_taxon_list_all.append(each_pair_taxon)
 
 
-    paired_taxon_list_uniq = unique_list_elements(paired_taxon_list_all)
     paired_taxon_list_uniq_count_dict = {}
-    for each_key in paired_taxon_list_uniq:
-        paired_taxon_list_uniq_count_dict[each_key] = paired_taxon_list_all.count(each_key)
+    for each_key in paired_taxon_list_all:
+        paired_taxon_list_uniq_count_dict[each_key] = paired_taxon_list_uniq_count_dict.get(each_key, 0) + 1
 
 
     output_file_handle = open(output_file_txt, 'w')
@@ -0,0 +1,173 @@
+import os
+import glob
+import math
+import subprocess
+from MetaCHIP.homology_search import outfmt_col_list_full_len
+
+
+# blastn on batches of sequence pairs (BP -flkbatch). Running blastn with -query and -subject on files holding many
+# sequences aligns every query to every subject, so the second sequences of a batch are searched as a database
+# instead, with an E-value cutoff loose enough to keep every hit a pair could have. E-values of hits between the two
+# sequences of a pair are then recomputed from their raw scores with the search space of the pair alone, the same as
+# blastn computes them when run on the pair with -query and -subject, and hits are filtered with the wanted cutoff.
+
+
+# Karlin-Altschul parameters of gapped blastn -task blastn with its default scoring (reward 2, penalty -3, gap open
+# 5, gap extend 2), alpha and beta are used for the length adjustment, from the NCBI BLAST+ blastn_values_2_3 table
+blastn_lambda = 0.625
+blastn_K = 0.41
+blastn_alpha = 0.8
+blastn_beta = -2
+
+# outfmt 6 columns, with qlen and slen, plus the raw score for recomputing E-values
+batch_blastn_col_list = outfmt_col_list_full_len + ['score']
+
+
+def get_length_adjustment(query_len, db_len, db_seq_num):
+
+    # expected HSP length, by the fixed point iteration of BLAST_ComputeLengthAdjustment in BLAST+
+    K = blastn_K
+    logK = math.log(K)
+    alpha_d_lambda = blastn_alpha / blastn_lambda
+    beta = blastn_beta
+    m = float(query_len)
+    n = float(db_len)
+    N = float(db_seq_num)
+
+    # largest length adjustment that keeps K * (m - ell) * (n - N * ell) > max(m, n)
+    a = N
+    mb = m * N + n
+    c = n * m - max(m, n) / K
+    if c < 0:
+        return 0
+    ell_max = 2 * c / (mb + math.sqrt(mb * mb - 4 * a * c))
+
+    ell_min = 0
+    ell_next = 0
+    converged = False
+    for i in range(1, 21):
+        ell = ell_next
+        ell_bar = alpha_d_lambda * (logK + math.log((m - ell) * (n - N * ell))) + beta
+        if ell_bar >= ell:
+            ell_min = ell
+            if ell_bar - ell_min <= 1.0:
+                converged = True
+                break
+            if ell_min == ell_max:
+                break
+        else:
+            ell_max = ell
+        if ell_min <= ell_bar <= ell_max:
+            ell_next = ell_bar
+        elif i == 1:
+            ell_next = ell_max
+        else:
+            ell_next = (ell_min + ell_max) / 2
+
+    length_adjustment = int(ell_min)
+    if converged is True:
+        ell = math.ceil(ell_min)
+        if (ell <= ell_max) and (alpha_d_lambda * (logK + math.log((m - ell) * (n - N * ell))) + beta >= ell):
+            length_adjustment = int(ell)
+
+    return length_adjustment
+
+
+def get_pair_evalue(raw_score, query_len, subject_len):
+
+    # E-value of a hit from blastn on a single query and subject, the subject is the database
+    length_adjustment = get_length_adjustment(query_len, subject_len, 1)
+    effective_subject_len = max(subject_len - length_adjustment, 1)
+    effective_search_space = (query_len - length_adjustment) * effective_subject_len
+
+    return effective_search_space * blastn_K * math.exp(-blastn_lambda * raw_score)
+
+
+def format_evalue(evalue):
+
+    # as blastn writes them in tabular output
+    if evalue < 1e-180:
+        return '0.0'
+    elif evalue < 1e-99:
+        return '%.0e' % evalue
+    elif evalue < 0.0009:
+        return '%.2e' % evalue
+    elif evalue < 0.1:
+        return '%.3f' % evalue
+    elif evalue < 1:
+        return '%.2f' % evalue
+    elif evalue < 10:
+        return '%.1f' % evalue
+    else:
+        return '%.0f' % evalue
+
+
+def get_batch_evalue(pwd_batch_subject, evalue_cutoff):
+
+    # E-values against the database are at most (database length / effective subject length) times the E-values of
+    # the pair, effective lengths are at least 1
+    db_len = 0
+    for each_line in open(pwd_batch_subject):
+        if not each_line.startswith('>'):
+            db_len += len(each_line.strip())
+
+    return evalue_cutoff * max(db_len, 1)
+
+
+def get_batch_seq_id(seq_index, id_prefix):
+
+    # sequences of batches are renamed, -parse_seqids rejects ids longer than 50 characters, which long genome names
+    # give, and hits are mapped back to genes by the caller
+    return '%s%s' % (id_prefix, seq_index)
+
+
+def get_batch_blastn_cmds(pwd_blastn_exe, pwd_makeblastdb_exe, pwd_batch_query, pwd_batch_subject, pwd_batch_output, evalue_cutoff):
+
+    # sequence ids of both files are from get_batch_seq_id
+    makeblastdb_cmd = '%s -in %s -dbtype nucl -parse_seqids > /dev/null' % (pwd_makeblastdb_exe, pwd_batch_subject)
+    blastn_cmd = '%s -query %s -db %s -evalue %s -outfmt "6 %s" -task blastn -out %s' % (pwd_blastn_exe, pwd_batch_query, pwd_batch_subject, '%g' % get_batch_evalue(pwd_batch_subject, evalue_cutoff), ' '.join(batch_blastn_col_list), pwd_batch_output)
+
+    return makeblastdb_cmd, blastn_cmd
+
+
+def run_batch_blastn_cmds(makeblastdb_cmd, blastn_cmd):
+
+    # a failed makeblastdb or blastn leaves the batch without output, stop with the failed command
+    for each_cmd in [makeblastdb_cmd, blastn_cmd]:
+        cmd_return_code = subprocess.call(each_cmd, shell=True)
+        if cmd_return_code != 0:
+            raise subprocess.CalledProcessError(cmd_return_code, each_cmd)
+
+
+def read_batch_blastn_pair_hits(pwd_batch_output, pair_set, evalue_cutoff, col_num):
+
+    # {(query, subject): [hit, ...]} for pairs in pair_set, hits (split, first col_num columns) are in the order blastn
+    # wrote them, with E-values of the pair and those above evalue_cutoff removed
+    evalue_col = batch_blastn_col_list.index('evalue')
+    qlen_col = batch_blastn_col_list.index('qlen')
+    slen_col = batch_blastn_col_list.index('slen')
+    score_col = batch_blastn_col_list.index('score')
+
+    pair_to_hit_dict = {}
+    for blast_hit in open(pwd_batch_output):
+        blast_hit_split = blast_hit.rstrip('\n').split('\t')
+        pair_key = (blast_hit_split[0], blast_hit_split[1])
+        if pair_key not in pair_set:
+            continue
+        pair_evalue = get_pair_evalue(float(blast_hit_split[score_col]), int(blast_hit_split[qlen_col]), int(blast_hit_split[slen_col]))
+        if pair_evalue > evalue_cutoff:
+            continue
+        blast_hit_split[evalue_col] = format_evalue(pair_evalue)
+        if pair_key not in pair_to_hit_dict:
+            pair_to_hit_dict[pair_key] = []
+        pair_to_hit_dict[pair_key].append(blast_hit_split[:col_num])
+
+    return pair_to_hit_dict
+
+
+def remove_batch_blastn_files(pwd_batch_query, pwd_batch_subject, pwd_batch_output):
+
+    # the database files of makeblastdb are named after the subject file
+    for each_file in [pwd_batch_query, pwd_batch_output] + glob.glob('%s*' % glob.escape(pwd_batch_subject)):
+        if os.path.isfile(each_file):
+            os.remove(each_file)
@@ -0,0 +1,148 @@
+import numpy as np
+
+
+# Best-match candidate detection on grouped arrays. Subjects of all queries in a subjects_in_one_line file are parsed
+# once into flat arrays (query index, subject group, identity), averages and maxima of the self group and of each
+# non-self group are then computed with segmented reductions. Sums are accumulated in the order of subjects (with
+# np.bincount), so averages, and the outputs, are the same as from the subject by subject loop BP used before
+# (benchmark/get_candidates_benchmark.py compares both). Reciprocal candidates are resolved with sets in
+# remove_bidirection (benchmark/remove_bidirection_benchmark.py).
+
+
+def read_subjects_in_one_line(targets_group_file):
+
+    # query list, subject list and flat arrays of the query index, group and identity of each subject, groups are
+    # interned in group_list
+    query_list = []
+    subject_list = []
+    subject_query_list = []
+    subject_group_list = []
+    subject_identity_list = []
+    group_list = []
+    group_to_index_dict = {}
+    for group in open(targets_group_file):
+        group_split = group.strip().split('\t')
+        query_index = len(query_list)
+        query_list.append(group_split[0])
+        for each_subject in group_split[1:]:
+            each_subject_split = each_subject.split('|')
+            each_subject_g = each_subject_split[0].split('_')[0]
+            if each_subject_g not in group_to_index_dict:
+                group_to_index_dict[each_subject_g] = len(group_list)
+                group_list.append(each_subject_g)
+            subject_list.append(each_subject)
+            subject_query_list.append(query_index)
+            subject_group_list.append(group_to_index_dict[each_subject_g])
+            subject_identity_list.append(float(each_subject_split[2]))
+
+    return query_list, subject_list, np.array(subject_query_list, dtype=np.int64), np.array(subject_group_list, dtype=np.int64), np.array(subject_identity_list, dtype=np.float64), group_list, group_to_index_dict
+
+
+def get_candidate_subjects(query_group_array, subject_query_array, subject_group_array, subject_identity_array, query_num, group_num):
+
+    # for each query, the index of the subject with the maximum identity in the non-self group with the highest average
+    # identity, if it is higher than the self-group average (-1 otherwise), and the number of non-self groups.
+    # queries need more than one subject and subjects from both the self group and other groups
+    query_subject_num = np.bincount(subject_query_array, minlength=query_num)
+    self_subject = subject_group_array == query_group_array[subject_query_array]
+    query_self_num = np.bincount(subject_query_array[self_subject], minlength=query_num)
+    query_self_sum = np.bincount(subject_query_array[self_subject], weights=subject_identity_array[self_subject], minlength=query_num)
+    query_self_average = query_self_sum / np.maximum(query_self_num, 1)
+
+    # (query, non-self group) segments, groups of a query are ordered by their first subject
+    non_self_subject_index = np.flatnonzero(~self_subject)
+    non_self_code = subject_query_array[non_self_subject_index] * group_num + subject_group_array[non_self_subject_index]
+    segment_code, segment_first, segment_inverse = np.unique(non_self_code, return_index=True, return_inverse=True)
+    segment_query = segment_code // group_num
+    segment_sum = np.bincount(segment_inverse, weights=subject_identity_array[non_self_subject_index], minlength=len(segment_code))
+    segment_average = segment_sum / np.bincount(segment_inverse, minlength=len(segment_code))
+    query_non_self_group_num = np.bincount(segment_query, minlength=query_num)
+
+    # first subject with the maximum identity of each segment
+    subject_order = np.lexsort((np.arange(len(non_self_subject_index)), -subject_identity_array[non_self_subject_index], segment_inverse))
+    segment_start = np.searchsorted(segment_inverse[subject_order], np.arange(len(segment_code)))
+    segment_max_subject = non_self_subject_index[subject_order[segment_start]]
+
+    # segment with the highest average of each query, the earlier group wins ties
+    candidate_segment = np.flatnonzero(segment_average > query_self_average[segment_query])
+    candidate_segment = candidate_segment[np.lexsort((segment_first[candidate_segment], -segment_average[candidate_segment], segment_query[candidate_segment]))]
+    best_segment = candidate_segment[np.concatenate([[True], segment_query[candidate_segment][1:] != segment_query[candidate_segment][:-1]])] if len(candidate_segment) > 0 else candidate_segment
+
+    query_candidate_subject = np.full(query_num, -1, dtype=np.int64)
+    query_candidate_subject[segment_query[best_segment]] = segment_max_subject[best_segment]
+    query_qualified = (query_subject_num > 1) & (query_self_num > 0) & (query_non_self_group_num > 0)
+    query_candidate_subject[~query_qualified] = -1
+
+    return query_candidate_subject, query_non_self_group_num
+
+
+def get_candidates(targets_group_file, gene_with_g_file_name, gene_only_name_file_name, group_pair_iden_cutoff_dict):
+
+    query_list, subject_list, subject_query_array, subject_group_array, subject_identity_array, group_list, group_to_index_dict = read_subjects_in_one_line(targets_group_file)
+
+    # query groups not seen among subjects get indices after the subject groups
+    query_g_list = [i.split('|')[0].split('_')[0] for i in query_list]
+    for query_g in query_g_list:
+        if query_g not in group_to_index_dict:
+            group_to_index_dict[query_g] = len(group_list)
+            group_list.append(query_g)
+    query_group_array = np.array([group_to_index_dict[i] for i in query_g_list], dtype=np.int64)
+
+    query_candidate_subject, query_non_self_group_num = get_candidate_subjects(query_group_array, subject_query_array, subject_group_array, subject_identity_array, len(query_list), max(len(group_list), 1))
+
+    output_1 = open(gene_with_g_file_name, 'w')
+    output_2 = open(gene_only_name_file_name, 'w')
+    for query_index in np.flatnonzero(query_candidate_subject >= 0).tolist():
+        query = query_list[query_index]
+        candidate_subject = subject_list[query_candidate_subject[query_index]]
+        candidate_g = group_list[subject_group_array[query_candidate_subject[query_index]]]
+
+        # with subjects from more than one non-self group, the loop based implementation compared the winning group
+        # with the first character of the query (self group), kept for identical outputs
+        if (query_non_self_group_num[query_index] > 1) and (candidate_g == query[0]):
+            continue
+
+        # filter with obtained identity cut-off
+        qg_sg = '%s_%s' % (query_g_list[query_index], candidate_g)
+        if subject_identity_array[query_candidate_subject[query_index]] >= group_pair_iden_cutoff_dict[qg_sg]:
+            output_1.write('%s\t%s\n' % (query, candidate_subject))
+            output_2.write('%s\t%s\n' % (query.split('|')[1], candidate_subject.split('|')[1]))
+    output_1.close()
+    output_2.close()
+
+
+def remove_bidirection(input_file, candidate2identity_dict, output_file):
+
+    # candidates whose reverse pair was found at or before them go to the overlap list, candidates not in and without
+    # their reverse in the overlap list are written first, sets are used for the lookups
+    overall = []
+    for each in open(input_file):
+        overall.append(each.strip())
+
+    # get overlap list
+    tmp_set = set()
+    overlap_list = []
+    overlap_set = set()
+    for each in overall:
+        each_split = each.split('\t')
+        each_reverse = '%s\t%s' % (each_split[1], each_split[0])
+        tmp_set.add(each)
+        if each_reverse in tmp_set:
+            overlap_list.append(each)
+            overlap_set.add(each)
+
+    # get non-overlap list
+    non_overlap_list = []
+    for each in overall:
+        each_split = each.split('\t')
+        each_reverse = '%s\t%s' % (each_split[1], each_split[0])
+        if (each not in overlap_set) and (each_reverse not in overlap_set):
+            non_overlap_list.append(each)
+
+    # get output
+    output = open(output_file, 'w')
+    for each in non_overlap_list + overlap_list:
+        each_split = each.split('\t')
+        each_concatenated = '%s___%s' % (each_split[0], each_split[1])
+        output.write('%s\t%s\n' % (each, candidate2identity_dict[each_concatenated]))
+    output.close()
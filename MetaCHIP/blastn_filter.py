@@ -0,0 +1,97 @@
+import os
+import sys
+import argparse
+from MetaCHIP.gene_table import get_genome_name
+
+
+# Filter for all-vs-all blastn hits (outfmt 6 with qlen and slen). BP filters the blastn results written by PI, with
+# PI -fuse the output of each blastn job is filtered as it runs and unfiltered hits are never written to disk. The
+# number of hits of each query genome is recorded in a summary file (one line per genome, appended, the last record
+# of a genome wins), which BP uses in place of the unfiltered results for its missing and empty result checks.
+
+
+def is_qualified_hit(match_split, align_len_cutoff, cover_cutoff):
+
+    # query genome != subject genome, alignment length >= align_len_cutoff, both coverages >= cover_cutoff
+    query = match_split[0]
+    subject = match_split[1]
+    align_len = int(match_split[3])
+    query_len = int(match_split[12])
+    subject_len = int(match_split[13])
+    query_bin_name = get_genome_name(query)
+    subject_bin_name = get_genome_name(subject)
+    coverage_q = float(align_len) * 100 / float(query_len)
+    coverage_s = float(align_len) * 100 / float(subject_len)
+
+    return (align_len >= int(align_len_cutoff)) and (query_bin_name != subject_bin_name) and (coverage_q >= cover_cutoff) and (coverage_s >= cover_cutoff)
+
+
+def filter_blastn_hits(blastn_hit_handle, pwd_qualified_iden_file, align_len_cutoff, cover_cutoff):
+
+    # write qualified hits from blastn_hit_handle (a file or a pipe), the output file is removed if no hit qualified
+    hit_num = 0
+    qualified_hit_num = 0
+    pwd_qualified_iden_file_handle = open(pwd_qualified_iden_file, 'w')
+    for match in blastn_hit_handle:
+        match_split = match.strip().split('\t')
+        if len(match_split) < 14:
+            continue
+        hit_num += 1
+        if is_qualified_hit(match_split, align_len_cutoff, cover_cutoff) is True:
+            pwd_qualified_iden_file_handle.write(match)
+            qualified_hit_num += 1
+    pwd_qualified_iden_file_handle.close()
+
+    # remove if empty
+    if qualified_hit_num == 0:
+        os.remove(pwd_qualified_iden_file)
+
+    return hit_num, qualified_hit_num
+
+
+def get_blastn_hit_num_header(align_len_cutoff, cover_cutoff):
+
+    return '# -al %s -cov %s\nGenome\tHits\tQualified\n' % (align_len_cutoff, cover_cutoff)
+
+
+def record_blastn_hit_num(pwd_hit_num_file, genome_name, hit_num, qualified_hit_num):
+
+    with open(pwd_hit_num_file, 'a') as hit_num_file_handle:
+        hit_num_file_handle.write('%s\t%s\t%s\n' % (genome_name, hit_num, qualified_hit_num))
+
+
+def read_blastn_hit_num(pwd_hit_num_file):
+
+    # return the cutoffs used for filtering ([al, cov], as strings) and {genome: [hits, qualified hits]}
+    cutoff_list = None
+    hit_num_dict = {}
+    for each_line in open(pwd_hit_num_file):
+        if each_line.startswith('#'):
+            each_line_split = each_line.strip().split(' ')
+            cutoff_list = [each_line_split[2], each_line_split[4]]
+        elif not each_line.startswith('Genome\t'):
+            each_line_split = each_line.rstrip('\n').split('\t')
+
+            # skip incomplete lines from interrupted writes
+            if len(each_line_split) != 3:
+                continue
+
+            hit_num_dict[each_line_split[0]] = [int(each_line_split[1]), int(each_line_split[2])]
+
+    return cutoff_list, hit_num_dict
+
+
+if __name__ == '__main__':
+
+    # filter blastn hits from stdin, used by the blastn commands exported by PI -fuse -noblast
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-o',       required=True,                          help='output file for qualified hits')
+    parser.add_argument('-al',      required=False, type=int, default=200,  help='alignment length cutoff, default: 200')
+    parser.add_argument('-cov',     required=False, type=int, default=75,   help='coverage cutoff, default: 75')
+    parser.add_argument('-summary', required=False, default=None,           help='file to record the number of hits')
+    parser.add_argument('-genome',  required=False, default=None,           help='genome name used in the summary file')
+    args = vars(parser.parse_args())
+
+    hit_num, qualified_hit_num = filter_blastn_hits(sys.stdin, args['o'], args['al'], args['cov'])
+    if args['summary'] is not None:
+        record_blastn_hit_num(args['summary'], args['genome'], hit_num, qualified_hit_num)
@@ -0,0 +1,88 @@
+import os
+import hashlib
+
+
+# Stage manifest used by PI and BP with -resume. The manifest is a tab separated file with one line per completed
+# task (Stage, Task, Fingerprint), lines are only appended so that an interrupted run never leaves a broken
+# manifest behind, the last record of a task wins. Fingerprints are built from the inputs of a task (file size and
+# modification time, plus parameters), a task is rerun if its inputs changed or its outputs are missing.
+# Lines are short and written with a single append, workers of the same pool can record tasks concurrently.
+
+
+manifest_stage_reset = '*'
+
+
+def get_fingerprint(file_list, parameter_list=()):
+
+    fingerprint = hashlib.md5()
+    for each_file in file_list:
+        if os.path.exists(each_file) is True:
+            file_stat = os.stat(each_file)
+            fingerprint.update(('%s:%s:%s\n' % (each_file, file_stat.st_size, file_stat.st_mtime_ns)).encode())
+        else:
+            fingerprint.update(('%s:missing\n' % each_file).encode())
+    for each_parameter in parameter_list:
+        fingerprint.update(('%s\n' % each_parameter).encode())
+
+    return fingerprint.hexdigest()
+
+
+def read_manifest(pwd_manifest):
+
+    # {stage: {task: fingerprint}}
+    manifest_dict = {}
+    if os.path.isfile(pwd_manifest) is True:
+        for each_line in open(pwd_manifest):
+            each_line_split = each_line.rstrip('\n').split('\t')
+
+            # skip incomplete lines from interrupted writes
+            if len(each_line_split) != 3:
+                continue
+
+            stage, task, fingerprint = each_line_split
+            if task == manifest_stage_reset:
+                manifest_dict[stage] = {}
+            else:
+                if stage not in manifest_dict:
+                    manifest_dict[stage] = {}
+                manifest_dict[stage][task] = fingerprint
+
+    return manifest_dict
+
+
+def record_task(pwd_manifest, stage, task, fingerprint):
+
+    with open(pwd_manifest, 'a') as manifest_handle:
+        manifest_handle.write('%s\t%s\t%s\n' % (stage, task, fingerprint))
+
+
+def reset_stage(pwd_manifest, stage):
+
+    record_task(pwd_manifest, stage, manifest_stage_reset, '-')
+
+
+def is_task_done(manifest_dict, stage, task, fingerprint, output_file_list=()):
+
+    if manifest_dict.get(stage, {}).get(task) != fingerprint:
+        return False
+    for output_file in output_file_list:
+        if os.path.exists(output_file) is False:
+            return False
+
+    return True
+
+
+def checkpoint_worker(argument_list):
+
+    # run worker(worker_argument_list) and record the task once it finished
+    worker =                argument_list[0]
+    worker_argument_list =  argument_list[1]
+    pwd_manifest =          argument_list[2]
+    stage =                 argument_list[3]
+    task =                  argument_list[4]
+    fingerprint =           argument_list[5]
+
+    worker_output = worker(worker_argument_list)
+    record_task(pwd_manifest, stage, task, fingerprint)
+
+    return worker_output
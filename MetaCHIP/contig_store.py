@@ -0,0 +1,54 @@
+# Contig sequences of a genome written by PI (<genome>.fna in the prodigal output folder, upper case, 60 bases per
+# line) with a samtools faidx compatible index (<genome>.fna.fai: name, length, offset of the first base, bases per
+# line and bytes per line). Regions are read by byte offset without parsing the file, BP fetches flanking windows of
+# candidates from it in its workers.
+
+
+contig_store_line_len = 60
+
+
+def contig_store_record(contig_name, contig_seq, record_offset):
+
+    # record of a contig (bytes) and its index line, record_offset: number of bytes written before the record
+    contig_seq = contig_seq.upper().encode()
+    record_header = ('>%s\n' % contig_name).encode()
+    record_seq = b''.join([contig_seq[i:i + contig_store_line_len] + b'\n' for i in range(0, len(contig_seq), contig_store_line_len)])
+    fai_line = '%s\t%s\t%s\t%s\t%s\n' % (contig_name, len(contig_seq), record_offset + len(record_header), contig_store_line_len, contig_store_line_len + 1)
+
+    return record_header + record_seq, fai_line
+
+
+def write_contig_store_index(pwd_contig_store, fai_line_list):
+
+    fai_handle = open('%s.fai' % pwd_contig_store, 'w')
+    fai_handle.write(''.join(fai_line_list))
+    fai_handle.close()
+
+
+def read_contig_store_index(pwd_contig_store):
+
+    # {contig name: [length, offset, bases per line, bytes per line]}
+    contig_store_index_dict = {}
+    for each_line in open('%s.fai' % pwd_contig_store):
+        each_line_split = each_line.rstrip('\n').split('\t')
+        contig_store_index_dict[each_line_split[0]] = [int(i) for i in each_line_split[1:5]]
+
+    return contig_store_index_dict
+
+
+def fetch_contig_region(pwd_contig_store, contig_store_index_entry, region_start, region_end):
+
+    # sequence of [region_start, region_end) (0-based) of a contig, the region is clipped at the contig ends
+    contig_len, contig_offset, line_bases, line_bytes = contig_store_index_entry
+    region_start = max(region_start, 0)
+    region_end = min(region_end, contig_len)
+    if region_end <= region_start:
+        return ''
+
+    byte_start = contig_offset + (region_start // line_bases) * line_bytes + region_start % line_bases
+    byte_end = contig_offset + ((region_end - 1) // line_bases) * line_bytes + (region_end - 1) % line_bases + 1
+    with open(pwd_contig_store, 'rb') as contig_store_handle:
+        contig_store_handle.seek(byte_start)
+        region_seq = contig_store_handle.read(byte_end - byte_start)
+
+    return region_seq.replace(b'\n', b'').replace(b'\r', b'').decode()
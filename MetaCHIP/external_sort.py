@@ -0,0 +1,95 @@
+import os
+import heapq
+import tempfile
+import itertools
+
+
+# In-process replacement for "cat file | sort" in BP. Lines are sorted in chunks of bounded size, chunks that do not
+# fit into the buffer are spilled to sorted temporary files and merged. Lines are compared as Python strings (the
+# same order as "LC_ALL=C sort"), so results do not depend on the locale. Buffer size (in MB of text, Python needs
+# roughly twice as much memory) and spill folder are set with sort_buffer_size and sort_spill_dir in
+# MetaCHIP_config.py. Lines produced one at a time (e.g. for several ranks in one pass over the hits) are added to a
+# line sorter instead.
+
+
+def new_line_sorter(buffer_size=256, spill_dir=None, key=None):
+
+    # lines are added one by one with add_sorted_line and read back with iter_line_sorter, for sorting several
+    # streams of lines produced in one pass, spill files are written to the system temporary folder if spill_dir is None
+    if spill_dir == '':
+        spill_dir = None
+
+    return {'buffer_limit': buffer_size * 1024 * 1024, 'spill_dir': spill_dir, 'key': key, 'line_buffer': [], 'buffer_len': 0, 'spill_file_list': []}
+
+
+def add_sorted_line(line_sorter, line):
+
+    line_sorter['line_buffer'].append(line)
+    line_sorter['buffer_len'] += len(line)
+    if line_sorter['buffer_len'] >= line_sorter['buffer_limit']:
+        line_sorter['line_buffer'].sort(key=line_sorter['key'])
+        spill_file_handle, pwd_spill_file = tempfile.mkstemp(prefix='MetaCHIP_sort_', suffix='.txt', dir=line_sorter['spill_dir'])
+        line_sorter['spill_file_list'].append(pwd_spill_file)
+        with os.fdopen(spill_file_handle, 'w') as spill_file:
+            spill_file.writelines(line_sorter['line_buffer'])
+        line_sorter['line_buffer'] = []
+        line_sorter['buffer_len'] = 0
+
+
+def remove_spill_files(line_sorter):
+
+    for pwd_spill_file in line_sorter['spill_file_list']:
+        if os.path.isfile(pwd_spill_file) is True:
+            os.remove(pwd_spill_file)
+    line_sorter['spill_file_list'] = []
+
+
+def iter_line_sorter(line_sorter):
+
+    # yield added lines in sorted order, spill files are removed afterwards
+    try:
+        line_buffer = line_sorter['line_buffer']
+        line_sorter['line_buffer'] = []
+        line_buffer.sort(key=line_sorter['key'])
+
+        if len(line_sorter['spill_file_list']) == 0:
+            for line in line_buffer:
+                yield line
+        else:
+            spill_file_handle_list = [open(i) for i in line_sorter['spill_file_list']]
+            for line in heapq.merge(*(spill_file_handle_list + [line_buffer]), key=line_sorter['key']):
+                yield line
+            for spill_file in spill_file_handle_list:
+                spill_file.close()
+
+    finally:
+        remove_spill_files(line_sorter)
+
+
+def iter_sorted_lines(line_iter, buffer_size=256, spill_dir=None, key=None):
+
+    # yield lines (ending with a line break) in sorted order, spill files are written to the system temporary folder
+    # if spill_dir is None
+    line_sorter = new_line_sorter(buffer_size, spill_dir, key)
+    try:
+        for line in line_iter:
+            add_sorted_line(line_sorter, line)
+        for line in iter_line_sorter(line_sorter):
+            yield line
+
+    finally:
+        remove_spill_files(line_sorter)
+
+
+def sort_file(pwd_file_in, pwd_file_out, buffer_size=256, spill_dir=None, key=None):
+
+    with open(pwd_file_in) as file_in_handle, open(pwd_file_out, 'w') as file_out_handle:
+        file_out_handle.writelines(iter_sorted_lines(file_in_handle, buffer_size, spill_dir, key))
+
+
+def iter_line_groups(line_iter, key):
+
+    # group consecutive lines with the same key, for sorted input or input already grouped by key (e.g. blast
+    # output is grouped by query), yield key and list of lines
+    for line_key, line_group in itertools.groupby(line_iter, key=key):
+        yield line_key, list(line_group)
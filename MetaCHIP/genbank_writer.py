@@ -0,0 +1,130 @@
+from datetime import datetime
+
+
+# GenBank records in the same format as Biopython's GenBank writer, written without building SeqRecord objects.
+# prodigal_parser in PI uses them as it goes through Prodigal output.
+
+
+def get_gbk_date():
+
+    # same date check as Biopython's GenBank writer
+    gbk_date = (datetime.now().strftime('%d-%b-%Y')).upper()
+    if (len(gbk_date) != 11) or (gbk_date[3:6] not in ['JAN', 'FEB', 'MAR', 'APR', 'MAY', 'JUN', 'JUL', 'AUG', 'SEP', 'OCT', 'NOV', 'DEC']):
+        gbk_date = '01-JAN-1980'
+
+    return gbk_date
+
+
+def gbk_qualifier_lines(qualifier_line):
+
+    # wrap a feature qualifier at 80 characters, the same way as Biopython's GenBank writer
+    if len(qualifier_line) <= 80:
+        return [qualifier_line]
+
+    # no space to break at (e.g. translation), cut at a fixed width
+    if ' ' not in qualifier_line[21:]:
+        return [qualifier_line[:80]] + [' ' * 21 + qualifier_line[i:i + 59] for i in range(80, len(qualifier_line), 59)]
+
+    wrapped_line_list = []
+    while qualifier_line.lstrip():
+        if len(qualifier_line) <= 80:
+            wrapped_line_list.append(qualifier_line)
+            break
+        index = 80
+        for i in range(min(len(qualifier_line) - 1, 80), 22, -1):
+            if qualifier_line[i] == ' ':
+                index = i
+                break
+        wrapped_line_list.append(qualifier_line[:index])
+        qualifier_line = ' ' * 21 + qualifier_line[index:].lstrip()
+
+    return wrapped_line_list
+
+
+def gbk_multi_line(tag, text):
+
+    # split text into lines of no more than 68 characters at spaces, as Biopython does
+    line_list = []
+    text = text.strip()
+    if len(text) <= 68:
+        line_list = [text]
+    else:
+        word_list = text.split()
+        text = ''
+        while word_list and len(text) + 1 + len(word_list[0]) <= 68:
+            text += ' ' + word_list.pop(0)
+            text = text.strip()
+        line_list = [text]
+        while word_list:
+            text = word_list.pop(0)
+            while word_list and len(text) + 1 + len(word_list[0]) <= 68:
+                text += ' ' + word_list.pop(0)
+            line_list.append(text)
+
+    gbk_lines = '%s%s\n' % (tag.ljust(12), line_list[0])
+    for each_line in line_list[1:]:
+        gbk_lines += '%s%s\n' % (' ' * 12, each_line)
+
+    return gbk_lines
+
+
+def gbk_record(seq_id, sequence, feature_line_list, prefix, date):
+
+    # LOCUS line
+    seq_len_str = str(len(sequence))
+    if (len(seq_id) > 16) and (len(seq_len_str) > 11 - (len(seq_id) - 16)):
+        name_length = '%s %s' % (seq_id, seq_len_str)
+    else:
+        name_length = seq_id + seq_len_str.rjust(28)[len(seq_id):]
+
+    accession = ''
+    if seq_id.startswith('.'):
+        try:
+            accession = '.%i' % int(seq_id.split('.', 1)[1])
+        except ValueError:
+            pass
+
+    organism = prefix if len(prefix) <= 68 else prefix[:64] + '...'
+
+    record_line_list = ['LOCUS       %s %s    %s %s %s %s\n' % (name_length, 'bp', 'DNA'.ljust(7), ' ' * 8, 'UNK', date),
+                        'DEFINITION  .\n',
+                        'ACCESSION   \n',
+                        'VERSION     %s\n' % accession,
+                        'KEYWORDS    .\n',
+                        gbk_multi_line('SOURCE', prefix),
+                        '  ORGANISM  %s\n' % organism,
+                        '            Unclassified.\n',
+                        'COMMENT     .\n',
+                        'FEATURES             Location/Qualifiers\n']
+    record_line_list += feature_line_list
+
+    # sequence
+    record_line_list.append('ORIGIN\n')
+    sequence = sequence.lower()
+    block_list = [sequence[i:i + 10] for i in range(0, len(sequence), 10)]
+    for n in range(0, len(block_list), 6):
+        record_line_list.append('%s %s\n' % (str(n * 10 + 1).rjust(9), ' '.join(block_list[n:n + 6])))
+    record_line_list.append('//\n')
+
+    return ''.join(record_line_list)
+
+
+def gbk_cds_feature(cds_start, cds_end, cds_strand, locus_tag_id, transl_table, sequence_aa):
+
+    if cds_start + 1 == cds_end:
+        cds_location = '%d' % cds_end
+    elif cds_start == cds_end:
+        cds_location = '%d^%d' % (cds_end, cds_end + 1)
+    else:
+        cds_location = '%d..%d' % (cds_start + 1, cds_end)
+    if cds_strand == '-':
+        cds_location = 'complement(%s)' % cds_location
+
+    feature_line_list = ['     CDS             %s\n' % cds_location]
+    for qualifier_line in ['%s/locus_tag="%s"' % (' ' * 21, locus_tag_id.replace('"', '""')),
+                           '%s/transl_table=%s' % (' ' * 21, transl_table),
+                           '%s/translation="%s"' % (' ' * 21, sequence_aa)]:
+        for wrapped_line in gbk_qualifier_lines(qualifier_line):
+            feature_line_list.append('%s\n' % wrapped_line)
+
+    return feature_line_list
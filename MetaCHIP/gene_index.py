@@ -0,0 +1,130 @@
+import os
+import numpy as np
+from MetaCHIP.contig_store import contig_store_record, write_contig_store_index
+
+
+# Per-genome gene coordinate index written by PI (<genome>.npz in the prodigal output folder). Contigs are kept in the
+# order of the input genome with their name, length and translation table. Genes are kept in the order of their locus
+# tags (gene index, see gene_table.py) with the index of their contig, start and end (0-based, end exclusive, the same
+# as Biopython reads them from the gbk file) and strand (1 or -1). BP gets flanking regions with range queries on the
+# index and their sequences from the contig store (see contig_store.py), rather than parsing the gbk file.
+
+
+def write_gene_index(pwd_gene_index, contig_name_list, contig_len_list, contig_transl_table_list, gene_contig_list, gene_start_list, gene_end_list, gene_strand_list):
+
+    # write to a temporary file first, np.savez adds .npz to file names without it
+    pwd_gene_index_tmp = '%s.tmp.npz' % pwd_gene_index
+    np.savez(pwd_gene_index_tmp,
+             contig_name=np.array(contig_name_list, dtype=str),
+             contig_len=np.array(contig_len_list, dtype=np.int64),
+             contig_transl_table=np.array(contig_transl_table_list, dtype=np.int64),
+             gene_contig=np.array(gene_contig_list, dtype=np.int64),
+             gene_start=np.array(gene_start_list, dtype=np.int64),
+             gene_end=np.array(gene_end_list, dtype=np.int64),
+             gene_strand=np.array(gene_strand_list, dtype=np.int8))
+    os.replace(pwd_gene_index_tmp, pwd_gene_index)
+
+
+def read_gene_index(pwd_gene_index):
+
+    with np.load(pwd_gene_index) as gene_index_npz:
+        gene_index_dict = {i: gene_index_npz[i] for i in gene_index_npz.files}
+
+    return gene_index_dict
+
+
+def get_cds_location(cds_location):
+
+    # start (0-based), end and strand of CDS locations written by prodigal_parser: a..b, a, a^b and their complement
+    cds_strand = 1
+    if cds_location.startswith('complement('):
+        cds_location = cds_location[11:-1]
+        cds_strand = -1
+
+    if '..' in cds_location:
+        cds_start, cds_end = cds_location.split('..')
+        return int(cds_start) - 1, int(cds_end), cds_strand
+    elif '^' in cds_location:
+        return int(cds_location.split('^')[0]), int(cds_location.split('^')[0]), cds_strand
+    else:
+        return int(cds_location) - 1, int(cds_location), cds_strand
+
+
+def index_gbk_file(pwd_gbk_file, pwd_gene_index, pwd_contig_store):
+
+    # gene coordinate index and contig store of gbk files from PI runs before they were written, lines are scanned
+    # without parsing records
+    contig_name_list = []
+    contig_len_list = []
+    contig_transl_table_list = []
+    gene_contig_list = []
+    gene_start_list = []
+    gene_end_list = []
+    gene_strand_list = []
+    contig_store_handle = open(pwd_contig_store, 'wb')
+    contig_store_offset = 0
+    fai_line_list = []
+    contig_seq_list = None
+    for each_line in open(pwd_gbk_file, 'rb'):
+        if each_line.startswith(b'LOCUS '):
+            each_line_split = each_line.decode().split()
+            contig_name_list.append(each_line_split[1])
+            contig_len_list.append(int(each_line_split[2]))
+            # Prodigal is run with -g 11
+            contig_transl_table_list.append(11)
+        elif each_line.startswith(b'     CDS '):
+            cds_start, cds_end, cds_strand = get_cds_location(each_line.decode().split()[1])
+            gene_contig_list.append(len(contig_name_list) - 1)
+            gene_start_list.append(cds_start)
+            gene_end_list.append(cds_end)
+            gene_strand_list.append(cds_strand)
+        elif each_line.startswith(b'                     /transl_table='):
+            contig_transl_table_list[-1] = int(each_line.decode().split('=')[1])
+        elif each_line.startswith(b'ORIGIN'):
+            contig_seq_list = []
+        elif each_line.startswith(b'//'):
+            contig_record, fai_line = contig_store_record(contig_name_list[-1], b''.join(contig_seq_list).decode(), contig_store_offset)
+            contig_store_handle.write(contig_record)
+            contig_store_offset += len(contig_record)
+            fai_line_list.append(fai_line)
+            contig_seq_list = None
+        elif contig_seq_list is not None:
+            contig_seq_list += each_line.split()[1:]
+    contig_store_handle.close()
+
+    write_contig_store_index(pwd_contig_store, fai_line_list)
+    write_gene_index(pwd_gene_index, contig_name_list, contig_len_list, contig_transl_table_list, gene_contig_list, gene_start_list, gene_end_list, gene_strand_list)
+
+
+def get_flanking_genes(gene_index_dict, gene_index, flanking_length):
+
+    # flanking region of a gene (extended to genes crossing its ends) and the genes in it, the same rules as the
+    # GenBank based get_flanking_region in BP used. Genes of a contig are next to each other in the index and sorted
+    # by start, so only genes from the first one ending after the region start are checked, until one starts after
+    # the region end
+    contig_index = gene_index_dict['gene_contig'][gene_index]
+    contig_len = int(gene_index_dict['contig_len'][contig_index])
+    new_start = max(int(gene_index_dict['gene_start'][gene_index]) - flanking_length, 0)
+    new_end = min(int(gene_index_dict['gene_end'][gene_index]) + flanking_length, contig_len)
+
+    contig_gene_first = int(np.searchsorted(gene_index_dict['gene_contig'], contig_index, side='left'))
+    contig_gene_last = int(np.searchsorted(gene_index_dict['gene_contig'], contig_index, side='right'))
+    contig_gene_end_array = gene_index_dict['gene_end'][contig_gene_first:contig_gene_last]
+    first_gene_to_check = contig_gene_first + int(np.argmax(contig_gene_end_array >= new_start))
+
+    keep_gene_list = []
+    for each_gene in range(first_gene_to_check, contig_gene_last):
+        gene_start = int(gene_index_dict['gene_start'][each_gene])
+        gene_end = int(gene_index_dict['gene_end'][each_gene])
+        if gene_start > new_end:
+            break
+        if (gene_start < new_start) and (gene_end >= new_start):
+            keep_gene_list.append(each_gene)
+            new_start = gene_start
+        elif (gene_start > new_start) and (gene_end < new_end):
+            keep_gene_list.append(each_gene)
+        elif (gene_start <= new_end) and (gene_end > new_end):
+            keep_gene_list.append(each_gene)
+            new_end = gene_end
+
+    return new_start, new_end, keep_gene_list
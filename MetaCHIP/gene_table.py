@@ -0,0 +1,51 @@
+# Genome table written by PI (<prefix>_<ranks>_gene_table.txt, tab separated, one line per genome with its number
+# of genes, genomes sorted by name). Genes are interned as (genome index, gene index): the line of their genome in
+# the table and the number in their locus tag minus 1 (gA_00012 -> gene index 11, see prodigal_parser). BP works on
+# interned genes and converts them back to locus tags for output files and external tools.
+
+
+def get_genome_name(gene_name):
+
+    # gA_00012 -> gA
+    return gene_name.rpartition('_')[0]
+
+
+def get_gene_name(genome_name, gene_index):
+
+    # same format as locus tags assigned by prodigal_parser
+    return '%s_%05d' % (genome_name, gene_index + 1)
+
+
+def intern_gene(gene_name, genome_to_index_dict):
+
+    # gA_00012 -> (genome index of gA, 11)
+    genome_name, sep, gene_num = gene_name.rpartition('_')
+    return genome_to_index_dict[genome_name], int(gene_num) - 1
+
+
+def write_gene_table(pwd_gene_table, genome_list, pwd_ffn_folder):
+
+    gene_table_handle = open(pwd_gene_table, 'w')
+    gene_table_handle.write('Genome\tGenes\n')
+    for genome_name in sorted(genome_list):
+        gene_num = 0
+        for each_line in open('%s/%s.ffn' % (pwd_ffn_folder, genome_name)):
+            if each_line.startswith('>'):
+                gene_num += 1
+        gene_table_handle.write('%s\t%s\n' % (genome_name, gene_num))
+    gene_table_handle.close()
+
+
+def read_gene_table(pwd_gene_table):
+
+    # return genome list and the number of genes in each genome
+    genome_list = []
+    gene_num_list = []
+    for each_line in open(pwd_gene_table):
+        if not each_line.startswith('Genome\t'):
+            each_line_split = each_line.strip().split('\t')
+            genome_list.append(each_line_split[0])
+            gene_num_list.append(int(each_line_split[1]))
+
+    return genome_list, gene_num_list
+
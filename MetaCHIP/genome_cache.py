@@ -0,0 +1,194 @@
+import os
+import time
+import shutil
+import hashlib
+
+
+genome_cache_usage = '''
+===================================== genome cache example commands =====================================
+
+# show the number of cached genomes, disk usage and hit rates
+MetaCHIP cache stats
+
+# remove all cached results
+MetaCHIP cache clear
+
+# Cached Prodigal and hmmsearch results are used by PI and get_SCG_tree when -cache is provided,
+# cache location (cache_dir) and size limit (cache_max_size, in GB) are specified in MetaCHIP_config.py
+
+=========================================================================================================
+'''
+
+
+# increase if the format of cached files changed, entries of earlier versions are not used and will be evicted
+# 1: sco, ffn, faa and gbk files, hmmsearch domtblout
+# 2: gene coordinate index (npz, with translation tables) and contig store (fna and fai) of PI
+cache_version = 2
+
+
+def get_file_md5(file_in):
+
+    file_md5 = hashlib.md5()
+    with open(file_in, 'rb') as file_in_handle:
+        for file_chunk in iter(lambda: file_in_handle.read(1048576), b''):
+            file_md5.update(file_chunk)
+
+    return file_md5.hexdigest()
+
+
+def get_cache_key(pwd_input_file, genome_name, tool, mode):
+
+    # genome name is part of the key as it is used in locus tags and gbk files. Outputs of different parsers of the
+    # same tool need different tool names (e.g. prodigal_PI and prodigal_SCG_tree), as files missing from an entry
+    # are added to it by add_to_cache
+    key_str = '%s|%s|%s|%s|%s' % (cache_version, get_file_md5(pwd_input_file), genome_name, tool, mode)
+
+    return hashlib.md5(key_str.encode()).hexdigest()
+
+
+def link_or_copy(file_in, file_out):
+
+    if os.path.isfile(file_out) is True:
+        os.remove(file_out)
+    try:
+        os.link(file_in, file_out)
+    except OSError:
+        shutil.copyfile(file_in, file_out)
+
+
+def link_from_cache(cache_dir, cache_key, file_list):
+
+    # link cached files to the locations in file_list, return False if any of them is not cached
+    pwd_cache_entry = '%s/entries/%s' % (cache_dir, cache_key)
+    for each_file in file_list:
+        if os.path.isfile('%s/%s' % (pwd_cache_entry, os.path.basename(each_file))) is False:
+            return False
+
+    for each_file in file_list:
+        link_or_copy('%s/%s' % (pwd_cache_entry, os.path.basename(each_file)), each_file)
+
+    # last used time for LRU eviction
+    os.utime(pwd_cache_entry, None)
+
+    return True
+
+
+def add_to_cache(cache_dir, cache_key, file_list):
+
+    pwd_cache_entry = '%s/entries/%s' % (cache_dir, cache_key)
+    pwd_cache_entry_tmp = '%s/tmp/%s_%s' % (cache_dir, cache_key, os.getpid())
+    os.makedirs(pwd_cache_entry_tmp, exist_ok=True)
+    os.makedirs('%s/entries' % cache_dir, exist_ok=True)
+
+    # copy rather than link, files in the working directory might be overwritten later
+    for each_file in file_list:
+        if os.path.isfile(each_file) is True:
+            shutil.copyfile(each_file, '%s/%s' % (pwd_cache_entry_tmp, os.path.basename(each_file)))
+
+    # add files to an existing entry (e.g. gbk file was not written with PI -nogbk)
+    if os.path.isdir(pwd_cache_entry) is True:
+        for each_file in os.listdir(pwd_cache_entry_tmp):
+            if os.path.isfile('%s/%s' % (pwd_cache_entry, each_file)) is False:
+                os.rename('%s/%s' % (pwd_cache_entry_tmp, each_file), '%s/%s' % (pwd_cache_entry, each_file))
+        shutil.rmtree(pwd_cache_entry_tmp, ignore_errors=True)
+        os.utime(pwd_cache_entry, None)
+    else:
+        try:
+            os.rename(pwd_cache_entry_tmp, pwd_cache_entry)
+        except OSError:
+            # added by another process in the meantime
+            shutil.rmtree(pwd_cache_entry_tmp, ignore_errors=True)
+
+
+def read_cache_stats(cache_dir):
+
+    cache_stats_dict = {}
+    pwd_cache_stats_file = '%s/cache_stats.txt' % cache_dir
+    if os.path.isfile(pwd_cache_stats_file) is True:
+        for each_line in open(pwd_cache_stats_file):
+            if not each_line.startswith('Tool\t'):
+                each_line_split = each_line.strip().split('\t')
+                cache_stats_dict[each_line_split[0]] = [int(each_line_split[1]), int(each_line_split[2])]
+
+    return cache_stats_dict
+
+
+def update_cache_stats(cache_dir, tool, cache_status_list):
+
+    # cache_status_list: 'hit' or 'miss' returned by workers
+    cache_stats_dict = read_cache_stats(cache_dir)
+    if tool not in cache_stats_dict:
+        cache_stats_dict[tool] = [0, 0]
+    cache_stats_dict[tool][0] += cache_status_list.count('hit')
+    cache_stats_dict[tool][1] += cache_status_list.count('miss')
+
+    pwd_cache_stats_file = '%s/cache_stats.txt' % cache_dir
+    pwd_cache_stats_file_tmp = '%s.%s' % (pwd_cache_stats_file, os.getpid())
+    cache_stats_file_handle = open(pwd_cache_stats_file_tmp, 'w')
+    cache_stats_file_handle.write('Tool\tHit\tMiss\n')
+    for each_tool in sorted(cache_stats_dict):
+        cache_stats_file_handle.write('%s\t%s\t%s\n' % (each_tool, cache_stats_dict[each_tool][0], cache_stats_dict[each_tool][1]))
+    cache_stats_file_handle.close()
+    os.replace(pwd_cache_stats_file_tmp, pwd_cache_stats_file)
+
+
+def get_cache_entry_list(cache_dir):
+
+    # return [[entry path, last used time, size in bytes], ...], least recently used first
+    cache_entry_list = []
+    pwd_cache_entries = '%s/entries' % cache_dir
+    if os.path.isdir(pwd_cache_entries) is True:
+        for cache_key in os.listdir(pwd_cache_entries):
+            pwd_cache_entry = '%s/%s' % (pwd_cache_entries, cache_key)
+            cache_entry_size = sum([os.path.getsize('%s/%s' % (pwd_cache_entry, i)) for i in os.listdir(pwd_cache_entry)])
+            cache_entry_list.append([pwd_cache_entry, os.path.getmtime(pwd_cache_entry), cache_entry_size])
+
+    return sorted(cache_entry_list, key=lambda x: x[1])
+
+
+def evict_cache(cache_dir, cache_max_size):
+
+    # remove least recently used entries until the cache is no larger than cache_max_size (GB)
+    cache_max_size_byte = cache_max_size * 1024 * 1024 * 1024
+    cache_entry_list = get_cache_entry_list(cache_dir)
+    cache_size = sum([i[2] for i in cache_entry_list])
+
+    evicted_entry_num = 0
+    for pwd_cache_entry, last_used_time, cache_entry_size in cache_entry_list:
+        if cache_size <= cache_max_size_byte:
+            break
+        shutil.rmtree(pwd_cache_entry, ignore_errors=True)
+        cache_size -= cache_entry_size
+        evicted_entry_num += 1
+
+    return evicted_entry_num
+
+
+def genome_cache(args, config_dict):
+
+    cache_action =  args['action']
+    cache_dir =     config_dict['cache_dir']
+    cache_max_size = config_dict['cache_max_size']
+
+    if cache_action == 'clear':
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        print('Cache folder %s removed' % cache_dir)
+
+    if cache_action == 'stats':
+
+        cache_entry_list = get_cache_entry_list(cache_dir)
+        cache_size = sum([i[2] for i in cache_entry_list])
+        cache_stats_dict = read_cache_stats(cache_dir)
+
+        print('Cache folder: %s' % cache_dir)
+        print('Cached entries: %s' % len(cache_entry_list))
+        print('Disk usage: %.2f GB (limit: %s GB)' % (cache_size / (1024 * 1024 * 1024), cache_max_size))
+        if len(cache_entry_list) > 0:
+            print('Least recently used entry: %s' % time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(cache_entry_list[0][1])))
+        print('Tool\tHit\tMiss\tHit rate')
+        for each_tool in sorted(cache_stats_dict):
+            hit_num, miss_num = cache_stats_dict[each_tool]
+            hit_rate = 0
+            if (hit_num + miss_num) > 0:
+                hit_rate = hit_num * 100 / (hit_num + miss_num)
+            print('%s\t%s\t%s\t%.2f%s' % (each_tool, hit_num, miss_num, hit_rate, '%'))
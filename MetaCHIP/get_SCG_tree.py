@@ -1,11 +1,11 @@
 #!/usr/bin/env python
 from __future__ import division
 import os
-import re
 import glob
 import shutil
 import argparse
 import warnings
+import numpy as np
 from datetime import datetime
 from Bio import SeqIO, AlignIO, Align
 from Bio.Seq import Seq
@@ -13,6 +13,7 @@ from Bio import SeqFeature as SF
 from Bio.SeqRecord import SeqRecord
 from Bio.SeqFeature import SeqFeature, FeatureLocation
 import multiprocessing as mp
+from MetaCHIP.genome_cache import get_file_md5, get_cache_key, link_from_cache, add_to_cache, update_cache_stats, evict_cache
 
 
 get_SCG_tree_usage = '''
@@ -24,6 +25,9 @@ MetaCHIP get_SCG_tree -i genomes -p NorthSea -x fasta -t 4 -nonmeta
 # for metagenome-assembled genomes (MAGs) 
 MetaCHIP get_SCG_tree -i genomes -p NorthSea -x fasta -t 4
 
+# reuse Prodigal and hmmsearch results cached by previous PI or get_SCG_tree runs
+MetaCHIP get_SCG_tree -i genomes -p NorthSea -x fasta -t 4 -cache
+
 # Software dependencies:
 Prodigal, HMMER, Mafft and FastTree
 
@@ -82,146 +86,28 @@ def get_program_path_dict(pwd_cfg_file):
 
 def remove_low_cov_and_consensus_columns(alignment_file_in, minimal_cov, min_consensus, alignment_file_out):
 
-    def list_to_segments(list_in):
-
-        segments_out = []
-        current_element = None
-        current_segment = [None, None]
-        for each_element in list_in:
-
-            # for the first ellment
-            if current_element == None:
-                current_element = each_element
-                current_segment = [each_element, each_element]
-
-            elif each_element == current_element + 1:
-                current_segment[1] = each_element
-                current_element = each_element
-
-            elif each_element != current_element + 1:
-
-                # add segment to list
-                segments_out.append(current_segment)
-
-                # resetting segment
-                current_segment = [each_element, each_element]
-                current_element = each_element
-
-        # add segment to list
-        segments_out.append(current_segment)
-
-        return segments_out
-
-    def remove_columns_from_msa(alignment_in, cols_to_remove):
-
-        # get 0 based index of all wanted columns
-        cols_to_remove_0_base = [(i - 1) for i in cols_to_remove]
-        aln_cols_index_all = list(range(alignment_in.get_alignment_length()))
-        aln_cols_index_wanted = []
-        for i in aln_cols_index_all:
-            if i not in cols_to_remove_0_base:
-                aln_cols_index_wanted.append(i)
-
-        # get wanted alignment segments
-        wanted_segments = list_to_segments(aln_cols_index_wanted)
-
-        # create an empty Alignment object
-        alignment_new = Align.MultipleSeqAlignment([])
-        for sequence in alignment_in:
-            new_seq_object = Seq('')
-            new_seq_record = SeqRecord(new_seq_object)
-            new_seq_record.id = sequence.id
-            new_seq_record.description = sequence.description
-            alignment_new.append(new_seq_record)
-
-        # add wanted columns to empty Alignment object
-        for segment in wanted_segments:
-
-            # for single column segment
-            if segment[0] == segment[1]:
-                segment_value = alignment_in[:, segment[0]]
-
-                m = 0
-                for each_seq in alignment_new:
-                    each_seq.seq = Seq(str(each_seq.seq) + segment_value[m])
-                    m += 1
-
-            # for multiple columns segment
-            else:
-                segment_value = alignment_in[:, (segment[0]):(segment[1] + 1)]
-                alignment_new += segment_value
-
-        return alignment_new
-
-    def remove_low_cov_columns(alignment_in, min_cov_cutoff):
-
-        # get columns with low coverage
-        sequence_number = len(alignment_in)
-        total_col_num = alignment_in.get_alignment_length()
-        low_cov_columns = []
-        n = 0
-        while n < total_col_num:
-            current_column = alignment_in[:, n]
-            dash_number = current_column.count('-')
-            gap_percent = (dash_number / sequence_number) * 100
-
-            if gap_percent > min_cov_cutoff:
-                low_cov_columns.append(n + 1)
-
-            n += 1
-
-        # remove identified columns
-        alignment_new = remove_columns_from_msa(alignment_in, low_cov_columns)
-
-        return alignment_new
-
-    def remove_low_consensus_columns(alignment_in, min_css_cutoff):
-
-        # get columns with low coverage
-        sequence_number = len(alignment_in)
-        total_col_num = alignment_in.get_alignment_length()
-        low_css_columns = []
-        n = 0
-        while n < total_col_num:
-            current_column = alignment_in[:, n]
-
-            # get all aa in current column
-            aa_list = set()
-            for aa in current_column:
-                aa_list.add(aa)
-
-            # get maximum aa percent
-            most_abundant_aa_percent = 0
-            for each_aa in aa_list:
-                each_aa_percent = (current_column.count(each_aa) / sequence_number) * 100
-                if each_aa_percent > most_abundant_aa_percent:
-                    most_abundant_aa_percent = each_aa_percent
-
-            # if maximum percent lower than provided cutoff, add current column to low consensus column list
-            if most_abundant_aa_percent < min_css_cutoff:
-                low_css_columns.append(n + 1)
-
-            n += 1
-
-        # remove identified columns
-        alignment_new = remove_columns_from_msa(alignment_in, low_css_columns)
-
-        return alignment_new
-
-    # read in alignment
+    # read in alignment, one row per sequence and one column per alignment column
     alignment = AlignIO.read(alignment_file_in, "fasta")
+    sequence_number = len(alignment)
+    alignment_array = np.array([np.frombuffer(str(each_seq.seq).encode(), dtype=np.uint8) for each_seq in alignment], dtype=np.uint8).reshape(sequence_number, -1)
 
-    # remove_low_cov_columns
-    alignment_cov = remove_low_cov_columns(alignment, minimal_cov)
+    # remove columns with gap percent higher than minimal_cov
+    dash_number_array = np.count_nonzero(alignment_array == ord('-'), axis=0)
+    gap_percent_array = (dash_number_array / float(sequence_number)) * 100
+    alignment_array = alignment_array[:, gap_percent_array <= minimal_cov]
 
-    # remove_low_consensus_columns
-    alignment_cov_css = remove_low_consensus_columns(alignment_cov, min_consensus)
+    # remove columns with percent of the most abundant residue lower than min_consensus
+    most_abundant_aa_number_array = np.zeros(alignment_array.shape[1], dtype=np.int64)
+    for each_aa in np.unique(alignment_array):
+        most_abundant_aa_number_array = np.maximum(most_abundant_aa_number_array, np.count_nonzero(alignment_array == each_aa, axis=0))
+    most_abundant_aa_percent_array = (most_abundant_aa_number_array / float(sequence_number)) * 100
+    alignment_array = alignment_array[:, most_abundant_aa_percent_array >= min_consensus]
 
     # write filtered alignment
     alignment_file_out_handle = open(alignment_file_out, 'w')
-    for each_seq in alignment_cov_css:
+    for each_seq, each_seq_array in zip(alignment, alignment_array):
         alignment_file_out_handle.write('>%s\n' % str(each_seq.id))
-        alignment_file_out_handle.write('%s\n' % str(each_seq.seq))
+        alignment_file_out_handle.write('%s\n' % each_seq_array.tobytes().decode())
     alignment_file_out_handle.close()
 
 
@@ -369,12 +255,21 @@ def prodigal_worker(argument_list):
     pwd_prodigal_exe = argument_list[2]
     nonmeta_mode = argument_list[3]
     pwd_prodigal_output_folder = argument_list[4]
+    cache_dir = argument_list[5]
 
     # prepare command (according to Prokka)
     input_genome_basename, input_genome_ext = os.path.splitext(input_genome)
     pwd_input_genome = '%s/%s' % (input_genome_folder, input_genome)
     pwd_output_sco = '%s/%s.sco' % (pwd_prodigal_output_folder, input_genome_basename)
 
+    # link cached results if the same genome has been annotated before, PI files are written by its own parser and
+    # cached separately
+    output_file_list = ['%s/%s.%s' % (pwd_prodigal_output_folder, input_genome_basename, i) for i in ['sco', 'ffn', 'faa']]
+    if cache_dir is not None:
+        cache_key = get_cache_key(pwd_input_genome, input_genome_basename, 'prodigal_SCG_tree', {True: 'nonmeta', False: 'meta'}[nonmeta_mode])
+        if link_from_cache(cache_dir, cache_key, output_file_list) is True:
+            return 'hit'
+
     prodigal_cmd_meta = '%s -f sco -q -c -m -g 11 -p meta -i %s -o %s' % (
     pwd_prodigal_exe, pwd_input_genome, pwd_output_sco)
     prodigal_cmd_nonmeta = '%s -f sco -q -c -m -g 11 -i %s -o %s' % (
@@ -390,6 +285,10 @@ def prodigal_worker(argument_list):
     # prepare ffn, faa and gbk files from prodigal output
     prodigal_parser(pwd_input_genome, pwd_output_sco, input_genome_basename, pwd_prodigal_output_folder)
 
+    if cache_dir is not None:
+        add_to_cache(cache_dir, cache_key, output_file_list)
+        return 'miss'
+
 
 def hmmsearch_worker(argument_list):
 
@@ -398,62 +297,63 @@ def hmmsearch_worker(argument_list):
     pwd_hmmsearch_exe = argument_list[2]
     path_to_hmm = argument_list[3]
     pwd_faa_folder = argument_list[4]
+    cache_dir = argument_list[5]
+    hmm_md5 = argument_list[6]
 
-    # run hmmsearch
+    # run hmmsearch, per-marker hits of the same proteins and hmm profiles are linked from cache
     pwd_faa_file = '%s/%s.faa' % (pwd_faa_folder, faa_file_basename)
-    os.system('%s -o /dev/null --domtblout %s/%s_hmmout.tbl %s %s' % (pwd_hmmsearch_exe, pwd_SCG_tree_wd, faa_file_basename, path_to_hmm, pwd_faa_file))
-
-    # Reading the protein file in a dictionary
+    pwd_hmmout_tbl = '%s/%s_hmmout.tbl' % (pwd_SCG_tree_wd, faa_file_basename)
+    cache_status = None
+    if cache_dir is not None:
+        cache_key = get_cache_key(pwd_faa_file, faa_file_basename, 'hmmsearch', hmm_md5)
+        cache_status = 'hit'
+        if link_from_cache(cache_dir, cache_key, [pwd_hmmout_tbl]) is False:
+            cache_status = 'miss'
+
+    if cache_status != 'hit':
+        os.system('%s -o /dev/null --domtblout %s %s %s' % (pwd_hmmsearch_exe, pwd_hmmout_tbl, path_to_hmm, pwd_faa_file))
+        if cache_dir is not None:
+            add_to_cache(cache_dir, cache_key, [pwd_hmmout_tbl])
+
+    # read the domtblout, keep the best domain (highest domain score) of each hmm profile
+    best_hit_dict = {}
+    for line in open(pwd_hmmout_tbl):
+        if line[0] == "#": continue
+        splitLine = line.split()
+        hmm_id = splitLine[4]
+        hmm_score = float(splitLine[13])
+        if (hmm_id not in best_hit_dict) or (hmm_score > best_hit_dict[hmm_id][3]):
+            best_hit_dict[hmm_id] = [splitLine[0], int(splitLine[17]) - 1, int(splitLine[18]), hmm_score]
+
+    # get the aligned part of best hits, sequences will be written out by the parent process
+    best_hit_protein_set = set([i[0] for i in best_hit_dict.values()])
     proteinSequence = {}
     for seq_record in SeqIO.parse(pwd_faa_file, 'fasta'):
-        proteinSequence[seq_record.id] = str(seq_record.seq)
-
-    # Reading the hmmersearch table/extracting the protein part found beu hmmsearch out of the protein/Writing
-    # each protein sequence that was extracted to a fasta file (one for each hmm in phylo.hmm
-    hmm_id = ''
-    hmm_name = ''
-    hmm_pos1 = 0
-    hmm_pos2 = 0
-    hmm_score = 0
-    pwd_hmmout_tbl = pwd_SCG_tree_wd + '/' + faa_file_basename + '_hmmout.tbl'
-    with open(pwd_hmmout_tbl, 'r') as tbl:
-        for line in tbl:
-            if line[0] == "#": continue
-            line = re.sub('\s+', ' ', line)
-            splitLine = line.split(' ')
-
-            if (hmm_id == ''):
-                hmm_id = splitLine[4]
-                hmm_name = splitLine[0]
-                hmm_pos1 = int(splitLine[17]) - 1
-                hmm_pos2 = int(splitLine[18])
-                hmm_score = float(splitLine[13])
-            elif (hmm_id == splitLine[4]):
-                if (float(splitLine[13]) > hmm_score):
-                    hmm_name = splitLine[0]
-                    hmm_pos1 = int(splitLine[17]) - 1
-                    hmm_pos2 = int(splitLine[18])
-                    hmm_score = float(splitLine[13])
-            else:
-                file_out = open(pwd_SCG_tree_wd + '/' + hmm_id + '.fasta', 'a+')
-                file_out.write('>' + faa_file_basename + '\n')
-                if hmm_name != '':
-                    seq = str(proteinSequence[hmm_name][hmm_pos1:hmm_pos2])
-                    file_out.write(str(seq) + '\n')
-                    file_out.close()
-                hmm_id = splitLine[4]
-                hmm_name = splitLine[0]
-                hmm_pos1 = int(splitLine[17]) - 1
-                hmm_pos2 = int(splitLine[18])
-                hmm_score = float(splitLine[13])
+        if seq_record.id in best_hit_protein_set:
+            proteinSequence[seq_record.id] = str(seq_record.seq)
 
-        else:
-            file_out = open(pwd_SCG_tree_wd + '/' + hmm_id + '.fasta', 'a+')
-            file_out.write('>' + faa_file_basename + '\n')
-            if hmm_name != '':
-                seq = str(proteinSequence[hmm_name][hmm_pos1:hmm_pos2])
-                file_out.write(str(seq) + '\n')
-                file_out.close()
+    hmm_hit_dict = {}
+    for hmm_id in best_hit_dict:
+        hmm_name, hmm_pos1, hmm_pos2, hmm_score = best_hit_dict[hmm_id]
+        hmm_hit_dict[hmm_id] = proteinSequence[hmm_name][hmm_pos1:hmm_pos2]
+
+    return [hmm_hit_dict, cache_status]
+
+
+def write_SCG_hits(hmmsearch_output_list, genome_list, pwd_SCG_tree_wd):
+
+    # write out hits of each hmm profile once, in the order of genome_list
+    hmm_to_hits_dict = {}
+    for genome, hmmsearch_output in zip(genome_list, hmmsearch_output_list):
+        for hmm_id in hmmsearch_output[0]:
+            if hmm_id not in hmm_to_hits_dict:
+                hmm_to_hits_dict[hmm_id] = []
+            hmm_to_hits_dict[hmm_id].append('>%s\n%s\n' % (genome, hmmsearch_output[0][hmm_id]))
+
+    for hmm_id in sorted(hmm_to_hits_dict):
+        file_out = open('%s/%s.fasta' % (pwd_SCG_tree_wd, hmm_id), 'w')
+        file_out.write(''.join(hmm_to_hits_dict[hmm_id]))
+        file_out.close()
 
 
 def convert_hmmalign_output(align_in, align_out):
@@ -526,7 +426,9 @@ config_dict = {'prodigal'         : 'prodigal',
                'path_to_hmm'      : '%s/MetaCHIP_phylo.hmm'     % config_file_path,  # do not edit this line
                'circos_HGT_R'     : '%s/MetaCHIP_circos_HGT.R'  % config_file_path,   # do not edit this line
                'cdd2cog_perl'     : '%s/cdd2cog.pl' % config_file_path,
-               'get_sankey_plot_R': '%s/get_sankey_plot.R' % config_file_path
+               'get_sankey_plot_R': '%s/get_sankey_plot.R' % config_file_path,
+               'cache_dir'        : os.path.expanduser('~/.MetaCHIP_cache'),
+               'cache_max_size'   : 20
                }
 
 
@@ -538,6 +440,7 @@ def get_SCG_tree(args, config_dict):
     file_extension =        args['x']
     num_threads =           args['t']
     nonmeta_mode =          args['nonmeta']
+    use_cache =             args['cache']
 
     # read in config file
     path_to_hmm =           config_dict['path_to_hmm']
@@ -548,6 +451,14 @@ def get_SCG_tree(args, config_dict):
     pwd_hmmstat_exe =       config_dict['hmmstat']
     pwd_fasttree_exe =      config_dict['fasttree']
 
+    # cached Prodigal and hmmsearch results are used with -cache
+    cache_dir = None
+    hmm_md5 = None
+    if use_cache is True:
+        cache_dir = config_dict['cache_dir']
+        os.makedirs(cache_dir, exist_ok=True)
+        hmm_md5 = get_file_md5(path_to_hmm)
+
     warnings.filterwarnings("ignore")
     minimal_cov_in_msa = 50
     min_consensus_in_msa = 25
@@ -602,14 +513,18 @@ def get_SCG_tree(args, config_dict):
     # prepare arguments for prodigal_worker
     list_for_multiple_arguments_Prodigal = []
     for input_genome in input_genome_file_name_list:
-        list_for_multiple_arguments_Prodigal.append([input_genome, input_genome_folder, pwd_prodigal_exe, nonmeta_mode, pwd_prodigal_output_folder])
+        list_for_multiple_arguments_Prodigal.append([input_genome, input_genome_folder, pwd_prodigal_exe, nonmeta_mode, pwd_prodigal_output_folder, cache_dir])
 
     # run prodigal with multiprocessing
     pool = mp.Pool(processes=num_threads)
-    pool.map(prodigal_worker, list_for_multiple_arguments_Prodigal)
+    prodigal_cache_status_list = pool.map(prodigal_worker, list_for_multiple_arguments_Prodigal)
     pool.close()
     pool.join()
 
+    if use_cache is True:
+        update_cache_stats(cache_dir, 'prodigal', prodigal_cache_status_list)
+        report_and_log(('Prodigal results of %s genomes linked from cache' % prodigal_cache_status_list.count('hit')), pwd_log_file, keep_quiet)
+
 
     ########################################### get species tree (hmmsearch) ###########################################
 
@@ -631,14 +546,22 @@ def get_SCG_tree(args, config_dict):
     # prepare arguments for hmmsearch_worker
     list_for_multiple_arguments_hmmsearch = []
     for faa_file_basename in faa_file_basename_list:
-        list_for_multiple_arguments_hmmsearch.append([faa_file_basename, pwd_extract_and_align_SCG_wd, pwd_hmmsearch_exe, path_to_hmm, pwd_prodigal_output_folder])
+        list_for_multiple_arguments_hmmsearch.append([faa_file_basename, pwd_extract_and_align_SCG_wd, pwd_hmmsearch_exe, path_to_hmm, pwd_prodigal_output_folder, cache_dir, hmm_md5])
 
     # run hmmsearch with multiprocessing
     pool = mp.Pool(processes=num_threads)
-    pool.map(hmmsearch_worker, list_for_multiple_arguments_hmmsearch)
+    hmmsearch_output_list = pool.map(hmmsearch_worker, list_for_multiple_arguments_hmmsearch)
     pool.close()
     pool.join()
 
+    # write out sequences of each SCG
+    write_SCG_hits(hmmsearch_output_list, [i[0] for i in list_for_multiple_arguments_hmmsearch], pwd_extract_and_align_SCG_wd)
+    hmmsearch_cache_status_list = [i[1] for i in hmmsearch_output_list]
+
+    if use_cache is True:
+        update_cache_stats(cache_dir, 'hmmsearch', hmmsearch_cache_status_list)
+        evict_cache(cache_dir, config_dict['cache_max_size'])
+
 
     ############################################# get species tree (hmmalign) #############################################
 
@@ -738,6 +661,7 @@ if __name__ == '__main__':
     parser.add_argument('-x',             required=False, default='fasta',     help='file extension')
     parser.add_argument('-nonmeta',       required=False, action="store_true", help='annotate Non-metagenome-assembled genomes (Non-MAGs)')
     parser.add_argument('-t',             required=False, type=int, default=1, help='number of threads, default: 1')
+    parser.add_argument('-cache',         required=False, action="store_true", help='reuse cached Prodigal and hmmsearch results')
 
     args = vars(parser.parse_args())
 
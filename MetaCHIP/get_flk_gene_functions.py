@@ -1,5 +1,8 @@
 import os
+import numpy as np
 from Bio import SeqIO
+from MetaCHIP.gene_table import get_genome_name, get_gene_name
+from MetaCHIP.gene_index import read_gene_index
 
 
 def check_list_elements_exist(elements_to_check, query_object):
@@ -44,32 +47,25 @@ recipient_gene_list = []
 for gene in SeqIO.parse(HGT_seq_file, 'fasta'):
     recipient_gene_list.append(gene.id)
 
-# get contigs which the identified HGTs sit in
+# get contigs which the identified HGTs sit in, with the gene coordinate index written by PI
 recipient_gene_same_ctg_gene_seqs_handle = open(recipient_gene_same_ctg_gene_seqs, 'w')
 recipient_gene_ctg_dict = {}
 recipient_gene_same_ctg_genes_dict = {}
 for recipient_gene in recipient_gene_list:
-    recipient_genome = '_'.join(recipient_gene.split('_')[:-1])
-    recipient_genome_gbk = '%s/%s.gbk' % (prodigal_output_folder, recipient_genome)
-    for record in SeqIO.parse(recipient_genome_gbk, 'genbank'):
-        ctg_id = record.id
-        ctg_coded_gene_list = []
-        for gene in record.features:
-            if (gene.type != 'source') and ('locus_tag' in gene.qualifiers):
-                gene_id = gene.qualifiers['locus_tag'][0]
-                ctg_coded_gene_list.append(gene_id)
-
-        if recipient_gene in ctg_coded_gene_list:
-            for gene in record.features:
-                if (gene.type != 'source') and ('locus_tag' in gene.qualifiers):
-
-                    gene_id = gene.qualifiers['locus_tag'][0]
-                    gene_seq = gene.qualifiers['translation'][0]
-                    recipient_gene_same_ctg_gene_seqs_handle.write('>%s\n' % gene_id)
-                    recipient_gene_same_ctg_gene_seqs_handle.write('%s\n' % gene_seq)
-
-            recipient_gene_ctg_dict[recipient_gene] = ctg_id
-            recipient_gene_same_ctg_genes_dict[recipient_gene] = ctg_coded_gene_list
+    recipient_genome = get_genome_name(recipient_gene)
+    gene_index_dict = read_gene_index('%s/%s.npz' % (prodigal_output_folder, recipient_genome))
+    recipient_gene_contig = gene_index_dict['gene_contig'][int(recipient_gene.rpartition('_')[2]) - 1]
+    ctg_id = str(gene_index_dict['contig_name'][recipient_gene_contig])
+    ctg_coded_gene_list = [get_gene_name(recipient_genome, i) for i in np.flatnonzero(gene_index_dict['gene_contig'] == recipient_gene_contig)]
+
+    ctg_coded_gene_set = set(ctg_coded_gene_list)
+    for gene in SeqIO.parse('%s/%s.faa' % (prodigal_output_folder, recipient_genome), 'fasta'):
+        if gene.id in ctg_coded_gene_set:
+            recipient_gene_same_ctg_gene_seqs_handle.write('>%s\n' % gene.id)
+            recipient_gene_same_ctg_gene_seqs_handle.write('%s\n' % str(gene.seq))
+
+    recipient_gene_ctg_dict[recipient_gene] = ctg_id
+    recipient_gene_same_ctg_genes_dict[recipient_gene] = ctg_coded_gene_list
 
 recipient_gene_same_ctg_gene_seqs_handle.close()
 
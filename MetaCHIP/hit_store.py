@@ -0,0 +1,93 @@
+import os
+import numpy as np
+from MetaCHIP.gene_table import intern_gene
+
+
+# Columnar store of filtered blastn hits, BP converts the filtered hits once and all grouping ranks of a run read
+# the store instead of re-parsing the tab-delimited files. Hits are partitioned by query genome (one folder per
+# genome, one .npy file per column, loaded memory-mapped). Genes are stored interned, as the index of their genome in
+# the genome table (genomes.txt, same order as the gene table written by PI) and their gene index (see gene_table).
+# BLAST reports identities with 3 decimals, they are stored as float32 and rounded back when read.
+
+
+hit_store_col_list = [['query_gene',        np.int32,   0],
+                      ['subject_genome',    np.int32,   1],
+                      ['subject_gene',      np.int32,   1],
+                      ['identity',          np.float32, 2],
+                      ['align_len',         np.int32,   3],
+                      ['qstart',            np.int32,   6],
+                      ['qend',              np.int32,   7],
+                      ['sstart',            np.int32,   8],
+                      ['send',              np.int32,   9],
+                      ['qlen',              np.int32,   12],
+                      ['slen',              np.int32,   13]]
+
+hit_store_genome_table = 'genomes.txt'
+
+
+def write_genome_table(pwd_hit_store, genome_list):
+
+    with open('%s/%s' % (pwd_hit_store, hit_store_genome_table), 'w') as genome_table_handle:
+        genome_table_handle.write(''.join(['%s\n' % i for i in genome_list]))
+
+
+def read_genome_table(pwd_hit_store):
+
+    return [i.strip() for i in open('%s/%s' % (pwd_hit_store, hit_store_genome_table))]
+
+
+def build_hit_store_worker(argument_list):
+
+    pwd_filtered_blast_result   = argument_list[0]
+    genome_to_index_dict        = argument_list[1]
+    pwd_hit_partition           = argument_list[2]
+
+    col_value_list = [[] for i in hit_store_col_list]
+    for match in open(pwd_filtered_blast_result):
+        match_split = match.strip().split('\t')
+        query_genome_index, query_gene_index = intern_gene(match_split[0], genome_to_index_dict)
+        subject_genome_index, subject_gene_index = intern_gene(match_split[1], genome_to_index_dict)
+        col_value_list[0].append(query_gene_index)
+        col_value_list[1].append(subject_genome_index)
+        col_value_list[2].append(subject_gene_index)
+        col_value_list[3].append(float(match_split[2]))
+        for col_index in range(4, len(hit_store_col_list)):
+            col_value_list[col_index].append(int(match_split[hit_store_col_list[col_index][2]]))
+
+    if os.path.isdir(pwd_hit_partition) is False:
+        os.mkdir(pwd_hit_partition)
+    for col_index in range(len(hit_store_col_list)):
+        col_name, col_type, col_pos = hit_store_col_list[col_index]
+        np.save('%s/%s.npy' % (pwd_hit_partition, col_name), np.array(col_value_list[col_index], dtype=col_type))
+
+
+def load_hit_partition(pwd_hit_partition, col_name_list=None):
+
+    # memory-mapped columns of a partition, {column: array}
+    if col_name_list is None:
+        col_name_list = [i[0] for i in hit_store_col_list]
+
+    return {col_name: np.load('%s/%s.npy' % (pwd_hit_partition, col_name), mmap_mode='r') for col_name in col_name_list}
+
+
+def get_identity(identity_array):
+
+    # float64 identities as reported by BLAST (3 decimals)
+    return np.round(np.asarray(identity_array, dtype=np.float64), 3)
+
+
+def iter_hit_rows(hit_partition, col_name_list, chunk_size=65536):
+
+    # rows of a partition as tuples of Python values, read in chunks from the memory-mapped columns, identities are
+    # converted with get_identity
+    hit_num = len(hit_partition[col_name_list[0]])
+    for chunk_start in range(0, hit_num, chunk_size):
+        col_value_list = []
+        for col_name in col_name_list:
+            col_chunk = hit_partition[col_name][chunk_start:chunk_start + chunk_size]
+            if col_name == 'identity':
+                col_value_list.append(get_identity(col_chunk).tolist())
+            else:
+                col_value_list.append(np.asarray(col_chunk).tolist())
+        for hit_row in zip(*col_value_list):
+            yield hit_row
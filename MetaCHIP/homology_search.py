@@ -0,0 +1,99 @@
+import tempfile
+
+
+# Homology search backends used by the all-vs-all step (PI) and the PG approach (BP). All backends produce
+# tab-delimited tables with the same columns as BLAST outfmt 6, plus qlen and slen when requested.
+#   blast:   blastn/blastp, the default
+#   mmseqs:  MMseqs2 easy-search, much faster on large datasets but less sensitive
+
+
+homology_search_backend_list = ['blast', 'mmseqs']
+
+outfmt_col_list =           ['qseqid', 'sseqid', 'pident', 'length', 'mismatch', 'gapopen', 'qstart', 'qend', 'sstart', 'send', 'evalue', 'bitscore']
+outfmt_col_list_full_len =  outfmt_col_list + ['qlen', 'slen']
+
+blast_to_mmseqs_col_dict = {'qseqid': 'query', 'sseqid': 'target', 'pident': 'pident', 'length': 'alnlen', 'mismatch': 'mismatch',
+                            'gapopen': 'gapopen', 'qstart': 'qstart', 'qend': 'qend', 'sstart': 'tstart', 'send': 'tend',
+                            'evalue': 'evalue', 'bitscore': 'bits', 'qlen': 'qlen', 'slen': 'tlen'}
+
+
+def get_homology_search_program_list(backend, seq_type, config_dict):
+
+    # executables needed by a backend, for dependency check
+    if backend == 'blast':
+        if seq_type == 'nucl':
+            return [config_dict['makeblastdb'], config_dict['blastn']]
+        else:
+            return [config_dict['blastp']]
+    elif backend == 'mmseqs':
+        return [config_dict['mmseqs']]
+    else:
+        return []
+
+
+def get_db_name(backend, seq_file):
+
+    if backend == 'mmseqs':
+        return '%s.mmseqsdb' % seq_file
+    else:
+        return seq_file
+
+
+def get_makedb_cmd(backend, seq_file, seq_type, config_dict):
+
+    # return None if no database needs to be built
+    if backend == 'blast':
+        return '%s -in %s -dbtype %s -parse_seqids' % (config_dict['makeblastdb'], seq_file, seq_type)
+    elif backend == 'mmseqs':
+        return '%s createdb %s %s > /dev/null' % (config_dict['mmseqs'], seq_file, get_db_name(backend, seq_file))
+    else:
+        return None
+
+
+def get_search_cmd(backend, query_file, db, output_file, seq_type, num_threads, config_dict, db_size=None, append=False, evalue='1e-5', full_len=True):
+
+    # search query_file against a database built by get_makedb_cmd, hits will be appended to output_file if append is True
+    col_list = outfmt_col_list
+    if full_len is True:
+        col_list = outfmt_col_list_full_len
+    redirect = '>'
+    if append is True:
+        redirect = '>>'
+
+    if backend == 'blast':
+        blast_exe = {'nucl': config_dict['blastn'], 'prot': config_dict['blastp']}[seq_type]
+        search_cmd = '%s -query %s -db %s -evalue %s -outfmt "6 %s"' % (blast_exe, query_file, db, evalue, ' '.join(col_list))
+        if seq_type == 'nucl':
+            search_cmd += ' -task blastn'
+        if db_size is not None:
+            search_cmd += ' -dbsize %s' % db_size
+        if append is True:
+            search_cmd += ' -num_threads %s >> %s' % (num_threads, output_file)
+        else:
+            search_cmd += ' -num_threads %s -out %s' % (num_threads, output_file)
+
+    elif backend == 'mmseqs':
+        # each run gets its own temporary folder (output_file can be /dev/stdout, shared by all jobs), made when the
+        # command runs so exported commands get one too, the exit status of mmseqs is kept
+        mmseqs_tmp_parent = config_dict['sort_spill_dir']
+        if mmseqs_tmp_parent == '':
+            mmseqs_tmp_parent = tempfile.gettempdir()
+        search_cmd = '(mmseqs_tmp=$(mktemp -d -p %s) && %s easy-search %s %s "$mmseqs_tmp/hits.tab" "$mmseqs_tmp/tmp" -e %s --threads %s --format-output "%s"' % (mmseqs_tmp_parent, config_dict['mmseqs'], query_file, db, evalue, num_threads, ','.join([blast_to_mmseqs_col_dict[i] for i in col_list]))
+        if seq_type == 'nucl':
+            search_cmd += ' --search-type 3'
+        search_cmd += ' > /dev/null && cat "$mmseqs_tmp/hits.tab" %s %s; status=$?; rm -rf "$mmseqs_tmp"; exit $status)' % (redirect, output_file)
+
+    return search_cmd
+
+
+def get_pairwise_search_cmd(backend, query_file, subject_file, output_file, seq_type, config_dict, full_len=False):
+
+    # search query_file against sequences in subject_file without building a database
+    if backend == 'blast':
+        blast_exe = {'nucl': config_dict['blastn'], 'prot': config_dict['blastp']}[seq_type]
+        outfmt = '6'
+        if full_len is True:
+            outfmt = '"6 %s"' % ' '.join(outfmt_col_list_full_len)
+        return '%s -query %s -subject %s -outfmt %s -out %s' % (blast_exe, query_file, subject_file, outfmt, output_file)
+    else:
+        return get_search_cmd(backend, query_file, subject_file, output_file, seq_type, 1, config_dict, evalue='10', full_len=full_len)
@@ -0,0 +1,78 @@
+import numpy as np
+
+
+# Mergeable histogram sketches of group-to-group identities, used by BP -sketch to get the per-group-pair percentile
+# cutoffs without collecting all identities. BLAST identities are in [0, 100] with 3 decimals, a sketch counts the
+# identities of each group pair in bins of a fixed resolution (identity rounded to the nearest multiple of the
+# resolution), so its size depends on the number of group pairs and bins but not on the number of hits. Workers build
+# a sketch for each genome and the parent merges them by adding counts.
+#
+# Error bound: each identity is moved by at most resolution / 2, so is each order statistic and any percentile
+# interpolated between two of them. Cutoffs are therefore within resolution / 2 of the exact value before being
+# rounded to 2 decimals, and within resolution / 2 + 0.005 after. With resolution 0.001 the sketch keeps all
+# identities as reported by BLAST and cutoffs are the same as without -sketch.
+# Resolutions should be multiples of 0.001.
+
+
+def get_identity_bin_num(resolution):
+
+    return int(round(100 / resolution)) + 1
+
+
+def build_identity_sketch(group_pair_array, identity_array, resolution):
+
+    # sketch: sorted codes (group pair * number of bins + bin) and their counts
+    identity_bin = np.rint(np.asarray(identity_array, dtype=np.float64) / resolution).astype(np.int64)
+    sketch_code = np.asarray(group_pair_array, dtype=np.int64) * get_identity_bin_num(resolution) + identity_bin
+    sketch_code, sketch_count = np.unique(sketch_code, return_counts=True)
+
+    return sketch_code, sketch_count.astype(np.int64)
+
+
+def merge_identity_sketches(sketch_list):
+
+    sketch_code = np.concatenate([i[0] for i in sketch_list] + [np.zeros(0, dtype=np.int64)])
+    sketch_count = np.concatenate([i[1] for i in sketch_list] + [np.zeros(0, dtype=np.int64)])
+    if len(sketch_code) == 0:
+        return sketch_code, sketch_count
+
+    sketch_order = np.argsort(sketch_code, kind='stable')
+    sketch_code = sketch_code[sketch_order]
+    code_start = np.flatnonzero(np.concatenate([[True], sketch_code[1:] != sketch_code[:-1]]))
+
+    return sketch_code[code_start], np.add.reduceat(sketch_count[sketch_order], code_start)
+
+
+def get_sketch_percentile(identity_value_array, identity_count_array, percentile):
+
+    # same linear interpolation as np.percentile, on identities given as sorted values and their counts
+    count_cumsum = np.cumsum(identity_count_array)
+    virtual_index = (percentile / 100) * (int(count_cumsum[-1]) - 1)
+    index_below = int(np.floor(virtual_index))
+    index_above = min(index_below + 1, int(count_cumsum[-1]) - 1)
+    value_below = float(identity_value_array[np.searchsorted(count_cumsum, index_below, side='right')])
+    value_above = float(identity_value_array[np.searchsorted(count_cumsum, index_above, side='right')])
+    weight_above = virtual_index - index_below
+
+    value_diff = value_above - value_below
+    if weight_above >= 0.5:
+        return value_above - value_diff * (1 - weight_above)
+    else:
+        return value_below + value_diff * weight_above
+
+
+def get_sketch_percentile_dict(sketch, resolution, percentile):
+
+    # {group pair: percentile of its identities}
+    sketch_code, sketch_count = sketch
+    bin_num = get_identity_bin_num(resolution)
+    group_pair_array = sketch_code // bin_num
+    identity_value_array = np.round((sketch_code % bin_num) * resolution, 3)
+
+    group_pair_start_list = np.flatnonzero(np.concatenate([[True], group_pair_array[1:] != group_pair_array[:-1]])).tolist() if len(sketch_code) > 0 else []
+    group_pair_end_list = group_pair_start_list[1:] + [len(sketch_code)]
+    percentile_dict = {}
+    for group_pair_start, group_pair_end in zip(group_pair_start_list, group_pair_end_list):
+        percentile_dict[int(group_pair_array[group_pair_start])] = get_sketch_percentile(identity_value_array[group_pair_start:group_pair_end], sketch_count[group_pair_start:group_pair_end], percentile)
+
+    return percentile_dict
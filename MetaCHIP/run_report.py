@@ -0,0 +1,185 @@
+import os
+import sys
+import json
+import time
+import resource
+import threading
+from datetime import datetime
+
+
+# Per-stage instrumentation for PI and BP. Each stage records wall time, CPU time of MetaCHIP itself and of finished
+# child processes (Pool workers, blastn, hmmsearch, FastTree ...), the number of tasks and the block I/O reported by
+# the OS (reads served from the page cache are not counted). The peak memory of a stage is the largest total RSS of
+# MetaCHIP and all its child processes, sampled every 0.2 seconds from /proc while the stage runs (Linux only, pages
+# shared between processes are counted for each of them, processes finishing between two samples are missed). The
+# largest RSS of any single process since the start of the run (ru_maxrss) is recorded as the cumulative peak.
+
+
+run_report_col_list = ['Stage', 'Tasks', 'Wall(s)', 'CPU_self(s)', 'CPU_children(s)', 'Peak_RSS_stage(MB)', 'Peak_RSS_cumulative(MB)', 'Read(MB)', 'Written(MB)']
+
+rss_sample_interval = 0.2
+
+
+def get_resource_usage():
+
+    self_usage = resource.getrusage(resource.RUSAGE_SELF)
+    children_usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+    maxrss_unit = 1024
+    if sys.platform == 'darwin':
+        maxrss_unit = 1
+
+    # block counts are in 512-byte units
+    return {'wall':         time.time(),
+            'cpu_self':     self_usage.ru_utime + self_usage.ru_stime,
+            'cpu_children': children_usage.ru_utime + children_usage.ru_stime,
+            'peak_rss_cumulative': max(self_usage.ru_maxrss, children_usage.ru_maxrss) * maxrss_unit,
+            'read':         (self_usage.ru_inblock + children_usage.ru_inblock) * 512,
+            'written':      (self_usage.ru_oublock + children_usage.ru_oublock) * 512}
+
+
+def get_process_tree_rss():
+
+    # total RSS (bytes) of the current process and all its descendants, None if /proc is not available
+    if os.path.isdir('/proc/%s' % os.getpid()) is False:
+        return None
+
+    parent_to_child_dict = {}
+    for each_pid in os.listdir('/proc'):
+        if each_pid.isdigit() is True:
+            try:
+                with open('/proc/%s/stat' % each_pid) as stat_handle:
+                    # the process name (2nd field) is in brackets and may contain spaces
+                    parent_pid = int(stat_handle.read().rsplit(')', 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+            if parent_pid not in parent_to_child_dict:
+                parent_to_child_dict[parent_pid] = []
+            parent_to_child_dict[parent_pid].append(int(each_pid))
+
+    page_size = os.sysconf('SC_PAGE_SIZE')
+    total_rss = 0
+    pid_list = [os.getpid()]
+    while len(pid_list) > 0:
+        each_pid = pid_list.pop()
+        pid_list += parent_to_child_dict.get(each_pid, [])
+        try:
+            with open('/proc/%s/statm' % each_pid) as statm_handle:
+                total_rss += int(statm_handle.read().split()[1]) * page_size
+        except (OSError, IndexError, ValueError):
+            continue
+
+    return total_rss
+
+
+def sample_stage_rss(current_stage, stop_event):
+
+    # runs in a thread while the stage runs
+    while True:
+        process_tree_rss = get_process_tree_rss()
+        if process_tree_rss is None:
+            return
+        current_stage['peak_rss_stage'] = max(current_stage.get('peak_rss_stage') or 0, process_tree_rss)
+        if stop_event.wait(rss_sample_interval) is True:
+            return
+
+
+def new_run_report(module_name, args):
+
+    run_report = {'module':     module_name,
+                  'start_time': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                  'args':       {i: args[i] for i in args if isinstance(args[i], (str, int, float, bool, type(None)))},
+                  'stages':     [],
+                  'usage':      get_resource_usage()}
+
+    return run_report
+
+
+def end_stage(run_report, task_num=None):
+
+    # close the currently running stage, if any
+    if (len(run_report['stages']) == 0) or ('usage' not in run_report['stages'][-1]):
+        return
+
+    current_stage = run_report['stages'][-1]
+    usage_start = current_stage.pop('usage')
+    usage_end = get_resource_usage()
+    rss_sampler_stop_event, rss_sampler = current_stage.pop('rss_sampler')
+    rss_sampler_stop_event.set()
+    rss_sampler.join()
+
+    if task_num is not None:
+        current_stage['tasks'] = task_num
+    current_stage['wall_time'] =            round(usage_end['wall'] - usage_start['wall'], 3)
+    current_stage['cpu_time_self'] =        round(usage_end['cpu_self'] - usage_start['cpu_self'], 3)
+    current_stage['cpu_time_children'] =    round(usage_end['cpu_children'] - usage_start['cpu_children'], 3)
+    current_stage['peak_rss_cumulative'] =  usage_end['peak_rss_cumulative']
+    current_stage['bytes_read'] =           usage_end['read'] - usage_start['read']
+    current_stage['bytes_written'] =        usage_end['written'] - usage_start['written']
+
+
+def start_stage(run_report, stage_name, task_num=None):
+
+    # stages run one after another, starting a new stage ends the previous one
+    end_stage(run_report)
+    current_stage = {'stage': stage_name, 'tasks': task_num, 'peak_rss_stage': None, 'usage': get_resource_usage()}
+    rss_sampler_stop_event = threading.Event()
+    rss_sampler = threading.Thread(target=sample_stage_rss, args=(current_stage, rss_sampler_stop_event), daemon=True)
+    current_stage['rss_sampler'] = [rss_sampler_stop_event, rss_sampler]
+    rss_sampler.start()
+    run_report['stages'].append(current_stage)
+
+
+def get_run_report_table(run_report):
+
+    def to_mb(byte_num):
+        if byte_num is None:
+            return '-'
+        return '%.1f' % (byte_num / (1024 * 1024))
+
+    run_report_table_list = ['\t'.join(run_report_col_list)]
+    for each_stage in run_report['stages'] + [run_report['total']]:
+        task_num = each_stage['tasks']
+        if task_num is None:
+            task_num = '-'
+        run_report_table_list.append('\t'.join([str(i) for i in [each_stage['stage'], task_num, '%.1f' % each_stage['wall_time'],
+                                                                 '%.1f' % each_stage['cpu_time_self'], '%.1f' % each_stage['cpu_time_children'],
+                                                                 to_mb(each_stage['peak_rss_stage']), to_mb(each_stage['peak_rss_cumulative']),
+                                                                 to_mb(each_stage['bytes_read']), to_mb(each_stage['bytes_written'])]]))
+
+    return '\n'.join(run_report_table_list)
+
+
+def write_run_report(run_report, pwd_json_file, pwd_table_file):
+
+    end_stage(run_report)
+
+    # overall usage
+    usage_start = run_report.pop('usage')
+    usage_end = get_resource_usage()
+    run_report['end_time'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+    # largest peak of all stages
+    stage_peak_rss_list = [i['peak_rss_stage'] for i in run_report['stages'] if i['peak_rss_stage'] is not None]
+    peak_rss_stage = None
+    if len(stage_peak_rss_list) > 0:
+        peak_rss_stage = max(stage_peak_rss_list)
+    run_report['total'] = {'stage':             'Total',
+                           'tasks':             None,
+                           'wall_time':         round(usage_end['wall'] - usage_start['wall'], 3),
+                           'cpu_time_self':     round(usage_end['cpu_self'] - usage_start['cpu_self'], 3),
+                           'cpu_time_children': round(usage_end['cpu_children'] - usage_start['cpu_children'], 3),
+                           'peak_rss_stage':    peak_rss_stage,
+                           'peak_rss_cumulative': usage_end['peak_rss_cumulative'],
+                           'bytes_read':        usage_end['read'] - usage_start['read'],
+                           'bytes_written':     usage_end['written'] - usage_start['written']}
+
+    with open(pwd_json_file, 'w') as json_file_handle:
+        json.dump(run_report, json_file_handle, indent=2)
+
+    run_report_table = get_run_report_table(run_report)
+    with open(pwd_table_file, 'w') as table_file_handle:
+        table_file_handle.write('%s\n' % run_report_table)
+
+    return run_report_table
@@ -0,0 +1,106 @@
+# Taxonomy and grouping indexes shared by PI, BP and SankeyTaxon. Genomes and taxa are kept in the order they
+# first appear in the input file, so that group ids assigned downstream (e.g. A, B, C ...) do not change.
+
+
+rank_list_full = ['d', 'p', 'c', 'o', 'f', 'g', 's']
+rank_to_position_dict = {'d': 0, 'p': 1, 'c': 2, 'o': 3, 'f': 4, 'g': 5, 's': 6}
+
+
+def get_full_assignment(taxon_string):
+
+    # fill missing ranks with unclassified symbols (e.g. g__), return 7 elements from domain to species
+    if taxon_string is None:
+        return ['%s__' % i for i in rank_list_full]
+
+    if ';' not in taxon_string:
+        return [taxon_string] + ['%s__' % i for i in rank_list_full[1:]]
+
+    assignment = taxon_string.split(';')
+    if len(assignment) >= 7:
+        return assignment[:7]
+
+    return assignment + ['%s__' % i for i in rank_list_full[len(assignment):]]
+
+
+def read_taxonomy_file(taxonomy_file, genome_to_keep=None):
+
+    # read GTDB-Tk style (tab separated) classifications into {genome: full assignment},
+    # genomes not in genome_to_keep (a set) are skipped if it is provided
+    genome_set = None
+    if genome_to_keep is not None:
+        genome_set = set(genome_to_keep)
+
+    taxon_assignment_dict = {}
+    for each_genome in open(taxonomy_file):
+        if not each_genome.startswith('user_genome'):
+            each_split = each_genome.strip().split('\t')
+
+            if len(each_split) == 1:
+                print('Unrecognisable %s, please make sure columns are tab separated, program exited!' % taxonomy_file)
+                exit()
+
+            genome_name = each_split[0]
+            if (genome_set is None) or (genome_name in genome_set):
+                taxon_assignment_dict[genome_name] = get_full_assignment(each_split[1])
+
+    return taxon_assignment_dict
+
+
+def index_taxonomy(taxon_assignment_dict, rank_list):
+
+    # group genomes at all ranks in rank_list with a single pass: {rank: {taxon: [genome, ...]}}
+    rank_pos_list = [[rank, rank_to_position_dict[rank]] for rank in rank_list]
+    taxon_index_dict = {rank: {} for rank in rank_list}
+    for genome in taxon_assignment_dict:
+        assignment_full = taxon_assignment_dict[genome]
+        for rank, rank_pos in rank_pos_list:
+            taxon = assignment_full[rank_pos]
+            current_rank_dict = taxon_index_dict[rank]
+            if taxon not in current_rank_dict:
+                current_rank_dict[taxon] = [genome]
+            else:
+                current_rank_dict[taxon].append(genome)
+
+    return taxon_index_dict
+
+
+def read_grouping_file(grouping_file):
+
+    # read grouping file (group,genome[,taxon]) into {group: [genome, ...]}
+    group_to_genome_dict = {}
+    for each_genome in open(grouping_file):
+        each_genome_split = each_genome.strip().split(',')
+        group_id = each_genome_split[0]
+        genome_name = each_genome_split[1]
+        if group_id not in group_to_genome_dict:
+            group_to_genome_dict[group_id] = [genome_name]
+        else:
+            group_to_genome_dict[group_id].append(genome_name)
+
+    return group_to_genome_dict
+
+
+def get_genome_to_group_dict(grouping_file, col_index=0):
+
+    # {genome: value of col_index}, e.g. col_index 2 for the taxon column of PI grouping files
+    genome_to_group_dict = {}
+    for each_genome in open(grouping_file):
+        each_genome_split = each_genome.strip().split(',')
+        genome_to_group_dict[each_genome_split[1]] = each_genome_split[col_index]
+
+    return genome_to_group_dict
+
+
+def get_qualified_genome_list(taxon_index_dict):
+
+    # genomes assigned to any group at any rank, in the order of first appearance
+    qualified_genome_set = set()
+    qualified_genome_list = []
+    for each_rank in taxon_index_dict:
+        for each_group in taxon_index_dict[each_rank]:
+            for each_genome in taxon_index_dict[each_rank][each_group]:
+                if each_genome not in qualified_genome_set:
+                    qualified_genome_set.add(each_genome)
+                    qualified_genome_list.append(each_genome)
+
+    return qualified_genome_list
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+
+# Copyright (C) 2017, Weizhi Song, Torsten Thomas.
+# songwz03@gmail.com or t.thomas@unsw.edu.au
+
+# MetaCHIP is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# MetaCHIP is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Compare blastn on batches of candidate pairs (batch_blastn.py, BP -flkbatch) with running blastn with -query and
+# -subject on each candidate (BP default) on simulated contig pairs, which share a mutated segment, at the contig ends
+# for some of them. Contigs of different candidates are drawn from a few simulated genomes, so they also hit each
+# other. Hits (all columns but the E-value) need to be identical, E-values are compared as numbers. Needs BLAST+.
+# Example:
+# python3 benchmark/flanking_blastn_batch_benchmark.py -n 200 -batch 10,50,200
+
+import os
+import sys
+import time
+import random
+import shutil
+import tempfile
+import argparse
+from distutils.spawn import find_executable
+
+pwd_repo = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, pwd_repo)
+from MetaCHIP.batch_blastn import get_batch_seq_id, get_batch_blastn_cmds, run_batch_blastn_cmds, read_batch_blastn_pair_hits, remove_batch_blastn_files
+
+
+contig_blastn_parameters = '-evalue 1e-5 -outfmt "6 qseqid sseqid pident length mismatch gapopen qstart qend sstart send evalue bitscore qlen slen" -task blastn'
+
+
+def mutate_seq(seq, identity):
+
+    seq_list = list(seq)
+    for i in range(len(seq_list)):
+        if random.random() > identity:
+            seq_list[i] = random.choice('ACGT')
+    return ''.join(seq_list)
+
+
+def simulate_candidate_pairs(candidate_num, genome_num):
+
+    # [[gene_1, contig_1], [gene_2, contig_2]] for each candidate, contigs are taken from simulated genomes
+    genome_list = [''.join(random.choice('ACGT') for i in range(200000)) for j in range(genome_num)]
+    candidate_list = []
+    for candidate_index in range(candidate_num):
+        contig_list = []
+        for gene_index in range(2):
+            genome_seq = genome_list[random.randint(0, genome_num - 1)]
+            contig_len = random.randint(2000, 30000)
+            contig_start = random.randint(0, len(genome_seq) - contig_len)
+            contig_list.append(mutate_seq(genome_seq[contig_start:contig_start + contig_len], 0.97))
+
+        # shared segment, at the end of both contigs for about a third of the candidates
+        shared_seq = ''.join(random.choice('ACGT') for i in range(random.randint(500, 3000)))
+        if random.random() < 0.33:
+            contig_list[0] = contig_list[0] + shared_seq
+            contig_list[1] = mutate_seq(shared_seq, random.uniform(0.9, 1)) + contig_list[1]
+        else:
+            insert_1 = random.randint(0, len(contig_list[0]))
+            insert_2 = random.randint(0, len(contig_list[1]))
+            contig_list[0] = contig_list[0][:insert_1] + shared_seq + contig_list[0][insert_1:]
+            contig_list[1] = contig_list[1][:insert_2] + mutate_seq(shared_seq, random.uniform(0.8, 1)) + contig_list[1][insert_2:]
+        candidate_list.append([['g%s_1' % candidate_index, contig_list[0]], ['g%s_2' % candidate_index, contig_list[1]]])
+
+    return candidate_list
+
+
+def write_fasta(pwd_fasta, seq_list):
+
+    fasta_handle = open(pwd_fasta, 'w')
+    for seq_id, seq in seq_list:
+        fasta_handle.write('>%s\n%s\n' % (seq_id, seq))
+    fasta_handle.close()
+
+
+def run_per_candidate(candidate_list, benchmark_wd, pwd_blastn_exe):
+
+    pair_to_hit_dict = {}
+    for gene_1, gene_2 in candidate_list:
+        pwd_query = '%s/%s.fasta' % (benchmark_wd, gene_1[0])
+        pwd_subject = '%s/%s.fasta' % (benchmark_wd, gene_2[0])
+        pwd_output = '%s/%s___%s.txt' % (benchmark_wd, gene_1[0], gene_2[0])
+        write_fasta(pwd_query, [gene_1])
+        write_fasta(pwd_subject, [gene_2])
+        os.system('%s -query %s -subject %s -out %s %s' % (pwd_blastn_exe, pwd_query, pwd_subject, pwd_output, contig_blastn_parameters))
+        pair_to_hit_dict[(gene_1[0], gene_2[0])] = [i.rstrip('\n').split('\t') for i in open(pwd_output)]
+        for each_file in [pwd_query, pwd_subject, pwd_output]:
+            os.remove(each_file)
+
+    return pair_to_hit_dict
+
+
+def run_batch(candidate_list, batch_size, benchmark_wd, pwd_blastn_exe, pwd_makeblastdb_exe):
+
+    pair_to_hit_dict = {}
+    for batch_start in range(0, len(candidate_list), batch_size):
+        batch_candidate_list = candidate_list[batch_start:batch_start + batch_size]
+        pwd_batch_query = '%s/batch_query.fasta' % benchmark_wd
+        pwd_batch_subject = '%s/batch_subject.fasta' % benchmark_wd
+        pwd_batch_output = '%s/batch_output.txt' % benchmark_wd
+        # sequences are renamed as in BP, hits are mapped back to candidates
+        seq_id_to_pair_dict = {}
+        for candidate_index, (gene_1, gene_2) in enumerate(batch_candidate_list):
+            seq_id_to_pair_dict[(get_batch_seq_id(candidate_index + 1, 'q'), get_batch_seq_id(candidate_index + 1, 's'))] = (gene_1[0], gene_2[0])
+        write_fasta(pwd_batch_query, [[get_batch_seq_id(i + 1, 'q'), batch_candidate_list[i][0][1]] for i in range(len(batch_candidate_list))])
+        write_fasta(pwd_batch_subject, [[get_batch_seq_id(i + 1, 's'), batch_candidate_list[i][1][1]] for i in range(len(batch_candidate_list))])
+        makeblastdb_cmd, blastn_cmd = get_batch_blastn_cmds(pwd_blastn_exe, pwd_makeblastdb_exe, pwd_batch_query, pwd_batch_subject, pwd_batch_output, 1e-5)
+        run_batch_blastn_cmds(makeblastdb_cmd, blastn_cmd)
+        for seq_id_pair, hit_list in read_batch_blastn_pair_hits(pwd_batch_output, set(seq_id_to_pair_dict), 1e-5, 14).items():
+            pair_to_hit_dict[seq_id_to_pair_dict[seq_id_pair]] = [list(seq_id_to_pair_dict[seq_id_pair]) + i[2:] for i in hit_list]
+        remove_batch_blastn_files(pwd_batch_query, pwd_batch_subject, pwd_batch_output)
+
+    return pair_to_hit_dict
+
+
+def compare_hits(candidate_list, ref_pair_to_hit_dict, pair_to_hit_dict):
+
+    # number of candidates with identical hits, largest relative difference of E-values
+    identical_num = 0
+    max_evalue_diff = 0
+    for gene_1, gene_2 in candidate_list:
+        ref_hit_list = ref_pair_to_hit_dict.get((gene_1[0], gene_2[0]), [])
+        hit_list = pair_to_hit_dict.get((gene_1[0], gene_2[0]), [])
+        if [i[:10] + i[11:] for i in ref_hit_list] == [i[:10] + i[11:] for i in hit_list]:
+            identical_num += 1
+            for ref_hit, hit in zip(ref_hit_list, hit_list):
+                if float(ref_hit[10]) > 0:
+                    max_evalue_diff = max(max_evalue_diff, abs(float(hit[10]) - float(ref_hit[10])) / float(ref_hit[10]))
+
+    return identical_num, max_evalue_diff
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n',           required=False, type=int, default=200,      help='number of candidates, default: 200')
+    parser.add_argument('-batch',       required=False, default='10,50,200',        help='comma separated batch sizes, default: 10,50,200')
+    parser.add_argument('-genome',      required=False, type=int, default=5,        help='number of simulated genomes contigs are taken from, default: 5')
+    parser.add_argument('-o',           required=False, default=None,               help='working directory, default: a temporary folder, removed afterwards')
+    parser.add_argument('-seed',        required=False, type=int, default=1,        help='random seed, default: 1')
+    parser.add_argument('-blastn',      required=False, default='blastn',           help='blastn executable, default: blastn')
+    parser.add_argument('-makeblastdb', required=False, default='makeblastdb',      help='makeblastdb executable, default: makeblastdb')
+    args = vars(parser.parse_args())
+
+    for needed_program in [args['blastn'], args['makeblastdb']]:
+        if find_executable(needed_program) is None:
+            print('%s not detected, program exited!' % needed_program)
+            exit()
+
+    random.seed(args['seed'])
+    benchmark_wd = args['o']
+    if benchmark_wd is None:
+        benchmark_wd = tempfile.mkdtemp(prefix='flanking_blastn_batch_benchmark_')
+    else:
+        if os.path.isdir(benchmark_wd):
+            shutil.rmtree(benchmark_wd)
+        os.mkdir(benchmark_wd)
+
+    candidate_list = simulate_candidate_pairs(args['n'], args['genome'])
+
+    time_start = time.time()
+    ref_pair_to_hit_dict = run_per_candidate(candidate_list, benchmark_wd, args['blastn'])
+    print('Batch size\tTime(s)\tCandidates with identical hits\tMax relative E-value difference')
+    print('per candidate\t%.2f\t%s/%s\tNA' % (time.time() - time_start, len(candidate_list), len(candidate_list)))
+
+    for batch_size in [int(i) for i in args['batch'].split(',')]:
+        time_start = time.time()
+        pair_to_hit_dict = run_batch(candidate_list, batch_size, benchmark_wd, args['blastn'], args['makeblastdb'])
+        time_used = time.time() - time_start
+        identical_num, max_evalue_diff = compare_hits(candidate_list, ref_pair_to_hit_dict, pair_to_hit_dict)
+        print('%s\t%.2f\t%s/%s\t%.3g' % (batch_size, time_used, identical_num, len(candidate_list), max_evalue_diff))
+
+    if args['o'] is None:
+        shutil.rmtree(benchmark_wd)
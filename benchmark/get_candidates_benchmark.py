@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+
+# Copyright (C) 2017, Weizhi Song, Torsten Thomas.
+# songwz03@gmail.com or t.thomas@unsw.edu.au
+
+# MetaCHIP is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# MetaCHIP is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Compare best_match.get_candidates with the subject by subject loop BP used before (kept below as
+# get_candidates_loop) on a simulated subjects_in_one_line table. Example:
+# python3 benchmark/get_candidates_benchmark.py -query 1000000 -group 50
+
+import os
+import sys
+import time
+import random
+import shutil
+import tempfile
+import hashlib
+import argparse
+
+pwd_repo = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, pwd_repo)
+from MetaCHIP.best_match import get_candidates
+
+
+def get_candidates_loop(targets_group_file, gene_with_g_file_name, gene_only_name_file_name, group_pair_iden_cutoff_dict):
+
+    output_1 = open(gene_with_g_file_name, 'w')
+    output_2 = open(gene_only_name_file_name, 'w')
+
+    for group in open(targets_group_file):
+        group_split = group.strip().split('\t')
+        query = group_split[0]
+        query_split = query.split('|')
+        query_gene_name = query_split[1]
+        query_sg = query_split[0]
+        query_g = query_sg.split('_')[0]
+        subjects_list = group_split[1:]
+
+        # if only one non-self subject was found, no matter which group it comes from, ignored. proceed if more than 1 non-self subject was found:
+        if len(subjects_list) > 1:
+            # get the number of subjects from self-group and non_self_group
+            self_group_subject_list = []
+            non_self_group_subject_list = []
+            #print(non_self_group_subject_list)
+            for each_subject in subjects_list:
+
+                #print(each_subject)
+                #each_subject_g = each_subject[0]
+                each_subject_g = each_subject.split('|')[0].split('_')[0]
+                if each_subject_g == query_g:
+                    self_group_subject_list.append(each_subject)
+                else:
+                    non_self_group_subject_list.append(each_subject)
+
+            # if only the self-match was found in self-group, all matched from other groups, if any, will be ignored
+            if len(self_group_subject_list) == 0:
+                pass
+
+            # if no non-self-group subjects was found, ignored
+            elif (len(self_group_subject_list) > 0) and (len(non_self_group_subject_list) == 0):
+                pass
+
+            # if both non-self self-group subjects and non-self-group subject exist:
+            elif (len(self_group_subject_list) > 0) and (len(non_self_group_subject_list) > 0):
+                # get the number the groups
+                non_self_group_subject_list_uniq = []
+                for each_g in non_self_group_subject_list:
+                    each_g_group = each_g.split('|')[0].split('_')[0]
+                    if each_g_group not in non_self_group_subject_list_uniq:
+                        non_self_group_subject_list_uniq.append(each_g_group)
+
+                # if all non-self-group subjects come from the same group
+                if len(non_self_group_subject_list_uniq) == 1:
+
+                    # get the maximum and average identity from self-group
+                    sg_maximum = 0
+                    sg_sum = 0
+                    sg_subject_number = 0
+                    for each_sg_subject in self_group_subject_list:
+                        each_sg_subject_iden = float(each_sg_subject.split('|')[2])
+                        if each_sg_subject_iden > sg_maximum:
+                            sg_maximum = each_sg_subject_iden
+                        sg_sum += each_sg_subject_iden
+                        sg_subject_number += 1
+                    sg_average = sg_sum/float(sg_subject_number)
+
+                    # get the maximum and average identity from non-self-group
+                    nsg_maximum = 0
+                    nsg_maximum_gene = ''
+                    nsg_sum = 0
+                    nsg_subject_number = 0
+                    for each_nsg_subject in non_self_group_subject_list:
+                        each_nsg_subject_iden = float(each_nsg_subject.split('|')[2])
+                        if each_nsg_subject_iden > nsg_maximum:
+                            nsg_maximum = each_nsg_subject_iden
+                            nsg_maximum_gene = each_nsg_subject
+                        nsg_sum += each_nsg_subject_iden
+                        nsg_subject_number += 1
+                    nsg_average = nsg_sum/float(nsg_subject_number)
+
+                    # if the average non-self-group identity > average self-group identity,
+                    # Subject with maximum identity from this group will be considered as a HGT donor.
+                    if nsg_average > sg_average:
+                        # filter with obtained identity cut-off:
+                        candidate_g = nsg_maximum_gene.split('|')[0].split('_')[0]
+                        candidate_iden = float(nsg_maximum_gene.split('|')[2])
+                        qg_sg = '%s_%s' % (query_g, candidate_g)
+                        qg_sg_iden_cutoff = group_pair_iden_cutoff_dict[qg_sg]
+                        if candidate_iden >= qg_sg_iden_cutoff:
+                            output_1.write('%s\t%s\n' % (query, nsg_maximum_gene))
+                            output_2.write('%s\t%s\n' % (query_gene_name, nsg_maximum_gene.split('|')[1]))
+
+                # if non-self-group subjects come from different groups
+                elif len(non_self_group_subject_list_uniq) > 1:
+                    # get average/maximum for self-group
+                    sg_maximum = 0
+                    sg_sum = 0
+                    sg_subject_number = 0
+                    for each_sg_subject in self_group_subject_list:
+                        each_sg_subject_iden = float(each_sg_subject.split('|')[2])
+                        if each_sg_subject_iden > sg_maximum:
+                            sg_maximum = each_sg_subject_iden
+                        sg_sum += each_sg_subject_iden
+                        sg_subject_number += 1
+                    sg_average = sg_sum/float(sg_subject_number)
+
+                    # get average/maximum for each non-self-group
+                    nsg_average_dict = {}
+                    nsg_maximum_dict = {}
+                    nsg_maximum_gene_name_dict = {}
+                    for each_nsg in non_self_group_subject_list_uniq:
+                        nsg_maximum = 0
+                        nsg_maximum_gene = ''
+                        nsg_sum = 0
+                        nsg_subject_number = 0
+                        for each_nsg_subject in non_self_group_subject_list:
+                            each_nsg_subject_iden = float(each_nsg_subject.split('|')[2])
+                            each_nsg_subject_group = each_nsg_subject.split('|')[0].split('_')[0]
+                            if each_nsg_subject_group == each_nsg:
+                                if each_nsg_subject_iden > nsg_maximum:
+                                    nsg_maximum = each_nsg_subject_iden
+                                    nsg_maximum_gene = each_nsg_subject
+                                nsg_sum += each_nsg_subject_iden
+                                nsg_subject_number += 1
+                        nsg_average = nsg_sum / float(nsg_subject_number)
+                        nsg_average_dict[each_nsg] = nsg_average
+                        nsg_maximum_dict[each_nsg] = nsg_maximum
+                        nsg_maximum_gene_name_dict[each_nsg] = nsg_maximum_gene
+
+                    # get the group with maximum average group identity
+                    maximum_average = sg_average
+                    maximum_average_g = group[0]
+                    for each_g in nsg_average_dict:
+                        if nsg_average_dict[each_g] > maximum_average:
+                            maximum_average = nsg_average_dict[each_g]
+                            maximum_average_g = each_g
+
+                    # if the maximum average identity group is the self-group, ignored
+                    if maximum_average_g == group[0]:
+                        pass
+
+                    # if self-group average identity is not the maximum,
+                    # Group with maximum average identity will be considered as the candidate donor group,
+                    # Subject with maximum identity from the candidate donor group will be considered as a HGT donor.
+                    elif maximum_average_g != group[0]:
+                        # filter with obtained identity cut-off:
+                        candidate_g = nsg_maximum_gene_name_dict[maximum_average_g].split('|')[0].split('_')[0]
+                        candidate_iden = float(nsg_maximum_gene_name_dict[maximum_average_g].split('|')[2])
+                        qg_sg = '%s_%s' % (query_g, candidate_g)
+                        qg_sg_iden_cutoff = group_pair_iden_cutoff_dict[qg_sg]
+                        if candidate_iden >= qg_sg_iden_cutoff:
+                            output_1.write('%s\t%s\n' % (query, nsg_maximum_gene_name_dict[maximum_average_g]))
+                            output_2.write('%s\t%s\n' % (query_gene_name, nsg_maximum_gene_name_dict[maximum_average_g].split('|')[1]))
+    output_1.close()
+    output_2.close()
+
+
+def simulate_subjects_in_one_line(pwd_subjects_in_one_line, query_num, group_list, max_subject_num):
+
+    # group names sharing their first character, repeated identities and single subject queries are all covered
+    subjects_in_one_line_handle = open(pwd_subjects_in_one_line, 'w')
+    for query_index in range(query_num):
+        query_g = random.choice(group_list)
+        query_genome_index = random.randint(1, 20)
+        subject_list = []
+        for subject_index in range(random.randint(1, max_subject_num)):
+            subject_g = query_g if random.random() < 0.4 else random.choice(group_list)
+            subject_iden = random.choice([100.0, 99.5, round(random.uniform(70, 100), 3)])
+            subject_list.append('%s_%s|%s_%05d|%s' % (subject_g, random.randint(1, 20), 'genome%s' % random.randint(1, 500), random.randint(1, 5000), subject_iden))
+        subjects_in_one_line_handle.write('%s_%s|genome%s_%05d\t%s\n' % (query_g, query_genome_index, query_genome_index, query_index + 1, '\t'.join(subject_list)))
+    subjects_in_one_line_handle.close()
+
+
+def md5_of_file(pwd_file):
+
+    return hashlib.md5(open(pwd_file, 'rb').read()).hexdigest()
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-query', required=False, type=int, default=200000, help='number of simulated queries, default: 200000')
+    parser.add_argument('-group', required=False, type=int, default=20, help='number of groups, default: 20')
+    parser.add_argument('-subject', required=False, type=int, default=20, help='maximum number of subjects per query, default: 20')
+    parser.add_argument('-o', required=False, default=None, help='working directory, default: a temporary folder, removed afterwards')
+    parser.add_argument('-seed', required=False, type=int, default=1, help='random seed, default: 1')
+    args = vars(parser.parse_args())
+
+    random.seed(args['seed'])
+    benchmark_wd = args['o']
+    if benchmark_wd is None:
+        benchmark_wd = tempfile.mkdtemp(prefix='get_candidates_benchmark_')
+    else:
+        if os.path.isdir(benchmark_wd):
+            shutil.rmtree(benchmark_wd)
+        os.mkdir(benchmark_wd)
+
+    # group names are letters (A to Z), then two letters starting with the same letters (AA, BA, ...)
+    group_list = []
+    for group_index in range(args['group']):
+        group_name = chr(65 + group_index % 26)
+        if group_index >= 26:
+            group_name += chr(65 + (group_index // 26 - 1) % 26)
+        group_list.append(group_name)
+    group_pair_iden_cutoff_dict = {}
+    for group_1 in group_list:
+        for group_2 in group_list:
+            group_pair_iden_cutoff_dict['%s_%s' % (group_1, group_2)] = round(random.uniform(85, 100), 2)
+
+    pwd_subjects_in_one_line = '%s/subjects_in_one_line.tab' % benchmark_wd
+    simulate_subjects_in_one_line(pwd_subjects_in_one_line, args['query'], group_list, args['subject'])
+
+    # the loop goes first as the reference
+    function_list = [['get_candidates_loop', get_candidates_loop], ['best_match.get_candidates', get_candidates]]
+
+    md5_dict = {}
+    print('Function\tTime(s)\tCandidates\tIdentical to get_candidates_loop')
+    for function_name, candidate_function in function_list:
+        pwd_with_group = '%s/%s_HGTs_with_group.txt' % (benchmark_wd, function_name)
+        pwd_only_gene = '%s/%s_HGTs_only_id.txt' % (benchmark_wd, function_name)
+
+        time_start = time.time()
+        candidate_function(pwd_subjects_in_one_line, pwd_with_group, pwd_only_gene, group_pair_iden_cutoff_dict)
+        time_used = time.time() - time_start
+
+        md5_dict[function_name] = [md5_of_file(pwd_with_group), md5_of_file(pwd_only_gene)]
+        identical = md5_dict[function_name] == md5_dict['get_candidates_loop']
+        print('%s\t%.2f\t%s\t%s' % (function_name, time_used, len(open(pwd_only_gene).readlines()), identical))
+
+    if args['o'] is None:
+        shutil.rmtree(benchmark_wd)
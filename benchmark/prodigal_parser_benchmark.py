@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+
+# Copyright (C) 2017, Weizhi Song, Torsten Thomas.
+# songwz03@gmail.com or t.thomas@unsw.edu.au
+
+# MetaCHIP is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# MetaCHIP is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Compare the streaming PI.prodigal_parser with the SeqRecord based parsers kept in tmp_1.py and tmp_2.py
+# (tmp_2.py holds the parser used by PI before the streaming one). Example:
+# python3 benchmark/prodigal_parser_benchmark.py -genome 20 -contig 200
+
+import os
+import ast
+import sys
+import time
+import random
+import shutil
+import hashlib
+import argparse
+import warnings
+warnings.filterwarnings("ignore")
+
+pwd_repo = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, pwd_repo)
+from MetaCHIP.PI import prodigal_parser
+
+
+def load_function_from_script(pwd_script, function_name):
+
+    # tmp_1.py and tmp_2.py run their parser on hardcoded files when imported, only take imports and the function
+    script_ast = ast.parse(open(pwd_script).read())
+    script_ast.body = [i for i in script_ast.body if isinstance(i, (ast.Import, ast.ImportFrom)) or (isinstance(i, ast.FunctionDef) and i.name == function_name)]
+    script_namespace = {}
+    exec(compile(script_ast, pwd_script, 'exec'), script_namespace)
+
+    return script_namespace[function_name]
+
+
+def simulate_genome(pwd_fasta, pwd_sco, genome_index, contig_num, max_contig_len):
+
+    fasta_handle = open(pwd_fasta, 'w')
+    sco_handle = open(pwd_sco, 'w')
+    for contig_index in range(1, contig_num + 1):
+
+        # long contig ids, lower case and ambiguous bases are all covered
+        contig_id = 'genome%s_contig_%s' % (genome_index, contig_index)
+        if contig_index % 3 == 0:
+            contig_id = 'genome%s_long_contig_name_%s_length_%s' % (genome_index, contig_index, max_contig_len)
+
+        contig_len = random.randint(100, max_contig_len)
+        contig_seq = ''.join(random.choice('ACGT' * 50 + 'acgtNRYKMSWBDHV') for _ in range(contig_len))
+
+        fasta_handle.write('>%s description_%s\n' % (contig_id, contig_index))
+        for n in range(0, contig_len, 60):
+            fasta_handle.write('%s\n' % contig_seq[n:n + 60])
+
+        sco_handle.write('# Sequence Data: seqnum=%s;seqlen=%s;seqhdr="%s description_%s"\n' % (contig_index, contig_len, contig_id, contig_index))
+        sco_handle.write('# Model Data: version=Prodigal.v2.6.3;run_type=Metagenomic;model="37|Lacto|B|35.3|11|1";gc_cont=35.30;transl_table=11;uses_sd=1\n')
+        gene_index = 1
+        gene_end = 0
+        while True:
+            gene_start = gene_end + random.randint(1, 200)
+            gene_end = gene_start + random.randint(30, 600) * 3 - 1
+            if gene_end > contig_len:
+                break
+            sco_handle.write('>%s_%s_%s_%s\n' % (gene_index, gene_start, gene_end, random.choice(['+', '-'])))
+            gene_index += 1
+
+    fasta_handle.close()
+    sco_handle.close()
+
+
+def md5_of_outputs(output_folder, prefix):
+
+    md5_list = []
+    for file_ext in ['ffn', 'faa', 'gbk']:
+        md5_list.append(hashlib.md5(open('%s/%s.%s' % (output_folder, prefix, file_ext), 'rb').read()).hexdigest())
+
+    return md5_list
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-genome', required=False, type=int, default=10, help='number of simulated genomes, default: 10')
+    parser.add_argument('-contig', required=False, type=int, default=100, help='number of contigs per genome, default: 100')
+    parser.add_argument('-len', required=False, type=int, default=50000, help='maximum contig length, default: 50000')
+    parser.add_argument('-o', required=False, default='prodigal_parser_benchmark_wd', help='working directory')
+    parser.add_argument('-seed', required=False, type=int, default=1, help='random seed, default: 1')
+    args = vars(parser.parse_args())
+
+    random.seed(args['seed'])
+    benchmark_wd = args['o']
+    if os.path.isdir(benchmark_wd):
+        shutil.rmtree(benchmark_wd)
+    os.mkdir(benchmark_wd)
+
+    genome_list = []
+    for genome_index in range(1, args['genome'] + 1):
+        prefix = 'genome%s' % genome_index
+        simulate_genome('%s/%s.fasta' % (benchmark_wd, prefix), '%s/%s.sco' % (benchmark_wd, prefix), genome_index, args['contig'], args['len'])
+        genome_list.append(prefix)
+
+    # tmp_2 goes first as the reference
+    parser_list = [['tmp_2.prodigal_parser', load_function_from_script('%s/MetaCHIP/tmp_2.py' % pwd_repo, 'prodigal_parser')],
+                   ['PI.prodigal_parser', prodigal_parser],
+                   ['tmp_1.prodigal_parser', load_function_from_script('%s/MetaCHIP/tmp_1.py' % pwd_repo, 'prodigal_parser')]]
+
+    parser_md5_dict = {}
+    print('Parser\tTime(s)\tIdentical to tmp_2')
+    for parser_name, parser_function in parser_list:
+        parser_output_folder = '%s/%s' % (benchmark_wd, parser_name.replace('.', '_'))
+        os.mkdir(parser_output_folder)
+
+        time_start = time.time()
+        for prefix in genome_list:
+            parser_function('%s/%s.fasta' % (benchmark_wd, prefix), '%s/%s.sco' % (benchmark_wd, prefix), prefix, parser_output_folder)
+        time_used = time.time() - time_start
+
+        parser_md5_dict[parser_name] = [md5_of_outputs(parser_output_folder, prefix) for prefix in genome_list]
+        identical = parser_md5_dict[parser_name] == parser_md5_dict['tmp_2.prodigal_parser']
+        print('%s\t%.2f\t%s' % (parser_name, time_used, identical))
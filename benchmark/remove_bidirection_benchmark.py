@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+
+# Copyright (C) 2017, Weizhi Song, Torsten Thomas.
+# songwz03@gmail.com or t.thomas@unsw.edu.au
+
+# MetaCHIP is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# MetaCHIP is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Time best_match.remove_bidirection on simulated BM candidates at 10^4, 10^5 and 10^6 candidates, and compare its
+# output with the list based version BP used before (kept below as remove_bidirection_list, which is quadratic and
+# only run up to -ref_max candidates). Example:
+# python3 benchmark/remove_bidirection_benchmark.py -scale 10000,100000,1000000 -ref_max 10000
+
+import os
+import sys
+import time
+import random
+import shutil
+import tempfile
+import hashlib
+import argparse
+
+pwd_repo = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, pwd_repo)
+from MetaCHIP.best_match import remove_bidirection
+
+
+def remove_bidirection_list(input_file, candidate2identity_dict, output_file):
+    input = open(input_file)
+    output = open(output_file, 'w')
+
+    # get overall list
+    overall = []
+    for each in input:
+        overall.append(each.strip())
+
+    # get overlap list
+    tmp_list = []
+    overlap_list = []
+    for each in overall:
+        each_split = each.split('\t')
+        each_reverse = '%s\t%s' % (each_split[1], each_split[0])
+        tmp_list.append(each)
+        if each_reverse in tmp_list:
+            overlap_list.append(each)
+
+    # get non-overlap list
+    non_overlap_list = []
+    for each in overall:
+        each_split = each.split('\t')
+        each_reverse = '%s\t%s' % (each_split[1], each_split[0])
+        if (each not in overlap_list) and (each_reverse not in overlap_list):
+            non_overlap_list.append(each)
+
+    # get output
+    for each in non_overlap_list:
+        each_split = each.split('\t')
+        each_concatenated = '%s___%s' % (each_split[0], each_split[1])
+        output.write('%s\t%s\n' % (each, candidate2identity_dict[each_concatenated]))
+    for each in overlap_list:
+        each_concatenated = '%s___%s' % (each.split('\t')[0], each.split('\t')[1])
+        output.write('%s\t%s\n' % (each, candidate2identity_dict[each_concatenated]))
+    output.close()
+
+
+def simulate_candidates(pwd_candidates, candidate_num, candidate2identity_dict):
+
+    # about 20% of the candidates have their reverse pair, a few are duplicated
+    gene_num = max(candidate_num, 100)
+    candidate_list = []
+    for candidate_index in range(candidate_num):
+        if (len(candidate_list) > 0) and (random.random() < 0.2):
+            recipient_gene, donor_gene = random.choice(candidate_list).split('\t')
+            if random.random() < 0.9:
+                recipient_gene, donor_gene = donor_gene, recipient_gene
+        else:
+            recipient_gene = 'genome%s_%05d' % (random.randint(1, 100), random.randint(1, gene_num))
+            donor_gene = 'genome%s_%05d' % (random.randint(101, 200), random.randint(1, gene_num))
+        candidate_list.append('%s\t%s' % (recipient_gene, donor_gene))
+        candidate2identity_dict['%s___%s' % (recipient_gene, donor_gene)] = round(random.uniform(90, 100), 3)
+
+    candidates_handle = open(pwd_candidates, 'w')
+    candidates_handle.write(''.join(['%s\n' % i for i in candidate_list]))
+    candidates_handle.close()
+
+
+def md5_of_file(pwd_file):
+
+    return hashlib.md5(open(pwd_file, 'rb').read()).hexdigest()
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-scale', required=False, default='10000,100000,1000000', help='comma separated numbers of candidates, default: 10000,100000,1000000')
+    parser.add_argument('-ref_max', required=False, type=int, default=10000, help='largest number of candidates to run remove_bidirection_list on, default: 10000')
+    parser.add_argument('-o', required=False, default=None, help='working directory, default: a temporary folder, removed afterwards')
+    parser.add_argument('-seed', required=False, type=int, default=1, help='random seed, default: 1')
+    args = vars(parser.parse_args())
+
+    random.seed(args['seed'])
+    benchmark_wd = args['o']
+    if benchmark_wd is None:
+        benchmark_wd = tempfile.mkdtemp(prefix='remove_bidirection_benchmark_')
+    else:
+        if os.path.isdir(benchmark_wd):
+            shutil.rmtree(benchmark_wd)
+        os.mkdir(benchmark_wd)
+
+    print('Candidates\tFunction\tTime(s)\tIdentical to remove_bidirection_list')
+    for candidate_num in [int(i) for i in args['scale'].split(',')]:
+        pwd_candidates = '%s/candidates_%s.txt' % (benchmark_wd, candidate_num)
+        candidate2identity_dict = {}
+        simulate_candidates(pwd_candidates, candidate_num, candidate2identity_dict)
+
+        function_list = [['remove_bidirection_list', remove_bidirection_list], ['best_match.remove_bidirection', remove_bidirection]]
+        if candidate_num > args['ref_max']:
+            function_list = function_list[1:]
+
+        md5_dict = {}
+        for function_name, resolver_function in function_list:
+            pwd_candidates_uniq = '%s/candidates_%s_%s_uniq.txt' % (benchmark_wd, candidate_num, function_name)
+
+            time_start = time.time()
+            resolver_function(pwd_candidates, candidate2identity_dict, pwd_candidates_uniq)
+            time_used = time.time() - time_start
+
+            md5_dict[function_name] = md5_of_file(pwd_candidates_uniq)
+            identical = 'NA'
+            if 'remove_bidirection_list' in md5_dict:
+                identical = md5_dict[function_name] == md5_dict['remove_bidirection_list']
+            print('%s\t%s\t%.2f\t%s' % (candidate_num, function_name, time_used, identical))
+
+    if args['o'] is None:
+        shutil.rmtree(benchmark_wd)